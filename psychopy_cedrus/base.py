@@ -1,6 +1,19 @@
 from psychopy.hardware.base import BaseDevice, BaseResponseDevice
 from psychopy.hardware.manager import deviceManager, DeviceManager, ManagedDeviceError
-from psychopy import logging
+from psychopy import logging, core
+from psychopy_cedrus.history import MessageHistory
+from psychopy_cedrus.clocksync import ClockSync
+from psychopy_cedrus.latency import LatencyMonitor, profileRoundTrips
+from psychopy_cedrus.commands import CommandBatch
+from psychopy_cedrus.state import DeviceState
+from psychopy_cedrus.sharedring import SharedResponseRing
+from struct import unpack
+from psychopy_cedrus import enumeration
+from collections import deque
+from contextlib import contextmanager
+from math import ceil, isnan, nan
+import asyncio
+import threading
 import time
 
 # import hardware classes in a version-safe way
@@ -26,15 +39,169 @@ hasDriver = False
 try:
     import ftd2xx
     hasDriver = True
-except FileNotFoundError:
+except (ImportError, OSError):
+    # OSError covers the FTDI library itself being missing
     pass
 
+
+def _matchesResponse(resp, ports=None, keys=None):
+    """
+    Check whether a response from pyxid2 comes from one of the given ports and keys.
+
+    Parameters
+    ----------
+    resp : dict
+        Response dict from pyxid2.
+    ports : list[int or str or bytes] or None
+        Ports (or selectors, e.g. "A") to accept, or None to accept all.
+    keys : list[int] or None
+        Keys to accept, or None to accept all.
+    """
+    if keys is not None and resp['key'] not in keys:
+        return False
+    if ports is not None:
+        port = resp['port']
+        if isinstance(port, bytes):
+            port = port.decode()
+        ports = [p.decode() if isinstance(p, bytes) else p for p in ports]
+        if port not in ports:
+            return False
+
+    return True
+
+
+def _matchesMessage(message, channels=None, value=None):
+    """
+    Check whether a parsed response comes from one of the given channels and has the given value.
+
+    Parameters
+    ----------
+    message : BaseResponse
+        Parsed response, as received by a node.
+    channels : list[int] or None
+        Channels to accept, or None to accept all.
+    value : bool or None
+        Value (True for press/onset, False for release/offset) to accept, or None to accept both.
+    """
+    if channels is not None and message.channel not in channels:
+        return False
+    if value is not None and message.value != value:
+        return False
+
+    return True
+
+
+class _ResponseRing:
+    """
+    Preallocated ring buffer for passing responses from a single reader thread to a single
+    consumer without locking. Only the reader ever moves `head` and only the consumer ever moves
+    `tail`, so each index has exactly one writer.
+
+    Parameters
+    ----------
+    size : int
+        Number of responses the buffer can hold before it starts dropping them.
+    """
+    def __init__(self, size=1024):
+        self.size = size
+        # preallocate slots
+        self._slots = [None] * size
+        # index of the next slot to write (moved by the reader only)
+        self.head = 0
+        # index of the next slot to read (moved by the consumer only)
+        self.tail = 0
+        # number of responses which arrived while the buffer was full
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, item):
+        """
+        Add an item to the buffer (reader thread only).
+
+        Returns
+        -------
+        bool
+            True if the item was stored, False if the buffer was full and it was dropped.
+        """
+        if self.head - self.tail >= self.size:
+            self.dropped += 1
+            return False
+        self._slots[self.head % self.size] = item
+        # move head only once the slot is filled, so the consumer never sees an empty slot
+        self.head += 1
+
+        return True
+
+    def getAll(self):
+        """
+        Remove and return all items currently in the buffer (consumer thread only).
+
+        Returns
+        -------
+        list
+            Items in the order they were added.
+        """
+        # snapshot head so items added while we're reading are left for next time
+        head = self.head
+        items = []
+        for i in range(self.tail, head):
+            slot = i % self.size
+            items.append(self._slots[slot])
+            self._slots[slot] = None
+        # release the slots to the reader
+        self.tail = head
+
+        return items
+
+
 class BaseXidDevice(BaseDevice):
     """
     Base class for all Cedrus XID devices.
+
+    Parameters
+    ----------
+    index : int
+        Index of the device, in the order pyxid2 enumerates them.
+    serial : str or None
+        USB serial number of the device. If given, this is used to find the device instead of
+        `index`, as it stays the same when devices are replugged.
+    xid : pyxid2.XidDevice or None
+        Already open XID device (or an object with the same interface, such as
+        `psychopy_cedrus.simulator.SimulatedXidDevice`) to use instead of finding one by
+        `index`/`serial`.
+    threaded : bool
+        If True, responses are read from the device by a background thread and buffered until
+        `dispatchMessages` is called, rather than being read when `dispatchMessages` is called.
+    bufferSize : int
+        Number of responses the background reader can hold before it starts dropping them.
+    historySize : int
+        Number of responses to keep in `messages` before the oldest are discarded.
+    syncInterval : float or None
+        If given, the device timer is synchronised with the host clock on opening and then every
+        `syncInterval` seconds in the background, correcting all response times for drift. None
+        (default) to use the device timer as-is.
+    extrapolateTime : bool
+        If True, `getTime` is worked out from the clock sync model rather than by querying the
+        device, which is only queried to fit the model (on the first call to `getTime`, if it
+        isn't fitted by then). Ignored (with a warning) on XID 1 devices, which can't report their
+        timer.
+    maxSyncAge : float
+        Time (s) after which the clock sync model is considered stale by `getTime`, when
+        `extrapolateTime` is True, and refreshed in the background.
+    settingsFile : str or pathlib.Path or None
+        File of settings (signal filters, thresholds and USB outputs) saved by `saveSettings` to
+        restore on opening, or None to leave the device's settings as they are.
     """
     # used to cache results of pyxid2.getDevices as it can take a while to return
     _deviceCache = None
+    # file in which to cache enumerated devices between sessions (None to not use one), see
+    # psychopy_cedrus.enumeration.defaultCacheFile for a sensible location
+    deviceCacheFile = None
+    # profiles of enumerated devices by product ID, and device indices by USB serial number
+    _profilesByProduct = None
+    _indicesBySerial = None
 
     # all selectors for XID nodes
     selectors = (
@@ -52,184 +219,1373 @@ class BaseXidDevice(BaseDevice):
     # all Cedrus devices have a product ID - subclasses should specify what this is
     productId = None
 
-    def __init__(self, index=0):
-        # error if there's no ftdi driver
-        if hasDriver:
-            import pyxid2
-        else:
-            raise ModuleNotFoundError(
-                "Could not connect to Cedrus device as your computer is missing a necessary "
-                "hardware driver. You should be able to find the correct driver for your operating "
-                "system here: https://ftdichip.com/drivers/vcp-drivers/"
-            )
-        # give error if no device connected
-        if not len(self.getAvailableDevices()):
-            raise ConnectionError("No Cedrus device is connected.")
-        # get xid device
-        self.index = index
-        self.xid = self._deviceCache[index]
-        # nodes
-        self.nodes = []
-        # dict of responses by timestamp
-        self.messages = {}
-        # reset timer
-        self.xid.reset_timer()
-        self._deviceZeroTime = self.xid.query_timer()
+    def __init__(
+        self, index=0, serial=None, xid=None, threaded=False, bufferSize=1024,
+        historySize=100000, syncInterval=None, extrapolateTime=False, maxSyncAge=30.0,
+        settingsFile=None
+    ):
+        if xid is None:
+            # error if there's no ftdi driver (unless simulated devices are installed)
+            if not hasDriver and BaseXidDevice._deviceCache is None:
+                raise ModuleNotFoundError(
+                    "Could not connect to Cedrus device as your computer is missing a necessary "
+                    "hardware driver. You should be able to find the correct driver for your "
+                    "operating system here: https://ftdichip.com/drivers/vcp-drivers/"
+                )
+            # give error if no device connected
+            if not len(self.getAvailableDevices()):
+                raise ConnectionError("No Cedrus device is connected.")
+            # if given a serial number, use it to find the index
+            if serial is not None:
+                index = self.getIndexFromSerial(serial)
+                if index is None:
+                    raise ConnectionError(
+                        f"No {type(self).__name__} with serial number {serial} is connected."
+                    )
+            # get xid device
+            xid = self._deviceCache[index]
+        self.index = index
+        self.xid = xid
+        self.serial = enumeration.getSerial(self.xid)
+        # nodes (use addNode/removeNode to change these, so routes are kept up to date)
+        self.nodes = []
+        # map of (port, key) to the nodes which responses with that port and key are sent to
+        self._routes = {}
+        # bounded history of all responses received
+        self.messages = MessageHistory(capacity=historySize)
+        # latency instrumentation (off unless enabled by setLatencyMonitoring)
+        self.latencyMonitor = None
+        # lock around serial I/O, so the reader thread and the main thread never talk at once
+        self.lock = threading.RLock()
+        # batch of commands currently being queued (see batchCommands)
+        self._batch = None
+        # shadow of the settings applied to the device, so unchanged settings aren't rewritten
+        self.settings = DeviceState()
+        # whether to enable USB output only from selectors used by registered nodes (set by
+        # subclasses whose devices need USB output enabling, e.g. StimTracker with
+        # enableResponses="auto")
+        self.manageUsbOutputs = False
+        # buffer and thread for threaded acquisition
+        self._responseBuffer = _ResponseRing(size=bufferSize)
+        self._reader = None
+        self._readerStop = threading.Event()
+        # error which stopped the background reader, if any
+        self._readerError = None
+        # how many waits/streams are using the reader, and whether they started it (so should
+        # stop it once they're all done)
+        self._readerBorrowers = 0
+        self._readerBorrowed = False
+        self._borrowLock = threading.Lock()
+        # functions to call (from the reader thread) whenever the reader buffers new responses
+        self._readerCallbacks = []
+        # functions to call with each response (and the nodes it went to) as it's dispatched
+        self._subscribers = []
+        # functions to call with each batch of responses as it's read, before it's buffered or
+        # dispatched (from whichever thread reads the device, so they must be quick)
+        self._readTaps = []
+        # shared memory ring to write responses to as they're read (see shareResponses)
+        self.sharedRing = None
+        # model of device timer against host clock, and thread to keep it updated
+        self.clockSync = ClockSync()
+        self.extrapolateTime = extrapolateTime
+        self.maxSyncAge = maxSyncAge
+        self._syncer = None
+        self._syncerStop = threading.Event()
+        # one-off sync started by getTime when the model is stale
+        self._refresher = None
+        # XID1 devices can't report their timer, so there's no model to extrapolate from
+        if extrapolateTime and not self._isXid2:
+            logging.warning(
+                f"{type(self).__name__}@{index} can't report its timer, so `extrapolateTime` "
+                f"has been disabled."
+            )
+            self.extrapolateTime = False
+        # reset timer
+        with self.lock:
+            self.xid.reset_timer()
+            try:
+                self._deviceZeroTime = self._queryTimer()
+            except ConnectionError:
+                self._deviceZeroTime = 0
+        # restore saved settings if requested
+        if settingsFile is not None:
+            self.restoreSettings(settingsFile)
+        # synchronise clocks if requested
+        if syncInterval is not None:
+            self.startClockSync(interval=syncInterval)
+        # start reading in the background if requested
+        if threaded:
+            self.startReader()
+    
+    @classmethod
+    def openInChildProcess(cls, index=0, serial=None, syncInterval=10.0, **kwargs):
+        """
+        Open a device of this class in a child process, which polls the device and decodes its
+        responses, so that pyxid2's parsing never holds the GIL in this process. See
+        `psychopy_cedrus.broker.openInChildProcess` for details.
+
+        Parameters
+        ----------
+        index : int
+            Index of the device, in the order pyxid2 enumerates them.
+        serial : str or None
+            USB serial number of the device, used instead of `index` if given.
+        syncInterval : float or None
+            Time (s) between clock sync samples, taken by the child process.
+        **kwargs
+            Arguments for the device in this process (e.g. `threaded` or `historySize`).
+
+        Returns
+        -------
+        BaseXidDevice
+            Device of this class, receiving responses from the child process.
+        """
+        from psychopy_cedrus.broker import openInChildProcess
+
+        return openInChildProcess(
+            cls, index=index, serial=serial, syncInterval=syncInterval, **kwargs
+        )
+
+    @classmethod
+    def resolve(cls, requested):
+        """
+        Take a value given to a device which has a BaseXidDevice as its parent and, from it, 
+        find/make the associated BaseXidDevice object.
+
+        Parameters
+        ----------
+        requested : str, int or BaseXidDevice
+            Value to resolve
+        """
+        # if requested is already a handle, return as is
+        if isinstance(requested, cls):
+            return requested
+        # try to get by name
+        if isinstance(requested, str):
+            pad = DeviceManager.getDevice(requested)
+            # if found, return
+            if pad is not None:
+                return pad
+        # try to get by serial number
+        if isinstance(requested, str) and BaseXidDevice.getIndexFromSerial(requested) is not None:
+            # make sure it's the right kind of device
+            if cls.getIndexFromSerial(requested) is None:
+                raise ManagedDeviceError(
+                    f"Cedrus device with serial number {requested} is not a {cls.__name__}.",
+                    deviceName=f"{cls.__name__}@{requested}"
+                )
+            pad = DeviceManager.getDeviceBy(
+                "serial",
+                requested,
+                deviceClass=f"{cls.__module__}.{cls.__name__}"
+            )
+            # if found, return
+            if pad is not None:
+                return pad
+            # if not, set one up
+            return DeviceManager.addDevice(
+                deviceClass=f"{cls.__module__}.{cls.__name__}",
+                deviceName=f"{cls.__name__}@{requested}",
+                serial=requested
+            )
+        # try to get by index
+        if isinstance(requested, int):
+            pad = DeviceManager.getDeviceBy(
+                "index", 
+                requested, 
+                deviceClass=f"{cls.__module__}.{cls.__name__}"
+            )
+            # if found, return
+            if pad is not None:
+                return pad
+        # if given an index of a not-yet setup device, set one up
+        if requested is None or isinstance(requested, int):
+            return DeviceManager.addDevice(
+                deviceClass=f"{cls.__module__}.{cls.__name__}",
+                deviceName=f"{cls.__name__}@{requested}",
+                index=requested
+            )
+        # if still not found, raise error
+        raise ManagedDeviceError(f"Could not find/create any BaseXidDevice object from the value {requested}")
+
+    @property
+    def _isXid2(self):
+        """
+        True if the device runs XID 2 firmware (or doesn't say), so can report its timer, confirm
+        settings and have its USB outputs and signal filters configured.
+        """
+        return getattr(self.xid, "major_fw_version", 2) >= 2
+
+    def isSameDevice(self, other):
+        """
+        Determine whether this object represents the same physical button box as a given other
+        object.
+
+        Parameters
+        ----------
+        other : BaseXidDevice, dict
+            Other BaseXidDevice to compare against, or a dict of params (which much include
+            `index` or `serial` as a key)
+
+        Returns
+        -------
+        bool
+            True if the two objects represent the same physical device
+        """
+        if isinstance(other, type(self)):
+            # if given another object, get index
+            index = other.index
+        elif isinstance(other, (BaseXidButtonGroup, BaseXidLightSensorGroup, BaseXidSoundSensorGroup)):
+            # if given a child object, get its parent's index
+            index = other.parent.index
+        elif isinstance(other, dict) and other.get("serial") is not None:
+            # if given a dict with a serial number, compare serial numbers
+            return self.serial == other['serial']
+        elif isinstance(other, dict) and "index" in other:
+            # if given a dict, get index from key
+            index = other['index']
+            # a str index is a serial number
+            if isinstance(index, str):
+                return self.serial == index
+        else:
+            # if the other object is the wrong type or doesn't have an index, it's not this
+            return False
+
+        return self.index == index
+
+    @classmethod
+    def getAvailableDevices(cls, update=False):
+        # if missing FTDI driver, return blank rather than erroring (unless simulated devices are
+        # installed)
+        if not hasDriver and BaseXidDevice._deviceCache is None:
+            return []
+        # force update if asked to
+        if update:
+            BaseXidDevice._deviceCache = None
+        # update cached devices if needed
+        if BaseXidDevice._deviceCache is None:
+            BaseXidDevice._deviceCache = cls._enumerateDevices(rescan=update)
+            BaseXidDevice._indexDevices()
+        # get profiles for this class's product ID (copied so they can't be changed in the index)
+        return [
+            profile.copy() for profile in BaseXidDevice._profilesByProduct.get(cls.productId, [])
+        ]
+
+    @classmethod
+    def getIndexFromSerial(cls, serial):
+        """
+        Get the index of a connected XID device from its USB serial number, so long as it's of
+        this class's product (or any product, if called on BaseXidDevice).
+
+        Parameters
+        ----------
+        serial : str
+            USB serial number of the device.
+
+        Returns
+        -------
+        int or None
+            Index of the device, or None if no device of this class's product with that serial
+            number is connected.
+        """
+        # make sure devices are enumerated
+        cls.getAvailableDevices()
+        if BaseXidDevice._indicesBySerial is None:
+            return None
+        index = BaseXidDevice._indicesBySerial.get(serial)
+        # skip devices of other products, as when getting by index
+        if index is not None and cls.productId is not None:
+            if BaseXidDevice._deviceCache[index].product_id != cls.productId:
+                return None
+
+        return index
+
+    @staticmethod
+    def _indexDevices():
+        """
+        Make profiles of all enumerated devices in one pass, indexed by product ID, and index
+        devices by their USB serial numbers.
+        """
+        BaseXidDevice._profilesByProduct = {}
+        BaseXidDevice._indicesBySerial = {}
+        for i, device in enumerate(BaseXidDevice._deviceCache):
+            serial = enumeration.getSerial(device)
+            BaseXidDevice._profilesByProduct.setdefault(device.product_id, []).append({
+                'deviceName': device.device_name,
+                'index': i,
+                'serial': serial,
+            })
+            if serial is not None:
+                BaseXidDevice._indicesBySerial[serial] = i
+
+    @staticmethod
+    def _enumerateDevices(rescan=False):
+        """
+        Get all connected XID devices, reopening those in the device cache file (if there is one)
+        rather than scanning every port where possible.
+
+        Parameters
+        ----------
+        rescan : bool
+            If True, always do a full scan (and refresh the cache file).
+
+        Returns
+        -------
+        list[pyxid2.XidDevice]
+            Connected devices.
+        """
+        cacheFile = BaseXidDevice.deviceCacheFile
+        # try the cache file first
+        if cacheFile is not None and not rescan:
+            devices = enumeration.loadDeviceCache(cacheFile)
+            if devices is not None:
+                return devices
+        # otherwise do a full scan
+        devices = enumeration.scanDevices()
+        # store results for next time
+        if cacheFile is not None:
+            enumeration.saveDeviceCache(cacheFile, devices)
+
+        return devices
+
+    def addListener(self, listener):
+        """
+        Add a listener, which will receive all the messages dispatched by this BaseXidDevice.
+
+        Parameters
+        ----------
+        listener : hardware.listener.BaseListener
+            Object to duplicate messages to when dispatched by this BaseXidDevice.
+        """
+        # add listener to all nodes
+        for node in self.nodes:
+            node.addListener(listener)
+
+    def startReader(self, interval=0.0005):
+        """
+        Start a background thread which continuously drains responses from the device into a
+        buffer, so that `dispatchMessages` doesn't need to touch the serial port.
+
+        Parameters
+        ----------
+        interval : float
+            Time (s) to wait between polls when the device has nothing to send.
+        """
+        # do nothing if already running, other than keep it running after any waits using it
+        if self.isReading:
+            self._readerBorrowed = False
+            return
+        self._readerStop.clear()
+        self._readerError = None
+        self._reader = threading.Thread(
+            target=self._readerLoop,
+            args=(interval,),
+            name=f"{type(self).__name__}@{self.index}-reader",
+            daemon=True
+        )
+        self._reader.start()
+
+    def stopReader(self):
+        """
+        Stop the background reader thread (if running). Any responses already buffered will still
+        be dispatched on the next call to `dispatchMessages`.
+        """
+        if self._reader is None:
+            return
+        self._readerStop.set()
+        self._reader.join()
+        self._reader = None
+
+    @contextmanager
+    def _borrowReader(self):
+        """
+        Run the background reader for the duration of the block, stopping it afterwards if it
+        was started for this (and nothing else started since is still using it).
+        """
+        with self._borrowLock:
+            if not self.isReading:
+                self.startReader()
+                self._readerBorrowed = True
+            self._readerBorrowers += 1
+        try:
+            yield
+        finally:
+            with self._borrowLock:
+                self._readerBorrowers -= 1
+                if not self._readerBorrowers and self._readerBorrowed:
+                    self._readerBorrowed = False
+                    self.stopReader()
+
+    @property
+    def isReading(self):
+        """
+        True if responses are being read by a background thread.
+        """
+        return self._reader is not None and self._reader.is_alive()
+
+    def _readerLoop(self, interval):
+        """
+        Body of the background reader thread.
+        """
+        try:
+            while not self._readerStop.is_set():
+                # drain everything the device has to say
+                received = False
+                while True:
+                    responses = self._readResponses()
+                    if not responses:
+                        break
+                    received = True
+                    for resp in responses:
+                        if not self._responseBuffer.put(resp):
+                            logging.warning(
+                                f"Response buffer for {type(self).__name__}@{self.index} is "
+                                f"full, dropped response: {resp}"
+                            )
+                    # let anything waiting on responses know they're here
+                    self._notifyReaderCallbacks()
+                # if there was nothing to read, sleep briefly rather than spinning
+                if not received:
+                    self._readerStop.wait(interval)
+        except Exception as err:
+            # keep the error for dispatchMessages to raise, as this thread is about to stop
+            self._readerError = err
+            logging.error(
+                f"Background reader for {type(self).__name__}@{self.index} stopped: {err}"
+            )
+            # wake anything waiting on the reader, so that it finds out
+            self._notifyReaderCallbacks()
+
+    def _notifyReaderCallbacks(self):
+        """
+        Call each of `_readerCallbacks`, logging (rather than raising) any errors so that one
+        failing callback doesn't stop the reader.
+        """
+        for callback in tuple(self._readerCallbacks):
+            try:
+                callback()
+            except Exception as err:
+                logging.error(
+                    f"Error in response callback {callback!r} of "
+                    f"{type(self).__name__}@{self.index}: {err}"
+                )
+
+    def _readResponses(self):
+        """
+        Poll the device once and return any responses it has finished sending, each stamped with
+        the host time at which it was received (as `hostTime`), unless it already has one (e.g.
+        from a broker, which stamps responses when it reads them).
+
+        Returns
+        -------
+        list[dict]
+            Responses from pyxid2, in the order they were received.
+        """
+        responses = []
+        with self.lock:
+            # poll device for messages
+            self.xid.poll_for_response()
+            # get all messages
+            while self.xid.has_response():
+                resp = self.xid.get_next_response()
+                if isnan(resp.get('hostTime', nan)):
+                    resp['hostTime'] = core.getTime()
+                responses.append(resp)
+        # share with other processes
+        if responses and self.sharedRing is not None:
+            self._shareResponses(responses)
+        if responses:
+            for tap in tuple(self._readTaps):
+                try:
+                    tap(responses)
+                except Exception as err:
+                    logging.error(
+                        f"Error passing responses from {type(self).__name__}@{self.index} to "
+                        f"{tap}: {err}"
+                    )
+
+        return responses
+
+    def shareResponses(self, name=None, capacity=65536):
+        """
+        Write every response to a ring of fixed-size records in shared memory as it's read, so
+        that other processes can read them (with `psychopy_cedrus.sharedring.SharedResponseReader`)
+        without any further work from this one.
+
+        Records are written by whichever thread reads the device, so with `startReader` this adds
+        nothing to the thread calling `dispatchMessages`.
+
+        Parameters
+        ----------
+        name : str or None
+            Name of the shared memory, for readers to attach to, or None to make one up.
+        capacity : int
+            Number of records the ring holds.
+
+        Returns
+        -------
+        psychopy_cedrus.sharedring.SharedResponseRing
+            The ring, whose `name` readers attach by.
+        """
+        self.stopSharingResponses()
+        self.sharedRing = SharedResponseRing(name=name, capacity=capacity)
+
+        return self.sharedRing
+
+    def stopSharingResponses(self):
+        """
+        Stop writing responses to shared memory, and free it.
+        """
+        ring, self.sharedRing = self.sharedRing, None
+        if ring is not None:
+            ring.close()
+
+    def _shareResponses(self, responses):
+        """
+        Write responses (as from `_readResponses`) to the shared memory ring.
+        """
+        ring = self.sharedRing
+        # shared times are on the perf_counter timeline, which has the same zero in every process
+        offset = time.perf_counter() - core.getTime()
+        clockSync = self.clockSync if self.clockSync.isFitted else None
+        for resp in responses:
+            synced = nan if clockSync is None else clockSync.toHost(resp['time']) + offset
+            ring.write(
+                resp['time'], resp['port'], resp['key'], resp['pressed'],
+                resp['hostTime'] + offset, synced
+            )
+
+    def dispatchMessages(self):
+        # if the background reader has died, go back to polling, raising whatever stopped it
+        reader = self._reader
+        if reader is not None and not reader.is_alive():
+            self._reader = None
+            error, self._readerError = self._readerError, None
+            if error is not None:
+                raise ConnectionError(
+                    f"Background reader for {type(self).__name__}@{self.index} stopped, "
+                    f"falling back to polling"
+                ) from error
+        # take whatever the background reader has buffered
+        responses = self._responseBuffer.getAll()
+        # if not reading in the background, poll the device now
+        if self._reader is None:
+            responses += self._readResponses()
+        # dispatch each response
+        for resp in responses:
+            self._dispatchResponse(resp)
+
+    def _dispatchResponse(self, resp):
+        """
+        Store a single response from pyxid2 and send it to any nodes which it applies to.
+
+        Parameters
+        ----------
+        resp : dict
+            Response dict from pyxid2.
+        """
+        # store message
+        self.messages.append(
+            resp['time'], resp['port'], resp['key'], resp['pressed'], resp.get('hostTime', nan)
+        )
+        # get time in s, on the host timeline if synchronised
+        if self.clockSync.isFitted:
+            resp['time'] = self.clockSync.toHost(resp['time'])
+        else:
+            resp['time'] = float(resp['time']) / 1000
+        # get nodes to dispatch to (building the route if this is a new port/key combination)
+        route = (resp['port'], resp['key'])
+        nodes = self._routes.get(route)
+        if nodes is None:
+            nodes = self._routes[route] = self._findRoute(*route)
+        # record how long the response took to reach the host
+        monitor = self.latencyMonitor
+        if monitor is not None and self.clockSync.isFitted and 'hostTime' in resp:
+            monitor.deviceToHost.add(resp['hostTime'] - resp['time'])
+        # only keep track of where the response went if anything has subscribed to find out
+        delivered = [] if self._subscribers else None
+        # dispatch to nodes
+        for node in nodes:
+            message = node.parseMessage(resp)
+            # record how long the response took to reach this node
+            if monitor is not None and 'hostTime' in resp:
+                monitor.dispatchDelay.add(core.getTime() - resp['hostTime'])
+            node.receiveMessage(message)
+            if delivered is not None:
+                delivered.append((node, message))
+        # tell subscribers
+        if delivered is not None:
+            for subscriber in self._subscribers:
+                subscriber(resp, delivered)
+
+    def streamResponses(self, ports=None, keys=None):
+        """
+        Asynchronously iterate through responses from this device as they arrive, e.g.::
+
+            async for resp in device.streamResponses(ports=["K"]):
+                print(resp['key'], resp['pressed'], resp['time'])
+
+        This runs the background reader while streaming (stopping it again once the stream is
+        closed, if it wasn't already running), which wakes the event loop whenever responses
+        arrive, so there's no need to call `dispatchMessages` on a timer. Responses are still
+        dispatched to nodes as usual.
+
+        Parameters
+        ----------
+        ports : list[int or str or bytes] or None
+            Only yield responses from these ports (or selectors, e.g. "A"), or None for all ports.
+        keys : list[int] or None
+            Only yield responses from these keys, or None for all keys.
+
+        Returns
+        -------
+        AsyncIterator[dict]
+            Response dicts from pyxid2 (with `time` in s).
+        """
+        def _select(resp, delivered):
+            if _matchesResponse(resp, ports=ports, keys=keys):
+                return [resp]
+            return []
+
+        return self._streamResponses(_select)
+
+    async def _streamResponses(self, select):
+        """
+        Asynchronously iterate through items picked from each dispatched response by `select`.
+
+        Parameters
+        ----------
+        select : callable
+            Function which takes a response dict and a list of (node, message) pairs it was
+            delivered to, and returns a list of items to yield.
+        """
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        pending = deque()
+
+        def _onBuffered():
+            # called from the reader thread, so hand over to the event loop (unless it's gone)
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(wake.set)
+
+        def _onDispatched(resp, delivered):
+            pending.extend(select(resp, delivered))
+
+        self._readerCallbacks.append(_onBuffered)
+        self._subscribers.append(_onDispatched)
+        try:
+            with self._borrowReader():
+                while True:
+                    # clear before dispatching, so a wakeup during dispatch isn't missed
+                    wake.clear()
+                    # dispatch anything the reader has buffered
+                    self.dispatchMessages()
+                    while pending:
+                        yield pending.popleft()
+                    # wait for the reader to buffer more
+                    await wake.wait()
+        finally:
+            self._readerCallbacks.remove(_onBuffered)
+            self._subscribers.remove(_onDispatched)
+
+    def waitForResponse(self, timeout=None, ports=None, keys=None):
+        """
+        Block until a response arrives from one of the given ports and keys.
+
+        This runs the background reader while waiting (stopping it again afterwards, if it wasn't
+        already running) and sleeps until it buffers new responses, rather than polling the
+        device, so waiting takes no CPU time. Responses are still dispatched to nodes as usual.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Maximum time (s) to wait, or None to wait indefinitely.
+        ports : list[int or str or bytes] or None
+            Only return a response from these ports (or selectors, e.g. "A"), or None for all
+            ports.
+        keys : list[int] or None
+            Only return a response from these keys, or None for all keys.
+
+        Returns
+        -------
+        dict or None
+            The first matching response dict from pyxid2 (with `time` in s), or None if the
+            timeout was reached first.
+        """
+        def _select(resp, delivered):
+            if _matchesResponse(resp, ports=ports, keys=keys):
+                return [resp]
+            return []
+
+        return self._waitForDelivery(_select, timeout=timeout)
+
+    def _waitForDelivery(self, select, timeout=None):
+        """
+        Block until `select` picks an item from a dispatched response, or until `timeout` (s).
+
+        Parameters
+        ----------
+        select : callable
+            Function which takes a response dict and a list of (node, message) pairs it was
+            delivered to, and returns a list of items.
+        timeout : float or None
+            Maximum time (s) to wait, or None to wait indefinitely.
+
+        Returns
+        -------
+        object or None
+            The first item picked, or None if the timeout was reached first.
+        """
+        wake = threading.Event()
+        found = []
+
+        def _onDispatched(resp, delivered):
+            found.extend(select(resp, delivered))
+
+        self._readerCallbacks.append(wake.set)
+        self._subscribers.append(_onDispatched)
+        deadline = None if timeout is None else core.getTime() + timeout
+        try:
+            with self._borrowReader():
+                while True:
+                    # clear before dispatching, so a wakeup during dispatch isn't missed
+                    wake.clear()
+                    self.dispatchMessages()
+                    if found:
+                        return found[0]
+                    # sleep until the reader buffers more (or time runs out)
+                    if deadline is None:
+                        wake.wait()
+                    else:
+                        remaining = deadline - core.getTime()
+                        if remaining <= 0:
+                            return None
+                        wake.wait(remaining)
+        finally:
+            self._readerCallbacks.remove(wake.set)
+            self._subscribers.remove(_onDispatched)
+
+    def addNode(self, node):
+        """
+        Register a node (button, light sensor or sound sensor group) to receive responses from
+        this device.
+
+        Parameters
+        ----------
+        node : BaseXidButtonGroup, BaseXidLightSensorGroup or BaseXidSoundSensorGroup
+            Node to register.
+        """
+        # compare by identity, as == compares physical devices (so would match sibling nodes)
+        if not any(extant is node for extant in self.nodes):
+            self.nodes.append(node)
+        self.refreshRoutes()
+        self.refreshUsbOutputs()
+
+    def removeNode(self, node):
+        """
+        Stop a node from receiving responses from this device.
+
+        Parameters
+        ----------
+        node : BaseXidButtonGroup, BaseXidLightSensorGroup or BaseXidSoundSensorGroup
+            Node to remove.
+        """
+        self.nodes = [extant for extant in self.nodes if extant is not node]
+        self.refreshRoutes()
+        self.refreshUsbOutputs()
+
+    def refreshRoutes(self):
+        """
+        Clear the routing table, so that routes are worked out again from the current nodes. This
+        is done automatically by `addNode` and `removeNode`, but should be called manually if the
+        `keys` or `selectors` of a registered node are changed.
+        """
+        self._routes = {}
+
+    def refreshUsbOutputs(self):
+        """
+        If managing USB outputs (`manageUsbOutputs`), enable USB output from the selectors used
+        by registered nodes and disable it from all others, so that unused inputs don't send
+        anything. Only selectors whose state changes are written to the device.
+        """
+        if not self.manageUsbOutputs:
+            return
+        # get selectors used by nodes which want responses
+        needed = set()
+        for node in self.nodes:
+            if node.enableResponses:
+                needed.update(node.usbSelectors)
+        # enable/disable each selector as needed
+        with self.batchCommands() as batch:
+            for selector in self.selectors:
+                batch.setEnableUsbOutput(selector, selector in needed)
+
+    def _findRoute(self, port, key):
+        """
+        Work out which nodes a response with the given port and key should be sent to.
+
+        Parameters
+        ----------
+        port : int or bytes
+            Port the response came from (bytes selector on devices which report one).
+        key : int
+            Key the response came from.
+
+        Returns
+        -------
+        list
+            Nodes to dispatch to.
+        """
+        # decode selector if given one
+        selector = None
+        if isinstance(port, bytes) and port.decode() in self.selectors:
+            selector = port.decode()
+
+        nodes = []
+        for node in self.nodes:
+            # if device is 0, dispatch only to buttons
+            if port == 0 and not isinstance(node, BaseXidButtonGroup):
+                continue
+            # if device is 2, it could be a lightsensor or a voice key
+            if port == 2:
+                if not isinstance(node, (BaseXidLightSensorGroup, BaseXidSoundSensorGroup)):
+                    continue
+                # these we need to distinguish from keys
+                if key not in node.keys:
+                    continue
+            # if device refers to a node by selector, send to that node
+            if selector is not None and selector not in node.selectors:
+                continue
+            nodes.append(node)
+
+        return nodes
+
+    def setLatencyMonitoring(self, enabled=True, window=10000):
+        """
+        Start or stop recording the latency of each response (see `getLatencyStats`).
+
+        Device-to-host latency can only be measured once the device timer is synchronised with
+        the host clock (see `syncClock`).
+
+        Parameters
+        ----------
+        enabled : bool
+            True to start recording (discarding any previous record), False to stop.
+        window : int
+            Number of recent responses to keep latencies for.
+        """
+        if enabled:
+            self.latencyMonitor = LatencyMonitor(window=window)
+        else:
+            self.latencyMonitor = None
+
+    def getLatencyStats(self, bins=20):
+        """
+        Get rolling statistics and histograms of response latency, covering the time from a
+        response happening to it being read by the host (`deviceToHost`) and from it being read to
+        it being received by a node (`dispatchDelay`).
+
+        Parameters
+        ----------
+        bins : int or list[float]
+            Number of histogram bins, or the bin edges (s).
+
+        Returns
+        -------
+        dict or None
+            Stats for `deviceToHost` and `dispatchDelay`, see
+            `psychopy_cedrus.latency.RollingSamples.getStats`. None if latency isn't being
+            recorded.
+        """
+        if self.latencyMonitor is None:
+            return None
+
+        return self.latencyMonitor.getStats(bins=bins)
+
+    def profileRoundTrip(self, n=100, timeout=1.0, file=None):
+        """
+        Time `n` round trips to the device (each a query of the device timer) and summarise
+        them, e.g. to qualify a machine or USB hub before using it for an experiment.
+
+        Parameters
+        ----------
+        n : int
+            Number of round trips to do.
+        timeout : float
+            Maximum time (s) each round trip may take before it's counted as timed out.
+        file : str or pathlib.Path or None
+            File to write the time (s) of each completed round trip to, or None to not save them.
+
+        Returns
+        -------
+        dict or None
+            Round trip stats, see `psychopy_cedrus.latency.profileRoundTrips`, or None if the
+            device can't report its timer (XID 1).
+        """
+        # XID1 devices can't report their timer, so there'd be no round trip to time
+        if not self._isXid2:
+            logging.warning(
+                f"{type(self).__name__}@{self.index} can't report its timer, so its round trip "
+                f"time can't be profiled."
+            )
+            return None
+
+        def _roundTrip(timeout):
+            try:
+                self._queryTimer(timeout=timeout)
+            except Exception as err:
+                logging.debug(f"Round trip to {type(self).__name__}@{self.index} failed: {err}")
+                return False
+            return True
+
+        return profileRoundTrips(_roundTrip, n=n, timeout=timeout, file=file)
+
+    def getMessages(self, start=None, stop=None, port=None, key=None):
+        """
+        Get responses received by this device, as columns of a NumPy structured array.
+
+        Parameters
+        ----------
+        start : float or None
+            Earliest device time (s) to include, or None to start from the oldest stored response.
+        stop : float or None
+            Device time (s) to stop before, or None to go up to the newest response.
+        port : int, bytes, str or None
+            Only include responses from this port (or selector, e.g. "A"), or None for all ports.
+        key : int or None
+            Only include responses from this key, or None for all keys.
+
+        Returns
+        -------
+        numpy.ndarray
+            Structured array with fields `time` (device time, ms), `port`, `key`, `pressed` and
+            `hostTime` - see `psychopy_cedrus.history.MessageHistory`. If neither `port` nor `key`
+            is given, this is a view onto the history rather than a copy.
+        """
+        # convert window from s to device ms
+        if start is not None:
+            start = ceil(start * 1000)
+        if stop is not None:
+            stop = ceil(stop * 1000)
+
+        return self.messages.query(start=start, stop=stop, port=port, key=key)
+
+    def syncClock(self, samples=10):
+        """
+        Take a sync sample of the device timer against the host clock and refit the model of offset
+        and drift used to correct response times.
+
+        Once the clocks are synchronised, response times and `getTime` are given on the host
+        timeline (psychopy.core.getTime) rather than from the device's own zero, so any nodes
+        should call `resetTimer` after the first sync.
+
+        Parameters
+        ----------
+        samples : int
+            Number of timer queries to make, only the one with the shortest round trip is used.
+
+        Returns
+        -------
+        float
+            Round trip time (s) of the sample used.
+        """
+        # XID1 devices can't report their timer
+        if not self._isXid2:
+            logging.warning(
+                f"{type(self).__name__}@{self.index} can't report its timer, so can't be "
+                f"synchronised with the host clock."
+            )
+            return None
+
+        # queries whose reply isn't a timer reading are skipped
+        sample = self.clockSync.measure(self._queryTimer, n=samples)
+        if sample is None:
+            logging.warning(
+                f"{type(self).__name__}@{self.index} didn't reply to any timer queries, so clock "
+                f"sync was skipped."
+            )
+            return None
+        self._addSyncSample(*sample)
+
+        return sample[2]
+
+    def _addSyncSample(self, deviceTime, hostTime, roundTrip=0):
+        """
+        Add a clock sync sample. The first one moves response times (and `getTime`) from the
+        device timer, zeroed when the device was opened, onto the host timeline, so any timers
+        nodes have already reset are shifted by the same amount to stay where they were.
+
+        Parameters
+        ----------
+        deviceTime : int
+            Device timer value (ms).
+        hostTime : float
+            Host time (s) at which the device timer had that value.
+        roundTrip : float
+            Round trip time (s) of the query.
+        """
+        wasFitted = self.clockSync.isFitted
+        self.clockSync.addSample(deviceTime, hostTime, roundTrip)
+        if wasFitted or not self.clockSync.isFitted:
+            return
+        shift = (deviceTime - self._deviceZeroTime) / 1000 - self.clockSync.toHost(deviceTime)
+        for node in self.nodes:
+            node._timeAdjust += shift
+
+    def _queryTimer(self, timeout=0.1):
+        """
+        Get the device timer (ms), checking the reply rather than taking whatever 7 bytes come
+        back (which could be a response packet sent just before it).
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (s) to wait for the reply.
+
+        Raises
+        ------
+        ConnectionError
+            If the device didn't reply with its timer.
+        """
+        # XID1 devices can't report their timer
+        if not self._isXid2:
+            return 0
+        reply, = CommandBatch(self, timeout=timeout)._exchange([(b"_e5", 7, b"_e5")])
+
+        return unpack("<cccI", reply)[3]
+
+    def startClockSync(self, interval=10.0, samples=10):
+        """
+        Synchronise the device timer with the host clock now and then every `interval` seconds
+        in a background thread.
+
+        Parameters
+        ----------
+        interval : float
+            Time (s) between sync samples.
+        samples : int
+            Number of timer queries per sync sample.
+        """
+        self.stopClockSync()
+        # take a first sample now, so times are corrected from the start
+        self.syncClock(samples=samples)
+        # refresh in the background
+        self._syncerStop.clear()
+        self._syncer = threading.Thread(
+            target=self._syncerLoop,
+            args=(interval, samples),
+            name=f"{type(self).__name__}@{self.index}-clocksync",
+            daemon=True
+        )
+        self._syncer.start()
+
+    def stopClockSync(self):
+        """
+        Stop synchronising the device timer in the background (the current model is kept).
+        """
+        # let any one-off refresh finish
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
+        if self._syncer is None:
+            return
+        self._syncerStop.set()
+        self._syncer.join()
+        self._syncer = None
+
+    def _syncerLoop(self, interval, samples):
+        """
+        Body of the background clock sync thread.
+        """
+        while not self._syncerStop.wait(interval):
+            self.syncClock(samples=samples)
+
+    def _refreshClockSync(self):
+        """
+        Start a one-off clock sync in the background, unless one is already running or clock
+        sync is already being refreshed by `startClockSync`.
+        """
+        if self._syncer is not None:
+            return
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(
+            target=self.syncClock,
+            name=f"{type(self).__name__}@{self.index}-clockrefresh",
+            daemon=True
+        )
+        self._refresher.start()
+
+    def getTime(self):
+        # if extrapolating, use the clock sync model
+        if self.extrapolateTime:
+            if not self.clockSync.isFitted:
+                # sync now if there's no model yet, as times given before it's fitted would be on
+                # a different timeline (the device timer's) to those given after
+                self.syncClock()
+            elif self.clockSync.isStale(self.maxSyncAge):
+                # refresh a stale model in the background rather than holding up the caller
+                self._refreshClockSync()
+            if self.clockSync.isFitted:
+                # device times are mapped onto the host timeline, where the device's current time
+                # is the host's current time
+                return core.getTime()
+        # get from xid
+        deviceTime = self._queryTimer()
+        # if synchronised, give on host timeline
+        if self.clockSync.isFitted:
+            return self.clockSync.toHost(deviceTime)
+
+        return (deviceTime - self._deviceZeroTime) / 1000
     
-    @classmethod
-    def resolve(cls, requested):
+    @contextmanager
+    def batchCommands(self):
         """
-        Take a value given to a device which has a BaseXidDevice as its parent and, from it, 
-        find/make the associated BaseXidDevice object.
+        Queue all commands sent by `sendCommand` (including those sent by this device's nodes,
+        e.g. when setting thresholds) within this context, then send them in a single write and
+        read all of their replies together when it ends, e.g.::
 
-        Parameters
-        ----------
-        requested : str, int or BaseXidDevice
-            Value to resolve
+            with device.batchCommands() as batch:
+                lightsensors.setThreshold(0.5, channel=[0, 1, 2, 3])
+                batch.setEnableUsbOutput("A", True)
+
+        If already batching, commands are added to the existing batch. The device is locked
+        while batching, so nothing else can talk to it in between.
+
+        Yields
+        ------
+        psychopy_cedrus.commands.CommandBatch
+            Batch which commands are being added to.
         """
-        # if requested is already a handle, return as is
-        if isinstance(requested, cls):
-            return requested
-        # try to get by name
-        if isinstance(requested, str):
-            pad = DeviceManager.getDevice(requested)
-            # if found, return
-            if pad is not None:
-                return pad
-        # try to get by index
-        if isinstance(requested, int):
-            pad = DeviceManager.getDeviceBy(
-                "index", 
-                requested, 
-                deviceClass=f"{cls.__module__}.{cls.__name__}"
-            )
-            # if found, return
-            if pad is not None:
-                return pad
-        # if given an index of a not-yet setup device, set one up
-        if requested is None or isinstance(requested, int):
-            return DeviceManager.addDevice(
-                deviceClass=f"{cls.__module__}.{cls.__name__}",
-                deviceName=f"{cls.__name__}@{requested}",
-                index=requested
-            )
-        # if still not found, raise error
-        raise ManagedDeviceError(f"Could not find/create any BaseXidDevice object from the value {requested}")
+        with self.lock:
+            # if already batching, join in with the existing batch
+            if self._batch is not None:
+                yield self._batch
+                return
+            self._batch = batch = CommandBatch(self)
+            try:
+                yield batch
+            finally:
+                self._batch = None
+            batch.send()
 
-    def isSameDevice(self, other):
+    def sendCommand(self, command, replyLength=0, expect=None, settle=0):
         """
-        Determine whether this object represents the same physical button box as a given other
-        object.
+        Send a raw XID command to the device, or queue it if within `batchCommands`.
 
         Parameters
         ----------
-        other : BaseXidDevice, dict
-            Other BaseXidDevice to compare against, or a dict of params (which much include
-            `index` as a key)
+        command : str or bytes
+            Command to send.
+        replyLength : int
+            Number of bytes the device sends in reply to this command.
+        expect : bytes or None
+            What the reply should start with, or None to accept any reply.
+        settle : float
+            Time (s) to wait after sending the command for the device to be ready.
 
         Returns
         -------
-        bool
-            True if the two objects represent the same physical device
+        bytes or None
+            Reply from the device, or None if the command was queued.
         """
-        if isinstance(other, type(self)):
-            # if given another object, get index
-            index = other.index
-        elif isinstance(other, (BaseXidButtonGroup, BaseXidLightSensorGroup, BaseXidLightSensorGroup)):
-            # if given a child object, get its parent's index
-            index = other.parent.index
-        elif isinstance(other, dict) and "index" in other:
-            # if given a dict, get index from key
-            index = other['index']
-        else:
-            # if the other object is the wrong type or doesn't have an index, it's not this
-            return False
+        with self.lock:
+            if self._batch is not None:
+                self._batch.add(command, replyLength=replyLength, expect=expect, settle=settle)
+                return None
+            batch = CommandBatch(self)
+            batch.add(command, replyLength=replyLength, expect=expect, settle=settle)
 
-        return self.index == index
+            return batch.send()[0]
 
-    @classmethod
-    def getAvailableDevices(cls, update=False):
-        if hasDriver:
-            import pyxid2
-        else:
-            # if missing FTDI driver, return blank rather than erroring
-            return []
-        # force update if asked to
-        if update:
-            BaseXidDevice._deviceCache = None
-        # update cached devices if needed
-        if BaseXidDevice._deviceCache is None:
-            BaseXidDevice._deviceCache = pyxid2.get_xid_devices()
-        # list devices
-        devices = []
-        # iterate through profiles of all serial port devices
-        for i, profile in enumerate(BaseXidDevice._deviceCache):
-            # only include devices which match this class's product ID
-            if profile.product_id == cls.productId:
-                devices.append({
-                    'deviceName': profile.device_name,
-                    'index': i,
-                })
+    def saveSettings(self, file):
+        """
+        Save the settings (signal filters, thresholds and USB outputs) applied to this device,
+        so that they can be restored by `restoreSettings`.
 
-        return devices
+        Parameters
+        ----------
+        file : str or pathlib.Path
+            JSON file to save to.
+        """
+        self.settings.save(file)
 
-    def addListener(self, listener):
+    def restoreSettings(self, file):
         """
-        Add a listener, which will receive all the messages dispatched by this BaseXidDevice.
+        Restore settings saved by `saveSettings`. Where the device can report its current
+        settings (XID 2), they're read first so that only those which differ are sent.
 
         Parameters
         ----------
-        listener : hardware.listener.BaseListener
-            Object to duplicate messages to when dispatched by this BaseXidDevice.
+        file : str or pathlib.Path
+            JSON file to restore from.
         """
-        # add listener to all nodes
-        for node in self.nodes:
-            node.addListener(listener)
+        target = DeviceState.load(file)
+        # find out what the device is currently set to
+        if self._isXid2:
+            self._querySettings(target)
+        # send whatever's different
+        with self.batchCommands() as batch:
+            for selector, (holdOn, holdOff) in target.signalFilters.items():
+                batch.setSignalFilter(selector, holdOn, holdOff)
+            for selector, level in target.thresholds.items():
+                batch.setThreshold(selector, level)
+            for selector, enable in target.usbOutputs.items():
+                batch.setEnableUsbOutput(selector, enable)
+
+    def _querySettings(self, state):
+        """
+        Read the device's current value of every setting in `state` into `settings`, in a
+        single batch of queries.
+
+        Parameters
+        ----------
+        state : psychopy_cedrus.state.DeviceState
+            Settings to query.
+        """
+        # queries and reply lengths for each kind of setting
+        queries = {
+            'signalFilters': ("_if", 12),
+            'thresholds': ("_it", 5),
+            'usbOutputs': ("_iu", 5),
+        }
+        batch = CommandBatch(self)
+        asked = []
+        for kind, (query, replyLength) in queries.items():
+            for selector in getattr(state, kind):
+                batch.add(
+                    query + selector, replyLength=replyLength,
+                    expect=(query + selector).encode("latin1")
+                )
+                asked.append((kind, selector))
+        try:
+            replies = batch.send()
+        except ConnectionError as err:
+            # if the device can't say, everything will just be sent
+            logging.debug(
+                f"Could not read settings from {type(self).__name__}@{self.index}: {err}"
+            )
+            return
+        # store replies
+        for (kind, selector), reply in zip(asked, replies):
+            if kind == "signalFilters":
+                value = unpack("<II", reply[4:12])
+            elif kind == "thresholds":
+                value = reply[4]
+            else:
+                value = reply[4:5] == b"1"
+            self.settings.update(kind, selector, value)
 
-    def dispatchMessages(self):
-        # poll device for messages
-        self.xid.poll_for_response()
-        # get all messages
-        while self.xid.has_response():
-            # get response
-            resp = self.xid.get_next_response()
-            # get time in s using defaultClock units
-            resp['time'] = float(resp['time']) / 1000
-            # store message
-            self.messages[resp['time']] = resp
-            # choose object to dispatch to
-            for node in self.nodes:
-                # if device is 0, dispatch only to buttons
-                if resp['port'] == 0 and not isinstance(node, BaseXidButtonGroup):
-                    continue
-                # if device is 2, it could be a lightsensor or a voice key
-                if resp['port'] == 2:
-                    if not isinstance(node, (BaseXidLightSensorGroup, BaseXidSoundSensorGroup)):
-                        continue
-                    # these we need to distinguish from keys
-                    if resp['key'] not in node.keys:
-                        continue
-                # if device refers to a node by selector, send to that node
-                if isinstance(resp['port'], bytes):
-                    if resp['port'].decode() in self.selectors:
-                        if resp['port'].decode() not in node.selectors:
-                            continue
-                # dispatch to node
-                message = node.parseMessage(resp)
-                node.receiveMessage(message)
-    
-    def getTime(self):
-        # get from xid
-        return (self.xid.query_timer() - self._deviceZeroTime) / 1000
-    
     def hasUnfinishedMessage(self):
         """
         Returns True if a message is still sending from the response box.
         """
+        if len(self._responseBuffer):
+            return True
         return self.xid.has_response()
 
 
-class BaseXidLightSensorGroup(BaseLightSensorGroup):
+def openDevices(devices, maxWorkers=None):
+    """
+    Open several Cedrus devices at once, initialising each on its own thread so that setup takes
+    about as long as the slowest device rather than the sum of all of them. Devices are added to
+    DeviceManager as if by `DeviceManager.addDevice`.
+
+    Parameters
+    ----------
+    devices : list[dict]
+        Params for each device, each including `deviceClass` and `deviceName` along with any
+        keyword arguments for the device class (e.g. `index` or `serial`).
+    maxWorkers : int or None
+        Maximum number of devices to open at a time, or None to open them all at once.
+
+    Returns
+    -------
+    dict[str, BaseXidDevice]
+        Opened devices by name.
+    dict[str, float]
+        Time (s) each device took to open, by name.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    # enumerate devices up front, so threads don't all try to scan ports at once
+    BaseXidDevice.getAvailableDevices()
+
+    def _open(params):
+        params = params.copy()
+        start = time.perf_counter()
+        device = DeviceManager.addDevice(
+            params.pop('deviceClass'), params.pop('deviceName'), **params
+        )
+
+        return device, time.perf_counter() - start
+
+    opened = {}
+    timings = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=maxWorkers or len(devices) or 1) as pool:
+        futures = {params['deviceName']: pool.submit(_open, params) for params in devices}
+        for name, future in futures.items():
+            try:
+                opened[name], timings[name] = future.result()
+            except Exception as err:
+                errors.append(err)
+                continue
+            logging.info(f"Opened Cedrus device {name} in {timings[name] * 1000:.1f}ms")
+    # raise any error only once every device has finished, so none are left half-open
+    if errors:
+        raise errors[0]
+
+    return opened, timings
+
+
+class _XidThresholdMixin:
+    """
+    Confirming threshold commands and waiting for sensors to report their state, shared by XID
+    light and sound sensor groups.
+    """
+    # time (s) to wait for sensors to report their state after a threshold is set
+    stateTimeout = 0.01
+
+    @contextmanager
+    def _thresholdBatch(self):
+        """
+        Batch threshold commands, falling back to giving the sensors time to settle if the
+        device can't confirm them.
+        """
+        try:
+            with self.parent.batchCommands() as batch:
+                yield batch
+        except ConnectionError as err:
+            logging.warning(
+                f"Could not confirm threshold for {type(self).__name__}, waiting instead: {err}"
+            )
+            time.sleep(0.03)
+
+    def _awaitStates(self, channels):
+        """
+        Dispatch messages until each of the given channels has reported its state, or for at most
+        `stateTimeout` seconds. Reading a threshold back only confirms that it's been set, the
+        sensor reports whether it's over it separately.
+        """
+        pending = set(channels)
+
+        def _onDispatched(resp, delivered):
+            for node, message in delivered:
+                if node is self:
+                    pending.discard(message.channel)
+
+        self.parent._subscribers.append(_onDispatched)
+        deadline = time.perf_counter() + self.stateTimeout
+        try:
+            self.dispatchMessages()
+            while pending and time.perf_counter() < deadline:
+                time.sleep(0.001)
+                self.dispatchMessages()
+        finally:
+            self.parent._subscribers.remove(_onDispatched)
+
+
+class BaseXidLightSensorGroup(_XidThresholdMixin, BaseLightSensorGroup):
     """
     Base class for all Cedrus XID lightsensor devices.
     """
@@ -240,13 +1596,17 @@ class BaseXidLightSensorGroup(BaseLightSensorGroup):
     )
     # subclasses need to know what class they expect their parent to be
     parentCls = BaseXidDevice
+    # whether the parent should enable USB output from this node's selectors
+    enableResponses = True
 
     def __init__(self, pad, channels=1):
         # get parent
         self.parent = self.parentCls.resolve(pad)
         self.xid = self.parent.xid
+        # store number of channels now, as the parent needs it to pick selectors to enable
+        self.channels = channels
         # reference self in parent
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
         # Xid lightsensor should be key 3, but this attribute can be changed if needed
         self.keys = [3]
         # adjustment to apply to incoming time values from the device
@@ -254,6 +1614,13 @@ class BaseXidLightSensorGroup(BaseLightSensorGroup):
         # initialise base class
         BaseLightSensorGroup.__init__(self, channels=channels)
 
+    @property
+    def usbSelectors(self):
+        """
+        Selectors which this node needs USB output from (one per channel).
+        """
+        return self.selectors[:self.channels]
+
     def isSameDevice(self, other):
         """
         Determine whether this object represents the same physical device as a given other
@@ -288,30 +1655,161 @@ class BaseXidLightSensorGroup(BaseLightSensorGroup):
             devices.append({
                 'deviceName': profile['deviceName'] + "_lightsensors",
                 'deviceClass': f"{cls.__module__}.{cls.__qualname__}",
-                'pad': profile['index'],
+                'pad': profile['serial'] or profile['index'],
                 'channels': 1,
             })
 
         return devices
 
+    def setThreshold(self, threshold, channel):
+        # send all thresholds in one write, waiting for the device to confirm them
+        detected = None
+        with self._thresholdBatch():
+            detected = BaseLightSensorGroup.setThreshold(self, threshold, channel)
+        # if batching, state isn't known until the batch is sent
+        if self.parent._batch is not None:
+            return detected
+        # return True/False according to state of each channel
+        if isinstance(channel, (list, tuple)):
+            self._awaitStates(channel)
+            return [self.getState(thisChannel) for thisChannel in channel]
+        self._awaitStates([channel])
+        return self.getState(channel)
+
+    def setThresholds(self, thresholds):
+        """
+        Set the threshold of several channels at once, with all of the commands sent to the
+        device in a single write.
+
+        Parameters
+        ----------
+        thresholds : dict[int, float] or float
+            Threshold for each channel, by channel index, or a single threshold to use for all
+            channels.
+
+        Returns
+        -------
+        dict[int, bool]
+            State of each channel (True if over its threshold) once the thresholds are set.
+        """
+        # if given a single value, use it for all channels
+        if not isinstance(thresholds, dict):
+            thresholds = {channel: thresholds for channel in range(self.channels)}
+        channels = list(thresholds)
+        states = self.setThreshold([thresholds[channel] for channel in channels], channel=channels)
+
+        return dict(zip(channels, states))
+
     def _setThreshold(self, threshold, channel=0):
         if threshold is None:
             return
         # store value
         self._threshold = threshold
-        # convert from base 16 integer to ASCII character
-        thr = chr(100 - int(threshold * 100))
         # get channel selector
         selector = self.selectors[channel]
-        # send command
-        self.parent.xid.con.send_xid_command(f"it{selector}{thr}")
-        # brief pause to settle
-        time.sleep(0.03)
-        # dispatch
-        self.dispatchMessages()
+        # send command, waiting for the device to confirm it
+        with self._thresholdBatch() as batch:
+            batch.setThreshold(selector, 100 - int(threshold * 100))
+        # if batching, state isn't known until the batch is sent
+        if self.parent._batch is not None:
+            return None
         # return True/False according to state
+        self._awaitStates([channel])
         return self.getState(channel)
 
+    def calibrateThreshold(self, channel=None, onStim=None, offStim=None, settle=0.05):
+        """
+        Find the best threshold for one or more channels, by bisecting the threshold range while
+        known bright and dark patches are presented over the sensors.
+
+        For each channel, this finds the highest threshold at which the bright patch is still
+        detected and the lowest at which the dark patch is not, each to within 0.01 in 7 steps,
+        and sets the threshold to halfway between them. All channels are calibrated at once, so
+        the patches are presented 14 times in total however many channels there are.
+
+        Parameters
+        ----------
+        channel : int or list[int] or None
+            Channel to calibrate, a list of channels, or None for all channels.
+        onStim : callable
+            Function which presents the bright patch over the sensor(s), e.g. by drawing a white
+            rectangle and flipping the window.
+        offStim : callable
+            Function which presents the dark patch over the sensor(s).
+        settle : float
+            Time (s) to wait after each presentation for the sensors to respond.
+
+        Returns
+        -------
+        tuple[float, float] or dict[int, tuple[float, float]]
+            Chosen threshold and its margin (the distance from it to the edge of the range in
+            which both patches are told apart) for the channel, or a dict of these by channel if
+            given a list of channels or None. A negative margin means the patches couldn't be
+            told apart at any threshold.
+        """
+        # if not given any channels, use all
+        channels = channel
+        if channels is None:
+            channels = list(range(self.channels))
+        if not isinstance(channels, (list, tuple)):
+            channels = [channels]
+
+        def _bisect(stim):
+            # bisect threshold levels (0-100) for each channel, assuming the stim is detected
+            # below some level and not detected above it
+            lo = {thisChannel: 0 for thisChannel in channels}
+            hi = {thisChannel: 100 for thisChannel in channels}
+            while any(hi[thisChannel] - lo[thisChannel] > 1 for thisChannel in channels):
+                mid = {
+                    thisChannel: (lo[thisChannel] + hi[thisChannel]) // 2
+                    for thisChannel in channels
+                }
+                # set all thresholds at once, then present the stim and see what's detected
+                self.setThresholds({
+                    thisChannel: level / 100 for thisChannel, level in mid.items()
+                })
+                stim()
+                time.sleep(settle)
+                self.dispatchMessages()
+                for thisChannel in channels:
+                    if self.state[thisChannel]:
+                        lo[thisChannel] = mid[thisChannel]
+                    else:
+                        hi[thisChannel] = mid[thisChannel]
+
+            return lo, hi
+
+        # highest level at which the bright patch is detected
+        onLevels, _ = _bisect(onStim)
+        # lowest level at which the dark patch isn't
+        _, offLevels = _bisect(offStim)
+        # choose the middle of the gap between them
+        results = {}
+        for thisChannel in channels:
+            threshold = (onLevels[thisChannel] + offLevels[thisChannel]) / 200
+            margin = (onLevels[thisChannel] - offLevels[thisChannel]) / 200
+            if margin < 0:
+                logging.warning(
+                    f"Could not tell bright and dark patches apart on light sensor channel "
+                    f"{thisChannel}, threshold may be unreliable."
+                )
+            results[thisChannel] = (threshold, margin)
+        self.setThresholds({
+            thisChannel: threshold for thisChannel, (threshold, margin) in results.items()
+        })
+
+        if isinstance(channel, (list, tuple)) or channel is None:
+            return results
+        return results[channel]
+
+    def close(self):
+        """
+        Stop this node receiving responses from its device (and, if the device is managing USB
+        outputs, stop the device sending responses which no other node uses). Called by
+        DeviceManager when the node is removed.
+        """
+        self.parent.removeNode(self)
+
     def resetTimer(self, clock=logging.defaultClock):
         # set the time adjust to be the difference between the target clock and the device clock
         self._timeAdjust = clock.getTime() - self.parent.getTime()
@@ -328,9 +1826,12 @@ class BaseXidLightSensorGroup(BaseLightSensorGroup):
         self.parent.dispatchMessages()
 
     def parseMessage(self, message):
-        # work out channel from key
+        # work out channel from selector (if reported) or key
         channel = 0
-        if message['key'] in self.keys:
+        port = message['port']
+        if isinstance(port, bytes) and port.decode() in self.selectors:
+            channel = self.selectors.index(port.decode())
+        elif message['key'] in self.keys:
             channel = self.keys.index(message['key'])
         # create LightSensorResponse object
         resp = LightSensorResponse(
@@ -348,6 +1849,66 @@ class BaseXidLightSensorGroup(BaseLightSensorGroup):
         """
         return self.parent.hasUnfinishedMessage()
 
+    def streamResponses(self, ports=None, keys=None):
+        """
+        Asynchronously iterate through responses received by this light sensor group as they
+        arrive, e.g.::
+
+            async for resp in lightsensors.streamResponses():
+                print(resp)
+
+        See `BaseXidDevice.streamResponses`.
+
+        Parameters
+        ----------
+        ports : list[int or str or bytes] or None
+            Only yield responses from these ports (or selectors), or None for all ports.
+        keys : list[int] or None
+            Only yield responses from these keys, or None for all keys.
+
+        Returns
+        -------
+        AsyncIterator[LightSensorResponse]
+            Responses, as received by this light sensor group.
+        """
+        def _select(resp, delivered):
+            if not _matchesResponse(resp, ports=ports, keys=keys):
+                return []
+            return [message for node, message in delivered if node is self]
+
+        return self.parent._streamResponses(_select)
+
+    def waitForResponse(self, timeout=None, channels=None, value=None):
+        """
+        Block until this light sensor group receives a response, e.g.::
+
+            resp = lightsensors.waitForResponse(timeout=2, channels=[0], value=True)
+
+        See `BaseXidDevice.waitForResponse`.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Maximum time (s) to wait, or None to wait indefinitely.
+        channels : list[int] or None
+            Only return a response from these channels, or None for all channels.
+        value : bool or None
+            Only return a response with this value (True for press/onset, False for
+            release/offset), or None for either.
+
+        Returns
+        -------
+        LightSensorResponse or None
+            The first matching response, or None if the timeout was reached first.
+        """
+        def _select(resp, delivered):
+            return [
+                message for node, message in delivered
+                if node is self and _matchesMessage(message, channels=channels, value=value)
+            ]
+
+        return self.parent._waitForDelivery(_select, timeout=timeout)
+
 
 class BaseXidButtonGroup(BaseButtonGroup):
     """
@@ -355,8 +1916,8 @@ class BaseXidButtonGroup(BaseButtonGroup):
 
     Parameters
     ----------
-    pad : int or BaseXidDevice
-        Pad which controls these buttons, either as an object or an index.
+    pad : int, str or BaseXidDevice
+        Pad which controls these buttons, either as an object, an index or a USB serial number.
     channels : int
         Number of buttons
     bounce : float or tuple[float, float]
@@ -371,13 +1932,15 @@ class BaseXidButtonGroup(BaseButtonGroup):
     )
     # subclasses need to know what class they expect their parent to be
     parentCls = BaseXidDevice
+    # whether the parent should enable USB output from this node's selectors
+    enableResponses = True
 
     def __init__(self, pad=0, channels=7, bounce=0.005):
         # get parent
         self.parent = self.parentCls.resolve(pad)
         self.xid = self.parent.xid
         # reference self in parent
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
         # set bounce interval
         self.setBounce(bounce)
         # adjustment to apply to incoming time values from the device
@@ -385,6 +1948,13 @@ class BaseXidButtonGroup(BaseButtonGroup):
         # initialise base class
         BaseButtonGroup.__init__(self, channels=channels)
 
+    @property
+    def usbSelectors(self):
+        """
+        Selectors which this node needs USB output from.
+        """
+        return self.selectors
+
     def isSameDevice(self, other):
         """
         Determine whether this object represents the same physical device as a given other
@@ -431,6 +2001,66 @@ class BaseXidButtonGroup(BaseButtonGroup):
 
         return resp
 
+    def streamResponses(self, ports=None, keys=None):
+        """
+        Asynchronously iterate through responses received by this button group as they
+        arrive, e.g.::
+
+            async for resp in buttons.streamResponses():
+                print(resp)
+
+        See `BaseXidDevice.streamResponses`.
+
+        Parameters
+        ----------
+        ports : list[int or str or bytes] or None
+            Only yield responses from these ports (or selectors), or None for all ports.
+        keys : list[int] or None
+            Only yield responses from these keys, or None for all keys.
+
+        Returns
+        -------
+        AsyncIterator[ButtonResponse]
+            Responses, as received by this button group.
+        """
+        def _select(resp, delivered):
+            if not _matchesResponse(resp, ports=ports, keys=keys):
+                return []
+            return [message for node, message in delivered if node is self]
+
+        return self.parent._streamResponses(_select)
+
+    def waitForResponse(self, timeout=None, channels=None, value=None):
+        """
+        Block until this button group receives a response, e.g.::
+
+            resp = buttons.waitForResponse(timeout=2, channels=[0], value=True)
+
+        See `BaseXidDevice.waitForResponse`.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Maximum time (s) to wait, or None to wait indefinitely.
+        channels : list[int] or None
+            Only return a response from these channels, or None for all channels.
+        value : bool or None
+            Only return a response with this value (True for press/onset, False for
+            release/offset), or None for either.
+
+        Returns
+        -------
+        ButtonResponse or None
+            The first matching response, or None if the timeout was reached first.
+        """
+        def _select(resp, delivered):
+            return [
+                message for node, message in delivered
+                if node is self and _matchesMessage(message, channels=channels, value=value)
+            ]
+
+        return self.parent._waitForDelivery(_select, timeout=timeout)
+
     def setBounce(self, bounce):
         """
         Set the time (s) to wait after a response in order to account for physical bounce on the 
@@ -442,14 +2072,36 @@ class BaseXidButtonGroup(BaseButtonGroup):
         # store value
         self.bounce = bounce
         # set bounce on device
-        self.xid.set_signal_filter(self.selectors[0], int(bounce[0] * 1000), int(bounce[1] * 1000))
+        with self.parent.batchCommands() as batch:
+            batch.setSignalFilter(
+                self.selectors[0], int(bounce[0] * 1000), int(bounce[1] * 1000)
+            )
     
-    def getBounce(self, bounce):
+    def getBounce(self):
         """
         Get the time (s) to wait after a response in order to account for physical bounce on the 
         buttons
         """
-        return self.xid.get_signal_filter(self.selectors[0]) / 1000
+        # answer from the settings applied to the device if known, otherwise ask it
+        selector = self.selectors[0]
+        holdOnOff = self.parent.settings.get("signalFilters", selector)
+        if holdOnOff is None:
+            with self.parent.lock:
+                holdOnOff = self.xid.get_signal_filter(selector)
+            # XID 1 devices can't say
+            if holdOnOff is None:
+                return self.bounce
+            self.parent.settings.update("signalFilters", selector, tuple(holdOnOff))
+
+        return (holdOnOff[0] / 1000, holdOnOff[1] / 1000)
+
+    def close(self):
+        """
+        Stop this node receiving responses from its device (and, if the device is managing USB
+        outputs, stop the device sending responses which no other node uses). Called by
+        DeviceManager when the node is removed.
+        """
+        self.parent.removeNode(self)
 
     def resetTimer(self, clock=logging.defaultClock):
         # set the time adjust to be the difference between the target clock and the device clock
@@ -462,13 +2114,13 @@ class BaseXidButtonGroup(BaseButtonGroup):
         for profile in cls.parentCls.getAvailableDevices():
             devices.append({
                 'deviceName': profile['deviceName'] + "_buttons",
-                'pad': profile['index']
+                'pad': profile['serial'] or profile['index']
             })
 
         return devices
 
 
-class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
+class BaseXidSoundSensorGroup(_XidThresholdMixin, BaseSoundSensorGroup):
     # all selectors for XID voicekey nodes
     selectors = (
         # microphone
@@ -478,19 +2130,28 @@ class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
     )
     # subclasses need to know what class they expect their parent to be
     parentCls = BaseXidDevice
+    # whether the parent should enable USB output from this node's selectors
+    enableResponses = True
 
     def __init__(self, pad=0, channels=1, threshold=None):
         # get parent
         self.parent = self.parentCls.resolve(pad)
         self.xid = self.parent.xid
         # reference self in parent
-        self.parent.nodes.append(self)
+        self.parent.addNode(self)
         # BaseXid voicekey should be key 2, but this attribute can be changed if needed
         self.keys = [2]
         # adjustment to apply to incoming time values from the device
         self._timeAdjust = 0
         # initialise base class
         BaseSoundSensorGroup.__init__(self, channels=channels, threshold=threshold)
+
+    @property
+    def usbSelectors(self):
+        """
+        Selectors which this node needs USB output from.
+        """
+        return self.selectors
     
     def dispatchMessages(self):
         """
@@ -511,7 +2172,7 @@ class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
         # create voicekey resp
         resp = SoundSensorResponse(
             t=message['time'] + self._timeAdjust, 
-            channel=message['key']-1, 
+            channel=channel, 
             value=message['pressed'], 
             threshold=self.getThreshold(channel), 
             device=self
@@ -519,6 +2180,74 @@ class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
 
         return resp
 
+    def streamResponses(self, ports=None, keys=None):
+        """
+        Asynchronously iterate through responses received by this sound sensor group as they
+        arrive, e.g.::
+
+            async for resp in soundsensors.streamResponses():
+                print(resp)
+
+        See `BaseXidDevice.streamResponses`.
+
+        Parameters
+        ----------
+        ports : list[int or str or bytes] or None
+            Only yield responses from these ports (or selectors), or None for all ports.
+        keys : list[int] or None
+            Only yield responses from these keys, or None for all keys.
+
+        Returns
+        -------
+        AsyncIterator[SoundSensorResponse]
+            Responses, as received by this sound sensor group.
+        """
+        def _select(resp, delivered):
+            if not _matchesResponse(resp, ports=ports, keys=keys):
+                return []
+            return [message for node, message in delivered if node is self]
+
+        return self.parent._streamResponses(_select)
+
+    def waitForResponse(self, timeout=None, channels=None, value=None):
+        """
+        Block until this sound sensor group receives a response, e.g.::
+
+            resp = soundsensors.waitForResponse(timeout=2, channels=[0], value=True)
+
+        See `BaseXidDevice.waitForResponse`.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Maximum time (s) to wait, or None to wait indefinitely.
+        channels : list[int] or None
+            Only return a response from these channels, or None for all channels.
+        value : bool or None
+            Only return a response with this value (True for press/onset, False for
+            release/offset), or None for either.
+
+        Returns
+        -------
+        SoundSensorResponse or None
+            The first matching response, or None if the timeout was reached first.
+        """
+        def _select(resp, delivered):
+            return [
+                message for node, message in delivered
+                if node is self and _matchesMessage(message, channels=channels, value=value)
+            ]
+
+        return self.parent._waitForDelivery(_select, timeout=timeout)
+
+    def close(self):
+        """
+        Stop this node receiving responses from its device (and, if the device is managing USB
+        outputs, stop the device sending responses which no other node uses). Called by
+        DeviceManager when the node is removed.
+        """
+        self.parent.removeNode(self)
+
     def resetTimer(self, clock=logging.defaultClock):
         # set the time adjust to be the difference between the target clock and the device clock
         self._timeAdjust = clock.getTime() - self.parent.getTime()
@@ -528,13 +2257,14 @@ class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
             return
         # store value
         self._threshold = threshold
-        # convert from base 16 integer to ASCII character
-        thr = chr(int(threshold * 100))
-        # send command
-        self.parent.xid.con.send_xid_command(f"itM{thr}")
-        # dispatch
-        self.dispatchMessages()
+        # send command, waiting for the device to confirm it
+        with self._thresholdBatch() as batch:
+            batch.setThreshold("M", int(threshold * 100))
+        # if batching, state isn't known until the batch is sent
+        if self.parent._batch is not None:
+            return None
         # return True/False according to state
+        self._awaitStates([channel])
         return self.getState(channel)
 
     def isSameDevice(self, other):
@@ -555,7 +2285,7 @@ class BaseXidSoundSensorGroup(BaseSoundSensorGroup):
         for profile in cls.parentCls.getAvailableDevices():
             devices.append({
                 'deviceName': profile['deviceName'] + "_voicekey",
-                'pad': profile['index'],
+                'pad': profile['serial'] or profile['index'],
                 'channels': 1,
             })
 
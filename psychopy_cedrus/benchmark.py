@@ -0,0 +1,315 @@
+"""
+Benchmarks for the response dispatch path of Cedrus XID devices, run against simulated (or
+replayed) devices so that no hardware is needed.
+
+Run from the command line to write results as JSON, e.g.::
+
+    python -m psychopy_cedrus.benchmark --output results.json
+
+and compare two sets of results (e.g. from two releases) with::
+
+    python -m psychopy_cedrus.benchmark --compare baseline.json results.json
+"""
+
+from psychopy_cedrus import simulator
+import numpy as np
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+
+
+# device classes to benchmark, with the ports and keys each kind of node listens to
+deviceFamilies = {
+    'rb': {
+        'device': "psychopy_cedrus.rb.RBDevice",
+        'productId': b"2",
+        'nodes': [
+            ("psychopy_cedrus.rb.RBButtonGroup", 0, 1),
+            ("psychopy_cedrus.rb.RBLightSensorGroup", 2, 3),
+            ("psychopy_cedrus.rb.RBSoundSensorGroup", 2, 2),
+        ],
+    },
+    'riponda': {
+        'device': "psychopy_cedrus.riponda.RipondaDevice",
+        'productId': b"5",
+        'nodes': [
+            ("psychopy_cedrus.riponda.RipondaButtonGroup", 0, 1),
+            ("psychopy_cedrus.riponda.RipondaLightSensorGroup", 2, 3),
+            ("psychopy_cedrus.riponda.RipondaSoundSensorGroup", 2, 2),
+        ],
+    },
+    'stimtracker': {
+        'device': "psychopy_cedrus.stimtracker.StimTrackerDevice",
+        'productId': b"S",
+        'nodes': [
+            ("psychopy_cedrus.stimtracker.StimTrackerButtonGroup", b"K", 1),
+            ("psychopy_cedrus.stimtracker.StimTrackerLightSensorGroup", b"A", 3),
+            ("psychopy_cedrus.stimtracker.StimTrackerSoundSensorGroup", b"M", 2),
+        ],
+    },
+}
+
+
+def _getClass(path):
+    """
+    Import a class from its full import path.
+    """
+    import importlib
+    module, name = path.rsplit(".", 1)
+
+    return getattr(importlib.import_module(module), name)
+
+
+def makeDevice(family, nNodes):
+    """
+    Create a device of the given family backed by a simulated device, with `nNodes` nodes
+    registered (cycling through button, light sensor and sound sensor groups).
+
+    Parameters
+    ----------
+    family : str
+        Key in `deviceFamilies`.
+    nNodes : int
+        Number of nodes to register.
+
+    Returns
+    -------
+    BaseXidDevice
+        Device object.
+    list[tuple]
+        The (port, key) of each kind of node registered, for generating responses.
+    """
+    spec = deviceFamilies[family]
+    sim = simulator.SimulatedXidDevice(productId=spec['productId'])
+    device = _getClass(spec['device'])(xid=sim)
+    routes = []
+    for i in range(nNodes):
+        cls, port, key = spec['nodes'][i % len(spec['nodes'])]
+        _getClass(cls)(pad=device)
+        if (port, key) not in routes:
+            routes.append((port, key))
+
+    return device, routes
+
+
+def benchmarkDispatch(device, routes, burst=1, reps=100, records=None):
+    """
+    Time `dispatchMessages` delivering bursts of responses to a device's nodes.
+
+    Each burst is read from the simulated device ahead of time, as the background reader would,
+    so that only the plugin's own decoding and dispatch is timed.
+
+    Parameters
+    ----------
+    device : BaseXidDevice
+        Device (backed by a simulated device) to benchmark.
+    routes : list[tuple]
+        (port, key) pairs to cycle through for generated responses.
+    burst : int
+        Number of responses per call to `dispatchMessages`.
+    reps : int
+        Number of bursts.
+    records : numpy.ndarray or list[dict] or None
+        Recorded responses to replay instead of generating them, replayed in bursts of `burst`.
+
+    Returns
+    -------
+    dict
+        Number of messages, throughput (messages/s), mean cost per message (s) and the median and
+        99th percentile of latency (s) from the start of a dispatch to each node receiving its
+        message.
+    """
+    sim = device.xid
+    # probe each node's receiveMessage to timestamp deliveries
+    stamps = []
+    for node in device.nodes:
+        def _probe(message, _receive=node.receiveMessage):
+            _receive(message)
+            stamps.append(time.perf_counter())
+        node.receiveMessage = _probe
+
+    latencies = []
+    total = 0
+    nMessages = 0
+    for rep in range(reps):
+        # queue a burst of responses, timestamped in the past so they're ready to read
+        past = sim.getDeviceTime() - 1
+        if records is not None:
+            sim.replay(records[(rep * burst) % len(records):][:burst], deviceTime=past)
+        else:
+            for i in range(burst):
+                port, key = routes[i % len(routes)]
+                sim.addResponse(port=port, key=key, pressed=i % 2 == 0, deviceTime=past)
+        # read them into the device's buffer
+        while sim.hasUnread:
+            for resp in device._readResponses():
+                device._responseBuffer.put(resp)
+        nMessages += len(device._responseBuffer)
+        # time dispatch
+        stamps.clear()
+        start = time.perf_counter()
+        device.dispatchMessages()
+        total += time.perf_counter() - start
+        latencies += [stamp - start for stamp in stamps]
+        # don't let stored responses pile up between reps
+        for node in device.nodes:
+            node.responses = []
+
+    return {
+        'messages': nMessages,
+        'messagesPerSecond': nMessages / total if total else None,
+        'perMessageCost': total / nMessages if nMessages else None,
+        'latencyP50': float(np.percentile(latencies, 50)) if latencies else None,
+        'latencyP99': float(np.percentile(latencies, 99)) if latencies else None,
+    }
+
+
+def runBenchmarks(
+    families=("rb", "riponda", "stimtracker"), nodeCounts=(1, 3, 6, 12),
+    burstSizes=(1, 10, 100), reps=100, records=None
+):
+    """
+    Run the dispatch benchmark over every combination of device family, node count and burst
+    size.
+
+    Parameters
+    ----------
+    families : list[str]
+        Device families to benchmark (keys of `deviceFamilies`).
+    nodeCounts : list[int]
+        Numbers of nodes to register.
+    burstSizes : list[int]
+        Numbers of responses per dispatch.
+    reps : int
+        Number of bursts per combination.
+    records : numpy.ndarray or list[dict] or None
+        Recorded responses to replay instead of generating them.
+
+    Returns
+    -------
+    dict
+        Results, with info about the machine and package under `meta` and one entry per
+        combination under `results`.
+    """
+    from psychopy import logging
+    import psychopy_cedrus
+    # don't let logging of each response dominate the timings (restoring the level afterwards)
+    level = logging.console.level
+    logging.console.setLevel(max(level, logging.WARNING))
+
+    results = []
+    try:
+        for family in families:
+            for nNodes in nodeCounts:
+                for burst in burstSizes:
+                    device, routes = makeDevice(family, nNodes)
+                    result = benchmarkDispatch(
+                        device, routes, burst=burst, reps=reps, records=records
+                    )
+                    result.update({'family': family, 'nodes': nNodes, 'burst': burst})
+                    results.append(result)
+    finally:
+        logging.console.setLevel(level)
+
+    return {
+        'meta': {
+            'version': psychopy_cedrus.__version__,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(),
+            'replayed': records is not None,
+        },
+        'results': results,
+    }
+
+
+def compareResults(baseline, current, tolerance=0.1):
+    """
+    Find benchmarks which have got slower between two sets of results.
+
+    Parameters
+    ----------
+    baseline : dict
+        Results from `runBenchmarks` to compare against.
+    current : dict
+        Results from `runBenchmarks` to check.
+    tolerance : float
+        Proportion by which per-message cost can increase before it counts as a regression.
+
+    Returns
+    -------
+    list[dict]
+        Each regression, with the family, nodes and burst of the benchmark and the per-message
+        cost before and after.
+    """
+    def _key(result):
+        return result['family'], result['nodes'], result['burst']
+
+    before = {_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get(_key(result))
+        if old is None or not old['perMessageCost'] or not result['perMessageCost']:
+            continue
+        if result['perMessageCost'] > old['perMessageCost'] * (1 + tolerance):
+            regressions.append({
+                'family': result['family'],
+                'nodes': result['nodes'],
+                'burst': result['burst'],
+                'before': old['perMessageCost'],
+                'after': result['perMessageCost'],
+            })
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the response dispatch path of psychopy-cedrus."
+    )
+    parser.add_argument("--output", "-o", help="JSON file to write results to")
+    parser.add_argument("--reps", type=int, default=100, help="bursts per benchmark")
+    parser.add_argument(
+        "--replay", help=".npy file of recorded responses (from getMessages) to replay"
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+        help="compare two results files instead of running benchmarks"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1,
+        help="allowed proportional slowdown when comparing"
+    )
+    args = parser.parse_args(argv)
+    # compare results
+    if args.compare:
+        baseline, current = [json.loads(open(file).read()) for file in args.compare]
+        regressions = compareResults(baseline, current, tolerance=args.tolerance)
+        for reg in regressions:
+            print(
+                f"{reg['family']} nodes={reg['nodes']} burst={reg['burst']}: "
+                f"{reg['before'] * 1e6:.2f}us -> {reg['after'] * 1e6:.2f}us per message"
+            )
+        return 1 if regressions else 0
+    # run benchmarks
+    records = np.load(args.replay) if args.replay else None
+    results = runBenchmarks(reps=args.reps, records=records)
+    for result in results['results']:
+        print(
+            f"{result['family']:>12} nodes={result['nodes']:<3} burst={result['burst']:<4} "
+            f"{result['messagesPerSecond']:>10.0f} msg/s  "
+            f"{result['perMessageCost'] * 1e6:8.2f}us/msg  "
+            f"p50={result['latencyP50'] * 1e6:8.2f}us  p99={result['latencyP99'] * 1e6:8.2f}us"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
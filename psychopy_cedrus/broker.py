@@ -0,0 +1,956 @@
+"""
+Sharing a single Cedrus XID device between processes. Only one process can open a device's serial
+port, so one process owns the device and runs a `DeviceBroker`, which publishes every response
+(and every clock sync sample) over a Unix domain socket and passes commands from other processes
+through to the device.
+
+Other processes connect with a `BrokerXidDevice`, which has the same interface as
+`pyxid2.XidDevice` and so can be given to any device class in place of a real device, after which
+the usual button, light sensor and sound sensor groups work as normal::
+
+    # owning process (or: python -m psychopy_cedrus.broker stimtracker --path /tmp/cedrus.sock)
+    from psychopy_cedrus.broker import DeviceBroker
+    from psychopy_cedrus.stimtracker import StimTrackerDevice
+    device = StimTrackerDevice(index=0, syncInterval=10)
+    broker = DeviceBroker(device, path="/tmp/cedrus.sock")
+    broker.start()
+
+    # any number of other processes
+    from psychopy_cedrus.broker import connectBroker
+    from psychopy_cedrus.stimtracker import StimTrackerDevice, StimTrackerLightSensorGroup
+    device = connectBroker("/tmp/cedrus.sock", StimTrackerDevice, enableResponses=False)
+    lightSensors = StimTrackerLightSensorGroup(pad=device, channels=4, enableResponses=False)
+
+A device can also be opened in a child process (see `openInChildProcess`), which then does all
+reading and decoding of the device's responses, with a broker serving only the parent process.
+
+Everything sent over the socket is a frame of a 5 byte header (body length and frame type)
+followed by the body. Responses and clock sync samples are packed structs, so publishing them
+costs no more than a few bytes of copying per subscriber, while the rarer requests and replies
+are JSON.
+"""
+
+from pathlib import Path
+from psychopy import logging, core
+from psychopy_cedrus.commands import CommandBatch
+from collections import deque
+from math import nan
+from struct import Struct, pack
+import argparse
+import itertools
+import json
+import queue
+import select
+import socket
+import tempfile
+import threading
+import time
+
+
+# frame types
+FRAME_RESPONSE = 1
+FRAME_CLOCK = 2
+FRAME_REQUEST = 3
+FRAME_REPLY = 4
+FRAME_HELLO = 5
+
+# frame header: body length, frame type
+_header = Struct("<IB")
+# response body: port, key, flags (bit 0 pressed, bit 1 port is a selector), device time (ms),
+# host time (s, on the system-wide perf_counter timeline)
+_responseBody = Struct("<BBBqd")
+# responses are packed header and all, as there are so many of them
+_responseFrame = Struct("<IBBBBqd")
+# clock sync sample body: device time (ms), host time (s, perf_counter timeline), round trip (s)
+_clockBody = Struct("<qdd")
+
+# methods of the device which clients can call directly
+_passthrough = ("query_timer", "get_signal_filter", "get_enable_usb_output")
+
+# device classes which can be brokered from the command line, with the arguments each needs to
+# report every response (as the broker itself has no nodes)
+deviceClasses = {
+    'rb': ("psychopy_cedrus.rb.RBDevice", {}),
+    'riponda': ("psychopy_cedrus.riponda.RipondaDevice", {}),
+    'stimtracker': ("psychopy_cedrus.stimtracker.StimTrackerDevice", {'enableResponses': True}),
+}
+
+
+def defaultSocketPath(serial):
+    """
+    Get the default socket path for brokering the device with the given USB serial number.
+
+    Parameters
+    ----------
+    serial : str or None
+        Serial number of the device.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the socket, in the system temp folder.
+    """
+    return Path(tempfile.gettempdir()) / f"psychopy-cedrus-{serial}.sock"
+
+
+def _hostOffset():
+    """
+    Get the offset from psychopy.core.getTime to time.perf_counter, which (unlike the former)
+    has the same zero in every process.
+    """
+    return time.perf_counter() - core.getTime()
+
+
+def _frame(kind, body):
+    """
+    Make a frame of the given type from its body.
+    """
+    return _header.pack(len(body), kind) + body
+
+
+def _jsonFrame(kind, value):
+    """
+    Make a frame of the given type whose body is `value` as JSON.
+    """
+    return _frame(kind, json.dumps(value).encode("utf-8"))
+
+
+def _splitFrames(buffer):
+    """
+    Take all complete frames from the start of a buffer, leaving any partial frame in it.
+
+    Parameters
+    ----------
+    buffer : bytearray
+        Bytes received so far, which is modified in place.
+
+    Returns
+    -------
+    list[tuple[int, bytes]]
+        Type and body of each complete frame.
+    """
+    frames = []
+    pos = 0
+    with memoryview(buffer) as view:
+        while len(view) - pos >= _header.size:
+            length, kind = _header.unpack_from(view, pos)
+            end = pos + _header.size + length
+            if end > len(view):
+                break
+            # copy out only the body, as the buffer can't be trimmed while it's viewed
+            frames.append((kind, bytes(view[pos + _header.size:end])))
+            pos = end
+    # trim all the complete frames at once
+    del buffer[:pos]
+
+    return frames
+
+
+def _encodeResponse(resp, hostOffset):
+    """
+    Pack a response dict from pyxid2 as a response frame.
+    """
+    port = resp['port']
+    flags = 1 if resp['pressed'] else 0
+    # StimTrackers report a selector (e.g. b"K") rather than a port number
+    if isinstance(port, bytes):
+        port = port[0]
+        flags |= 2
+
+    return _responseFrame.pack(
+        _responseBody.size, FRAME_RESPONSE, port, resp['key'], flags, int(resp['time']),
+        resp.get('hostTime', nan) + hostOffset
+    )
+
+
+def _decodeResponse(body, hostOffset):
+    """
+    Unpack the body of a response frame as a response dict, as from pyxid2.
+    """
+    port, key, flags, deviceTime, hostTime = _responseBody.unpack(body)
+    if flags & 2:
+        port = bytes([port])
+
+    return {
+        'port': port,
+        'key': key,
+        'pressed': bool(flags & 1),
+        'time': deviceTime,
+        'hostTime': hostTime - hostOffset,
+    }
+
+
+class _BrokerSession:
+    """
+    Connection from one client to a DeviceBroker, with its own thread for handling requests and
+    its own thread and queue for sending, so that a slow client never holds up the others.
+    """
+    def __init__(self, broker, sock, name):
+        self.broker = broker
+        self.sock = sock
+        self.name = name
+        self._outbox = queue.SimpleQueue()
+        self._reader = threading.Thread(target=self._readLoop, name=f"{name}-read", daemon=True)
+        self._writer = threading.Thread(target=self._writeLoop, name=f"{name}-write", daemon=True)
+
+    def start(self):
+        self._reader.start()
+        self._writer.start()
+
+    @property
+    def isConnected(self):
+        """
+        True until the client disconnects.
+        """
+        return self._reader.is_alive()
+
+    def join(self, timeout=None):
+        """
+        Wait for the client to disconnect.
+        """
+        self._reader.join(timeout)
+
+    def send(self, data):
+        """
+        Queue bytes to send to the client.
+        """
+        self._outbox.put(data)
+
+    def close(self):
+        """
+        Stop sending and disconnect the client.
+        """
+        self._outbox.put(None)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _writeLoop(self):
+        """
+        Body of the sending thread.
+        """
+        while True:
+            data = self._outbox.get()
+            if data is None:
+                break
+            # send everything queued in one go
+            chunks = [data]
+            try:
+                while True:
+                    data = self._outbox.get_nowait()
+                    if data is None:
+                        break
+                    chunks.append(data)
+            except queue.Empty:
+                pass
+            try:
+                self.sock.sendall(b"".join(chunks))
+            except OSError:
+                break
+            if data is None:
+                break
+        self.broker._removeSession(self)
+        # make sure the request handling thread stops too
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def _readLoop(self):
+        """
+        Body of the request handling thread.
+        """
+        buffer = bytearray()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b""
+            # empty read means the client has gone
+            if not data:
+                break
+            buffer += data
+            for kind, body in _splitFrames(buffer):
+                if kind == FRAME_REQUEST:
+                    request = json.loads(bytes(body))
+                    self.send(_jsonFrame(FRAME_REPLY, self.broker._handleRequest(request)))
+        self.close()
+
+
+class DeviceBroker:
+    """
+    Publishes the responses and clock sync samples of a Cedrus XID device to other processes over
+    a Unix domain socket, and passes their commands through to the device.
+
+    While running, the broker reads the device in the background and publishes each response as
+    it's read, leaving it buffered for the owning process to dispatch to its own nodes (with
+    `dispatchMessages`, as usual) on whichever thread it likes.
+
+    Parameters
+    ----------
+    device : BaseXidDevice
+        Device to share.
+    path : str or pathlib.Path or None
+        Path of the socket, or None to use `defaultSocketPath` for the device's serial number.
+    listen : bool
+        If False, don't listen on a socket at all and only serve clients given to `addClient`
+        (e.g. one end of a `socket.socketpair`).
+    """
+    def __init__(self, device, path=None, listen=True):
+        self.device = device
+        self.path = Path(path) if path is not None else defaultSocketPath(device.serial)
+        self.listen = listen
+        self._server = None
+        self._running = False
+        self._sessions = []
+        self._sessionsLock = threading.Lock()
+        self._sessionNames = itertools.count()
+        self._name = f"{type(device).__name__}@{device.index}-broker"
+        self._threads = []
+        self._stop = threading.Event()
+        # most recent clock sync sample published
+        self._lastSample = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def isRunning(self):
+        """
+        True if the broker is publishing the device's responses.
+        """
+        return self._running
+
+    @property
+    def clients(self):
+        """
+        Number of connected clients.
+        """
+        return len(self._sessions)
+
+    def start(self):
+        """
+        Start listening for clients (if `listen` is True) and publishing the device's responses.
+        """
+        if self.isRunning:
+            return
+        self._stop.clear()
+        self._threads = []
+        if self.listen:
+            # remove any socket left behind by a broker which didn't stop cleanly
+            if self.path.exists():
+                self.path.unlink()
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(str(self.path))
+            self._server.listen()
+            self._server.settimeout(0.1)
+            self._threads.append(threading.Thread(
+                target=self._acceptLoop, name=f"{self._name}-accept", daemon=True
+            ))
+        # read the device in the background, publishing responses as they're read
+        self.device._readTaps.append(self._publishResponses)
+        self.device.startReader()
+        self._threads.append(threading.Thread(
+            target=self._publishLoop, name=f"{self._name}-publish", daemon=True
+        ))
+        self._running = True
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Disconnect all clients and stop listening. The device is left open.
+        """
+        if not self.isRunning:
+            return
+        self._stop.set()
+        if self._publishResponses in self.device._readTaps:
+            self.device._readTaps.remove(self._publishResponses)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._running = False
+        # disconnect clients
+        with self._sessionsLock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if self.path.exists():
+                self.path.unlink()
+
+    def addClient(self, sock):
+        """
+        Start serving a client which is already connected.
+
+        Parameters
+        ----------
+        sock : socket.socket
+            Connected socket to serve the client over.
+
+        Returns
+        -------
+        _BrokerSession
+            Session serving the client, whose `join` method waits for the client to disconnect.
+        """
+        sock.settimeout(None)
+        session = _BrokerSession(self, sock, name=f"{self._name}-{next(self._sessionNames)}")
+        # introduce the device and catch the client up on clock sync
+        session.send(_jsonFrame(FRAME_HELLO, self._describeDevice()))
+        offset = _hostOffset()
+        for deviceTime, hostTime, roundTrip in tuple(self.device.clockSync.samples):
+            session.send(_frame(
+                FRAME_CLOCK, _clockBody.pack(deviceTime, hostTime + offset, roundTrip)
+            ))
+        with self._sessionsLock:
+            self._sessions.append(session)
+        session.start()
+
+        return session
+
+    def _acceptLoop(self):
+        """
+        Body of the thread accepting new clients.
+        """
+        while not self._stop.is_set():
+            try:
+                sock, address = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.addClient(sock)
+
+    def _publishResponses(self, responses):
+        """
+        Publish responses as they're read from the device (called from the device's reader, so
+        before they're dispatched, which converts their times).
+        """
+        self._publish([_encodeResponse(resp, _hostOffset()) for resp in responses])
+
+    def _publishLoop(self):
+        """
+        Body of the thread publishing clock sync samples.
+        """
+        while not self._stop.wait(0.1):
+            self._publish(self._newClockFrames(_hostOffset()))
+
+    def _publish(self, frames):
+        """
+        Send frames to every client.
+        """
+        if not frames:
+            return
+        data = b"".join(frames)
+        for session in tuple(self._sessions):
+            session.send(data)
+
+    def _newClockFrames(self, offset):
+        """
+        Get a clock frame for each clock sync sample taken since the last were published.
+        """
+        samples = tuple(self.device.clockSync.samples)
+        if not samples or samples[-1] == self._lastSample:
+            return []
+        # find where the last published sample is (it may have dropped out of the window)
+        new = samples
+        if self._lastSample in samples:
+            new = samples[samples.index(self._lastSample) + 1:]
+        self._lastSample = samples[-1]
+
+        return [
+            _frame(FRAME_CLOCK, _clockBody.pack(deviceTime, hostTime + offset, roundTrip))
+            for deviceTime, hostTime, roundTrip in new
+        ]
+
+    def _removeSession(self, session):
+        with self._sessionsLock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+
+    def _describeDevice(self):
+        """
+        Get the details of the device which clients need to stand in for it.
+        """
+        xid = self.device.xid
+        return {
+            'productId': xid.product_id.decode("latin1"),
+            'modelId': xid.model_id.decode("latin1"),
+            'majorFirmware': xid.major_fw_version,
+            'name': xid.device_name,
+            'serial': self.device.serial,
+            'index': self.device.index,
+            'baudrate': getattr(xid.con, "baudrate", None),
+        }
+
+    def _handleRequest(self, request):
+        """
+        Carry out a request from a client, returning the reply to send.
+        """
+        reply = {'id': request.get('id')}
+        method, args = request.get('method'), request.get('args', [])
+        xid = self.device.xid
+        try:
+            with self.device.lock:
+                if method == "exchangeCommands":
+                    # write then read as one, so replies can't be taken by anything else (and any
+                    # responses which arrive in among them are published as usual)
+                    commands, timeout = args
+                    replies = CommandBatch(self.device, timeout=timeout)._exchange([
+                        (
+                            bytes.fromhex(command), replyLength,
+                            None if expect is None else bytes.fromhex(expect)
+                        )
+                        for command, replyLength, expect in commands
+                    ])
+                    result = [reply.hex() for reply in replies]
+                    # a raw command may have changed any setting
+                    self.device.settings.clear()
+                elif method == "query_timer":
+                    # checked query, so a response packet can't be read as the timer
+                    result = self.device._queryTimer()
+                elif method in _passthrough:
+                    result = getattr(xid, method)(*args)
+                else:
+                    raise ValueError(f"Unknown method {method!r}")
+            reply['result'] = result
+        except Exception as err:
+            reply['error'] = f"{type(err).__name__}: {err}"
+
+        return reply
+
+
+class BrokerXidConnection:
+    """
+    Stands in for `pyxid2.XidConnection`, sending commands through a DeviceBroker.
+
+    Parameters
+    ----------
+    device : BrokerXidDevice
+        Device this connection belongs to.
+    index : int
+        FTDI index of the device in the broker's process.
+    baudrate : int or None
+        Baud rate of the device in the broker's process.
+    """
+    def __init__(self, device, index=0, baudrate=None):
+        self.device = device
+        self.ftd2xx_index = index
+        self.baudrate = baudrate
+
+    def open(self):
+        return True
+
+    def close(self):
+        self.device.close()
+        return True
+
+    def flush(self, mask=0):
+        pass
+
+    def exchangeCommands(self, commands, timeout=0.1):
+        """
+        Write commands to the device and read back their replies, without anything else talking
+        to the device in between (see `CommandBatch`).
+
+        Parameters
+        ----------
+        commands : list[tuple[bytes, int, bytes or None]]
+            Each command, with the length of its reply and what the reply should start with.
+        timeout : float
+            Maximum time (s) for the device to reply.
+
+        Returns
+        -------
+        list[bytes]
+            Reply to each command.
+        """
+        replies = self.device._call("exchangeCommands", [
+            [bytes(command).hex(), replyLength, None if expect is None else bytes(expect).hex()]
+            for command, replyLength, expect in commands
+        ], timeout)
+
+        return [bytes.fromhex(reply) for reply in replies]
+
+    def exchange(self, data, n, timeout=0.1):
+        """
+        Write bytes to the device and read `n` bytes in reply.
+        """
+        return self.exchangeCommands([(data, n, None)], timeout=timeout)[0]
+
+    def write(self, command):
+        return self.write_bytes(command.encode("latin1"))
+
+    def write_bytes(self, command):
+        self.exchange(command, 0)
+
+        return len(command)
+
+    def read(self, bytes_to_read):
+        return self.exchange(b"", bytes_to_read)
+
+    def send_xid_command(self, command, bytes_expected=0):
+        return self.exchange(command.encode("latin1"), bytes_expected)
+
+    def send_xid_byte_command(self, command, bytes_expected=0):
+        return self.exchange(command, bytes_expected)
+
+
+class BrokerXidDevice:
+    """
+    Client of a DeviceBroker, with the same interface as `pyxid2.XidDevice` so that it can be
+    given to a device class (as `xid`) in place of a real device.
+
+    The device timer belongs to the broker, so `reset_timer` does nothing. Settings changed
+    through one client aren't known to others, so each client should only change the settings
+    of the nodes it uses.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path or None
+        Path of the broker's socket.
+    timeout : float
+        Maximum time (s) to wait for the broker to reply to a request.
+    sock : socket.socket or None
+        Socket already connected to a broker (see `DeviceBroker.addClient`), to use instead of
+        connecting to `path`.
+    connectTimeout : float or None
+        Maximum time (s) to wait for the broker to introduce the device on connecting, or None
+        to use `timeout`.
+    """
+    def __init__(self, path=None, timeout=1.0, sock=None, connectTimeout=None):
+        self.path = Path(path) if path is not None else None
+        self.timeout = timeout
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(str(self.path))
+        self._sock = sock
+        # bytes received but not yet parsed
+        self._buffer = bytearray()
+        # lock around the socket, so requests and polls don't interleave
+        self._lock = threading.RLock()
+        self._ids = itertools.count()
+        self._replies = {}
+        self._hello = None
+        self.closed = False
+        # responses which have been received, ready to be got
+        self.response_queue = []
+        # clock sync samples from the broker (on this process's psychopy.core.getTime timeline),
+        # and function to call with each as it arrives
+        self.clockSamples = deque(maxlen=32)
+        self.onClockSample = None
+        # wait to be introduced to the device
+        deadline = time.perf_counter() + (timeout if connectTimeout is None else connectTimeout)
+        while self._hello is None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self._sock.close()
+                raise ConnectionError(f"No reply from Cedrus device broker {self._where}")
+            self._receive(remaining)
+        self.product_id = self._hello['productId'].encode("latin1")
+        self.model_id = self._hello['modelId'].encode("latin1")
+        self.major_fw_version = self._hello['majorFirmware']
+        self.device_name = self._hello['name']
+        self.serial = self._hello['serial']
+        self.keymap = None
+        self.con = BrokerXidConnection(
+            self, index=self._hello['index'], baudrate=self._hello['baudrate']
+        )
+
+    def __repr__(self):
+        return f'<BrokerXidDevice "{self.device_name}" {self._where}>'
+
+    @property
+    def _where(self):
+        return f"at {self.path}" if self.path is not None else "over a socket"
+
+    def close(self):
+        """
+        Disconnect from the broker.
+        """
+        self.closed = True
+        self._sock.close()
+
+    def _receive(self, timeout=0):
+        """
+        Wait up to `timeout` for data from the broker and handle any complete frames.
+
+        Returns
+        -------
+        bool
+            True if anything was received.
+        """
+        readable, _, _ = select.select([self._sock], [], [], timeout)
+        if not readable:
+            return False
+        data = self._sock.recv(65536)
+        # empty read means the broker has gone
+        if not data:
+            self.closed = True
+            raise ConnectionError(f"Cedrus device broker {self._where} has closed")
+        self._buffer += data
+        offset = _hostOffset()
+        for kind, body in _splitFrames(self._buffer):
+            if kind == FRAME_RESPONSE:
+                self.response_queue.append(_decodeResponse(body, offset))
+            elif kind == FRAME_CLOCK:
+                deviceTime, hostTime, roundTrip = _clockBody.unpack(body)
+                sample = (deviceTime, hostTime - offset, roundTrip)
+                self.clockSamples.append(sample)
+                if self.onClockSample is not None:
+                    self.onClockSample(*sample)
+            elif kind == FRAME_REPLY:
+                reply = json.loads(bytes(body))
+                self._replies[reply['id']] = reply
+            elif kind == FRAME_HELLO:
+                self._hello = json.loads(bytes(body))
+
+        return True
+
+    def _call(self, method, *args):
+        """
+        Ask the broker to carry out a request, and wait for its reply.
+        """
+        if self.closed:
+            raise ConnectionError(f"Cedrus device broker {self._where} has closed")
+        with self._lock:
+            requestId = next(self._ids)
+            self._sock.sendall(_jsonFrame(
+                FRAME_REQUEST, {'id': requestId, 'method': method, 'args': args}
+            ))
+            # handle whatever arrives (e.g. responses) until the reply does
+            deadline = time.perf_counter() + self.timeout
+            while requestId not in self._replies:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise ConnectionError(
+                        f"No reply from Cedrus device broker {self._where} to {method}"
+                    )
+                self._receive(remaining)
+            reply = self._replies.pop(requestId)
+        if 'error' in reply:
+            raise ConnectionError(
+                f"Cedrus device broker {self._where} failed to {method}: {reply['error']}"
+            )
+
+        return reply['result']
+
+    # --- pyxid2.XidDevice interface ---
+
+    def reset_timer(self):
+        # the timer is shared by every client, so only the broker's process may reset it
+        pass
+
+    def query_timer(self):
+        return self._call("query_timer")
+
+    def poll_for_response(self):
+        if self.closed:
+            return
+        with self._lock:
+            try:
+                # take everything which has arrived
+                while self._receive(0):
+                    pass
+            except ConnectionError as err:
+                logging.warning(str(err))
+
+    def response_queue_size(self):
+        return len(self.response_queue)
+
+    def has_response(self):
+        return len(self.response_queue) > 0
+
+    def get_next_response(self):
+        if self.response_queue:
+            return self.response_queue.pop(0)
+
+    def clear_response_queue(self):
+        self.response_queue = []
+
+    def flush_serial_buffer(self, mask=0):
+        pass
+
+    def set_signal_filter(self, selector, holdOn, holdOff):
+        self.con.send_xid_byte_command(
+            pack('<cccII', b'i', b'f', selector.encode('latin1'), holdOn, holdOff)
+        )
+
+    def get_signal_filter(self, selector):
+        return tuple(self._call("get_signal_filter", selector))
+
+    def set_enable_usb_output(self, selector, enable):
+        self.con.send_xid_command('iu%s%s' % (selector, '1' if enable else '0'))
+
+    def get_enable_usb_output(self, selector):
+        return self._call("get_enable_usb_output", selector)
+
+
+def connectBroker(path, deviceClass, **kwargs):
+    """
+    Connect to a DeviceBroker and make a device of the given class which talks to it, with its
+    clock kept in sync by the broker's clock sync samples.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Path of the broker's socket.
+    deviceClass : type
+        Device class to make (e.g. `psychopy_cedrus.stimtracker.StimTrackerDevice`).
+    **kwargs
+        Arguments for the device class. StimTracker devices (and their groups) should be given
+        `enableResponses=False`, as which responses are sent is up to the broker.
+
+    Returns
+    -------
+    BaseXidDevice
+        Device of class `deviceClass`.
+    """
+    return _makeClientDevice(BrokerXidDevice(path), deviceClass, kwargs)
+
+
+def _makeClientDevice(xid, deviceClass, kwargs):
+    """
+    Make a device of the given class around a BrokerXidDevice, using the broker's clock sync.
+    """
+    device = deviceClass(xid=xid, **kwargs)
+    # map response times using the broker's clock sync, from the samples it's sent so far on
+    for sample in tuple(xid.clockSamples):
+        device._addSyncSample(*sample)
+    xid.onClockSample = device._addSyncSample
+
+    return device
+
+
+def openInChildProcess(
+    deviceClass, index=0, serial=None, xid=None, syncInterval=10.0, startupTimeout=30.0,
+    **kwargs
+):
+    """
+    Open a device in a child process, which reads and decodes everything the device sends, and
+    make a device of the same class in this process which talks to it. Responses reach nodes
+    in this process through `dispatchMessages` as usual, but already decoded, so pyxid2's
+    parsing never competes with this process (e.g. with drawing stimuli) for the GIL.
+
+    The child process is started with the "spawn" method, so on Windows and macOS scripts must
+    open devices this way from within an `if __name__ == "__main__":` block.
+
+    Parameters
+    ----------
+    deviceClass : type
+        Device class (e.g. `psychopy_cedrus.stimtracker.StimTrackerDevice`).
+    index : int
+        Index of the device, in the order pyxid2 enumerates them.
+    serial : str or None
+        USB serial number of the device, used instead of `index` if given.
+    xid : object or None
+        Object with the interface of `pyxid2.XidDevice` to use in the child process instead of
+        finding a device by `index`/`serial`. Must be picklable, so in practice a simulated device.
+    syncInterval : float or None
+        Time (s) between clock sync samples, taken by the child process. Response times in this
+        process are mapped onto its own clock using them.
+    startupTimeout : float
+        Maximum time (s) to wait for the child process to open the device.
+    **kwargs
+        Arguments for the device class in this process (e.g. `threaded` or `historySize`).
+
+    Returns
+    -------
+    BaseXidDevice
+        Device of class `deviceClass`, with the child process as its `childProcess`. The child
+        process exits once the device's connection to it is closed (`device.xid.close()`) or
+        this process exits.
+    """
+    import multiprocessing
+    ours, theirs = socket.socketpair()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serveChild,
+        args=(theirs, deviceClass, {
+            'index': index, 'serial': serial, 'xid': xid, 'syncInterval': syncInterval
+        }),
+        name=f"{deviceClass.__name__}@{index}-child",
+        daemon=True
+    )
+    process.start()
+    theirs.close()
+    try:
+        xid = BrokerXidDevice(sock=ours, connectTimeout=startupTimeout)
+    except ConnectionError:
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+        ours.close()
+        raise ConnectionError(
+            f"Could not open {deviceClass.__name__}@{serial or index} in a child process "
+            f"(exit code {process.exitcode})"
+        )
+    device = _makeClientDevice(xid, deviceClass, kwargs)
+    device.childProcess = process
+
+    return device
+
+
+def _serveChild(sock, deviceClass, kwargs):
+    """
+    Body of a child process started by `openInChildProcess`.
+    """
+    device = deviceClass(**kwargs)
+    broker = DeviceBroker(device, listen=False)
+    broker.start()
+    # serve the parent until it disconnects, keeping the device's own history up to date
+    session = broker.addClient(sock)
+    while session.isConnected:
+        device.dispatchMessages()
+        session.join(0.1)
+    broker.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Share a Cedrus XID device with other processes over a Unix domain socket."
+    )
+    parser.add_argument("family", choices=sorted(deviceClasses), help="kind of device")
+    parser.add_argument("--index", type=int, default=0, help="index of the device")
+    parser.add_argument("--serial", help="USB serial number of the device (instead of index)")
+    parser.add_argument("--path", help="path of the socket (default: in the temp folder)")
+    parser.add_argument(
+        "--sync-interval", type=float, default=10.0,
+        help="time (s) between clock sync samples"
+    )
+    args = parser.parse_args(argv)
+    # open device
+    import importlib
+    clsPath, kwargs = deviceClasses[args.family]
+    module, name = clsPath.rsplit(".", 1)
+    deviceClass = getattr(importlib.import_module(module), name)
+    device = deviceClass(
+        index=args.index, serial=args.serial, syncInterval=args.sync_interval, **kwargs
+    )
+    # serve until interrupted
+    broker = DeviceBroker(device, path=args.path)
+    broker.start()
+    print(f"Sharing {device.xid.device_name} at {broker.path}")
+    try:
+        # keep the device's own history up to date
+        while True:
+            device.dispatchMessages()
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -17,6 +17,7 @@ pyxid2 package instead (bundled with Standalone PsychoPy)::
 """
 
 from psychopy import core
+import numpy as np
 import struct
 
 try:
@@ -39,8 +40,8 @@ class _KeyEvent:
             #   be 6 bytes" %(str([XID]),len(XID)))
             self.key = None
         else:
-            # a character and a ubyte of info
-            info = struct.unpack('B', XID[1])[0]
+            # a character and a ubyte of info (indexing bytes gives an int)
+            info = XID[1]
 
             # was the key going down or up?
             if (info >> 4) % 2:  # this gives only the 4th bit
@@ -52,7 +53,79 @@ class _KeyEvent:
             self.key = info >> 5  # bits 5-7 give the button number
 
             # what was RT?
-            self.rt = struct.unpack('i', XID[2:])[0]  # integer in ms
+            self.rt = struct.unpack('<i', XID[2:6])[0]  # integer in ms
+
+    @classmethod
+    def fromRecord(cls, record):
+        """Make a _KeyEvent from one record of the array given by
+        _parseKeyFrames
+        """
+        evt = cls.__new__(cls)
+        evt.key = int(record['key'])
+        evt.direction = 'down' if record['down'] else 'up'
+        evt.rt = int(record['rt'])
+        return evt
+
+
+# layout of a "k"<info><rt> key frame, as sent by the device
+_keyFrameDtype = np.dtype([('k', 'u1'), ('info', 'u1'), ('rt', '<i4')])
+# decoded key frames, as given by _parseKeyFrames
+keyEventDtype = np.dtype([('key', 'u1'), ('down', '?'), ('rt', '<i4')])
+
+
+def _decodeKeyFrames(data):
+    """Decode back-to-back key frames, given as a uint8 array whose length
+    is a multiple of 6
+
+    Returns a numpy structured array of keyEventDtype
+    """
+    frames = data.view(_keyFrameDtype)
+    out = np.empty(len(frames), dtype=keyEventDtype)
+    out['key'] = frames['info'] >> 5  # bits 5-7 give the button number
+    out['down'] = frames['info'] & 0x10  # bit 4 gives the direction
+    out['rt'] = frames['rt']  # integer in ms
+    return out
+
+
+def _parseKeyFrames(buffer):
+    """Decode all complete "k"<info><rt> frames from the start of a
+    bytearray, removing them (and any bytes which aren't part of a key
+    frame) from it. An incomplete frame at the end is left in the buffer,
+    to be completed by the next read.
+
+    Back-to-back frames are decoded as a batch, by viewing them as an
+    array of 6-byte records, rather than one at a time.
+
+    Returns a numpy structured array of keyEventDtype (fields key, down
+    and rt)
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    runs = []
+    cursor = 0
+    end = len(buffer)
+    while cursor < end:
+        # skip to the start of the next key frame
+        cursor = buffer.find(b'k', cursor)
+        if cursor < 0:
+            cursor = end
+            break
+        # find how many whole frames follow on back-to-back from here
+        nWhole = (end - cursor) // 6
+        if nWhole == 0:
+            # frame is only partly received, keep it for next time
+            break
+        isStart = data[cursor:cursor + nWhole * 6:6] == 0x6B
+        nRun = nWhole if isStart.all() else int(isStart.argmin())
+        # decode the whole run at once
+        runs.append(_decodeKeyFrames(data[cursor:cursor + nRun * 6]))
+        cursor += nRun * 6
+    # release the view before resizing the buffer
+    del data
+    del buffer[:cursor]
+
+    if not runs:
+        return np.empty(0, dtype=keyEventDtype)
+    return np.concatenate(runs)
 
 
 class RB730:
@@ -83,12 +156,13 @@ class RB730:
                                   timeout=0.0001)
         if not self.port.isOpen():
             self.port.open()
-        # self.buffer = ''  # our own buffer (in addition to the serial port
-        # buffer)
+        # our own buffer (in addition to the serial port buffer), holding
+        # any partial key frame left over from the last read
+        self._buffer = bytearray()
         self.clearBuffer()
 
     def sendMessage(self, message):
-        self.port.writelines(message)
+        self.port.write(message)
 
     def _clearBuffer(self):
         """DEPRECATED as of 1.00.05
@@ -100,6 +174,7 @@ class RB730:
         any keypresses that haven't yet been handled.
         """
         self.port.flushInput()
+        self._buffer.clear()
 
     def getKeyEvents(self, allowedKeys=(1, 2, 3, 4, 5, 6, 7), downOnly=True):
         """Return a list of keyEvents
@@ -116,61 +191,92 @@ class RB730:
         downOnly limits the function to report only the downward
         stroke of the key
         """
-        # get the raw string
-        nToGet = self.port.inWaiting()
-        # self.buffer += self.port.read(nToGet)  # extend our own buffer (then
-        # remove the bits we use)
-        # extend our own buffer (then remove the bits we use)
-        inputStr = self.port.read(nToGet)
-        keys = []
-
-        # loop through messages for keys
-        nKeys = inputStr.count('k')  # find the "k"s
-        for keyN in range(nKeys):
-            start = inputStr.find('k')  # find the next key
-            stop = start + 6
-            # check we have that many characters(in case we read the buffer
-            # partway through output)
-            if len(inputStr) < stop:
-                inputStr += self.port.read(stop - len(inputStr))
-            keyString = inputStr[start:stop]
-            keyEvt = _KeyEvent(XID=keyString)
-            if keyEvt.key not in allowedKeys:
-                continue  # ignore this keyEvt and move on
-            if (downOnly == True and keyEvt.direction == 'up'):
-                continue  # ignore this keyEvt and move on
-
-            # we found a valid keyEvt
-            keys.append(keyEvt)
-            # remove the (1st occurrence of) string from the buffer
-            inputStr = inputStr.replace(keyString, '', 1)
+        keys = self.getKeyArray(allowedKeys=allowedKeys, downOnly=downOnly)
+        return [_KeyEvent.fromRecord(record) for record in keys]
 
-        return keys
+    def getKeyArray(self, allowedKeys=(1, 2, 3, 4, 5, 6, 7), downOnly=True):
+        """Like getKeyEvents, but returns the key events as a numpy
+        structured array (with fields key, down and rt in ms) rather than
+        as objects, which is much quicker when many events have built up
+        """
+        # add whatever has arrived to anything left over from last time
+        nToGet = self.port.inWaiting()
+        self._buffer += self.port.read(nToGet)
+        # decode all complete key frames
+        keys = _parseKeyFrames(self._buffer)
+        # ignore keys not asked for
+        valid = np.isin(keys['key'], allowedKeys)
+        if downOnly:
+            valid &= keys['down']
+        return keys[valid]
 
     def readMessage(self):
         """Read and return an unformatted string from the device
         (and delete this from the buffer)
         """
         nToGet = self.port.inWaiting()
-        return self.port.read(nToGet)
-
-    def measureRoundTrip(self):
+        # include anything left over from getKeyEvents
+        msg = bytes(self._buffer) + self.port.read(nToGet)
+        self._buffer.clear()
+        return msg
+
+    def _read(self, n, timeout):
+        """Read n bytes from the device (starting with anything left over
+        in our own buffer), waiting up to timeout (s) for them to arrive
+        without spinning. Returns fewer than n bytes on timeout
+        """
+        msg = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        if len(msg) < n and timeout > 0:
+            # let the serial port block until the rest arrives
+            portTimeout = self.port.timeout
+            self.port.timeout = timeout
+            try:
+                msg += self.port.read(n - len(msg))
+            finally:
+                self.port.timeout = portTimeout
+        return msg
+
+    def measureRoundTrip(self, timeout=1.0):
+        """Do a single round trip with the device, returning the round
+        trip time (ms) as measured by the device, or None if the device
+        didn't reply within timeout (s)
+        """
+        deadline = core.getTime() + timeout
         # round trip
         self.sendMessage(b'e4')  # start round trip
         # wait for 'X'
         while True:
-            if self.readMessage() == 'X':
+            reply = self._read(1, deadline - core.getTime())
+            if not reply:
+                return None
+            if reply == b'X':
                 break
         self.sendMessage(b'X')  # send it back
 
         # wait for final time info
-        msgBack = ''
-        while len(msgBack) == 0:
-            msgBack = self.readMessage()
-        tStr = msgBack[2:]
-        t = struct.unpack('H', tStr)[0]  # 2 bytes (an unsigned short)
+        msgBack = self._read(4, deadline - core.getTime())
+        if len(msgBack) < 4:
+            return None
+        tStr = msgBack[2:4]
+        t = struct.unpack('<H', tStr)[0]  # 2 bytes (an unsigned short)
         return t
 
+    def profileRoundTrip(self, n=100, timeout=1.0, file=None):
+        """Time n round trips with the device and summarise them, e.g. to
+        qualify a machine or USB hub before using it for an experiment.
+        If file is given, the time (s) of each round trip is written to it.
+
+        Returns a dict of round trip stats (s), see
+        psychopy_cedrus.latency.profileRoundTrips
+        """
+        from psychopy_cedrus.latency import profileRoundTrips
+
+        def _roundTrip(timeout):
+            return self.measureRoundTrip(timeout=timeout) is not None
+
+        return profileRoundTrips(_roundTrip, n=n, timeout=timeout, file=file)
+
     def waitKeyEvents(self, allowedKeys=(1, 2, 3, 4, 5, 6, 7), downOnly=True):
         """Like getKeyEvents, but waits until a key is pressed
         """
@@ -0,0 +1,160 @@
+from collections import deque
+from psychopy import core
+import numpy as np
+
+
+class ClockSync:
+    """
+    Model of the relationship between a Cedrus XID device's timer and the host clock
+    (psychopy.core.getTime), fitted as an offset plus a drift by linear regression over recent
+    sync samples.
+
+    Each sync sample is taken by querying the device timer several times and keeping the query
+    with the shortest round trip, taking the host time at the middle of that round trip as the
+    moment the device timer was read.
+
+    Parameters
+    ----------
+    window : int
+        Number of recent sync samples to fit the model to.
+    minSpan : int
+        Minimum spread (ms of device time) the samples must cover before drift is estimated.
+        Until then, the device timer is assumed to tick at exactly 1 ms per ms and only the offset
+        is fitted.
+    """
+    def __init__(self, window=32, minSpan=1000):
+        self.window = window
+        self.minSpan = minSpan
+        # recent (deviceTime, hostTime, roundTrip) samples
+        self.samples = deque(maxlen=window)
+        # fitted model as (offset, slope), for hostTime = offset + slope * deviceTime - replaced
+        # as a whole on each fit, so a thread mapping times never sees half of an update
+        self._model = (None, 0.001)
+
+    @property
+    def offset(self):
+        """
+        Host time (s) at which the device timer read 0, or None if not fitted.
+        """
+        return self._model[0]
+
+    @property
+    def slope(self):
+        """
+        Host time (s) per tick (ms) of the device timer.
+        """
+        return self._model[1]
+
+    @property
+    def isFitted(self):
+        """
+        True if there is enough data to map device times to host times.
+        """
+        return self._model[0] is not None
+
+    @property
+    def age(self):
+        """
+        Time (s) since the most recent sync sample was taken, or None if there are no samples.
+        """
+        if not self.samples:
+            return None
+
+        return core.getTime() - self.samples[-1][1]
+
+    def isStale(self, maxAge):
+        """
+        True if the model is unfitted or its most recent sample is older than `maxAge` seconds.
+        """
+        return not self.isFitted or self.age > maxAge
+
+    @property
+    def drift(self):
+        """
+        Rate (s per s) at which the device timer runs fast (+) or slow (-) relative to the host
+        clock.
+        """
+        return 1 / (self.slope * 1000) - 1
+
+    def measure(self, queryTimer, n=10):
+        """
+        Query the device timer `n` times and return the query with the shortest round trip.
+
+        Parameters
+        ----------
+        queryTimer : callable
+            Function which returns the device timer (ms), raising ConnectionError if the device's
+            reply isn't valid (such queries are skipped).
+        n : int
+            Number of queries to make.
+
+        Returns
+        -------
+        tuple[int, float, float] or None
+            Device time (ms), host time (s) at the midpoint of the round trip and the round trip
+            time (s), or None if no query got a valid reply.
+        """
+        best = None
+        for i in range(n):
+            t0 = core.getTime()
+            try:
+                deviceTime = queryTimer()
+            except ConnectionError:
+                continue
+            t1 = core.getTime()
+            # keep the query least affected by USB/serial latency
+            if best is None or t1 - t0 < best[2]:
+                best = (deviceTime, (t0 + t1) / 2, t1 - t0)
+
+        return best
+
+    def addSample(self, deviceTime, hostTime, roundTrip=0):
+        """
+        Add a sync sample and refit the model.
+
+        Parameters
+        ----------
+        deviceTime : int
+            Device timer value (ms).
+        hostTime : float
+            Host time (s) at which the device timer had that value.
+        roundTrip : float
+            Round trip time (s) of the query, kept for reference.
+        """
+        self.samples.append((deviceTime, hostTime, roundTrip))
+        self.fit()
+
+    def fit(self):
+        """
+        Fit offset and drift to the current samples.
+        """
+        if not self.samples:
+            self._model = (None, 0.001)
+            return
+        data = np.asarray(self.samples, dtype=float)
+        x, y = data[:, 0], data[:, 1]
+        # centre on the mean so the regression is well conditioned however long the session
+        xMean, yMean = x.mean(), y.mean()
+        dx = x - xMean
+        if x.max() - x.min() >= self.minSpan:
+            # enough spread to estimate drift
+            slope = float((dx * (y - yMean)).sum() / (dx * dx).sum())
+        else:
+            # otherwise assume the nominal rate
+            slope = 0.001
+        self._model = (float(yMean - slope * xMean), slope)
+
+    def toHost(self, deviceTime):
+        """
+        Map a device timer value (ms) to host time (s).
+        """
+        offset, slope = self._model
+
+        return offset + slope * deviceTime
+
+    def reset(self):
+        """
+        Discard all samples (e.g. after the device timer has been reset).
+        """
+        self.samples.clear()
+        self.fit()
@@ -0,0 +1,412 @@
+from struct import pack, unpack
+import time
+
+# timeouts (ms) which pyxid2 sets before every write, and so are in place whenever we read (D2XX
+# has no way to read back the current timeouts)
+PYXID2_TIMEOUTS = (100, 100)
+# name pyxid2's XidConnection keeps bytes of unfinished response packets under
+PYXID2_RESPONSE_BUFFER = "_XidConnection__response_buffer"
+
+
+def encodeCommand(command):
+    """
+    Get an XID command as bytes.
+
+    Parameters
+    ----------
+    command : str or bytes
+        Command, either as bytes or as a str (which is encoded as latin1, as by pyxid2).
+
+    Returns
+    -------
+    bytes
+        Command as bytes.
+    """
+    if isinstance(command, str):
+        command = command.encode("latin1")
+
+    return bytes(command)
+
+
+def responsePacketFormat(xid):
+    """
+    Get the first byte and the length of the response packets an XID device sends, which arrive
+    on the same connection as replies to commands.
+
+    Parameters
+    ----------
+    xid : pyxid2.XidDevice
+        Device to get the packet format of.
+
+    Returns
+    -------
+    tuple[bytes, int]
+        First byte and length of each packet.
+    """
+    # second generation StimTrackers send larger packets, with a selector for a port (as pyxid2)
+    if xid.product_id == b"S" and xid.major_fw_version == 2:
+        return b"o", 9
+
+    return b"k", 6
+
+
+def decodeResponsePacket(xid, packet):
+    """
+    Decode a response packet into a response dict, as pyxid2 would.
+
+    Parameters
+    ----------
+    xid : pyxid2.XidDevice
+        Device the packet came from.
+    packet : bytes
+        Packet, of the length given by `responsePacketFormat`.
+
+    Returns
+    -------
+    dict or None
+        Response dict with `port`, `key`, `pressed` and `time` (ms), or None if the bytes aren't
+        a valid response packet.
+    """
+    if responsePacketFormat(xid)[0] == b"o":
+        marker, port, key, pressed, deviceTime, null = unpack("<ccBcIB", packet)
+        if marker != b"o" or null != 0:
+            return None
+        resp = {'port': port, 'key': key, 'pressed': pressed == b"1", 'time': deviceTime}
+    else:
+        marker, params, deviceTime = unpack("<cBI", packet)
+        # bits 2 and 3 of the port are never set in a valid packet
+        if marker != b"k" or params & 0x0C:
+            return None
+        resp = {
+            'port': params & 0x0F,
+            'key': (params & 0xE0) >> 5,
+            'pressed': bool(params & 0x10),
+            'time': deviceTime,
+        }
+    # key 8 is sent as 0
+    if resp['key'] == 0:
+        resp['key'] = 8
+    # keys on port 0 (the buttons) are mapped to 0-based indices
+    if resp['port'] == 0:
+        keymap = getattr(xid, "keymap", None)
+        resp['key'] = keymap[resp['key']] if keymap is not None else resp['key'] - 1
+
+    return resp
+
+
+def writeRaw(con, data):
+    """
+    Write bytes to an XID connection.
+
+    This goes through pyxid2, which writes one byte at a time with a 1 ms pause after each, as
+    XID devices aren't guaranteed to keep up with commands written any faster.
+
+    Parameters
+    ----------
+    con : pyxid2.XidConnection
+        Connection to write to.
+    data : bytes
+        Bytes to write.
+
+    Returns
+    -------
+    int
+        Number of bytes written.
+    """
+    if not data:
+        return 0
+
+    return con.write_bytes(data)
+
+
+def readRaw(con, n, timeout=0.1):
+    """
+    Read bytes from an XID connection, waiting at most `timeout` for them to arrive.
+
+    Parameters
+    ----------
+    con : pyxid2.XidConnection
+        Connection to read from.
+    n : int
+        Number of bytes to read.
+    timeout : float
+        Maximum time (s) to wait for all `n` bytes.
+
+    Returns
+    -------
+    bytes
+        Bytes read, which may be fewer than `n` if the timeout was reached.
+    """
+    ftdi = getattr(con, "ftd2xx_con", None)
+    if ftdi is None:
+        return con.read(n)
+    ftdi.setTimeouts(max(int(timeout * 1000), 1), 100)
+    try:
+        return ftdi.read(n)
+    finally:
+        # put back the timeouts pyxid2 expects
+        ftdi.setTimeouts(*PYXID2_TIMEOUTS)
+
+
+class CommandBatch:
+    """
+    Queue of XID commands for a device, sent together in a single write with any replies read
+    back together afterwards. Usually made by `BaseXidDevice.batchCommands`, e.g.::
+
+        with device.batchCommands() as batch:
+            batch.setEnableUsbOutput("A", True)
+            batch.setThreshold("A", 50)
+
+    Parameters
+    ----------
+    device : BaseXidDevice
+        Device to send commands to.
+    timeout : float
+        Maximum time (s) to wait for the device to reply once the commands are sent.
+    """
+    def __init__(self, device, timeout=0.1):
+        self.device = device
+        self.timeout = timeout
+        # queued (command, replyLength, expect) tuples
+        self.commands = []
+        # settings the queued commands apply, by (kind, selector), recorded once they're sent
+        self.updates = {}
+        # time (s) for the device to settle after the commands are sent
+        self.settle = 0
+
+    def __len__(self):
+        return len(self.commands)
+
+    def add(self, command, replyLength=0, expect=None, settle=0):
+        """
+        Queue a command.
+
+        Parameters
+        ----------
+        command : str or bytes
+            Command to send.
+        replyLength : int
+            Number of bytes the device sends in reply to this command.
+        expect : bytes or None
+            What the reply should start with, or None to accept any reply.
+        settle : float
+            Time (s) the device needs after this command before it's ready, e.g. for a light
+            sensor to settle on a new threshold. The batch waits for the longest of these once
+            all commands are sent.
+        """
+        self.commands.append((encodeCommand(command), replyLength, expect))
+        self.settle = max(self.settle, settle)
+
+    def _isSet(self, kind, selector, value):
+        """
+        True if the given setting will have the given value once this batch is sent.
+        """
+        if (kind, selector) in self.updates:
+            return self.updates[(kind, selector)] == value
+
+        return self.device.settings.isSet(kind, selector, value)
+
+    def setThreshold(self, selector, level, confirm=True, settle=0.03, force=False):
+        """
+        Queue a command setting the threshold of a light sensor or sound sensor.
+
+        Parameters
+        ----------
+        selector : str
+            Selector of the sensor (e.g. "A").
+        level : int
+            Threshold level (0-255), as sent to the device.
+        confirm : bool
+            If True, read the threshold back from the device, so the batch finishes as soon as
+            the device confirms it's been set (and raises an error if it hasn't).
+        settle : float
+            Time (s) to wait for the sensor to settle on the new threshold, if it isn't being
+            confirmed (or the device can't confirm it, as on XID 1).
+        force : bool
+            If True, send the command even if the device is known to already have this
+            threshold.
+        """
+        # skip if it wouldn't change anything
+        if not force and self._isSet("thresholds", selector, level):
+            return
+        self.updates[("thresholds", selector)] = level
+        selector = selector.encode("latin1")
+        self.add(b"it" + selector + bytes([level]))
+        if confirm and self.device._isXid2:
+            # device replies with the threshold it's now using
+            self.add(b"_it" + selector, replyLength=5, expect=b"_it" + selector + bytes([level]))
+        else:
+            self.settle = max(self.settle, settle)
+
+    def setSignalFilter(self, selector, holdOn, holdOff, force=False):
+        """
+        Queue a command setting the signal filter (debounce) of a selector.
+
+        Parameters
+        ----------
+        selector : str
+            Selector to filter (e.g. "K").
+        holdOn : int
+            Time (ms) a signal must be on for before it's reported.
+        holdOff : int
+            Time (ms) a signal must be off for before it's reported.
+        force : bool
+            If True, send the command even if the device is known to already have this filter.
+        """
+        # only supported from XID 2 (as in pyxid2)
+        if not self.device._isXid2:
+            return
+        # skip if it wouldn't change anything
+        if not force and self._isSet("signalFilters", selector, (holdOn, holdOff)):
+            return
+        self.updates[("signalFilters", selector)] = (holdOn, holdOff)
+        self.add(pack("<cccII", b"i", b"f", selector.encode("latin1"), holdOn, holdOff))
+
+    def setEnableUsbOutput(self, selector, enable, force=False):
+        """
+        Queue a command enabling or disabling USB output from a selector.
+
+        Parameters
+        ----------
+        selector : str
+            Selector to enable (e.g. "A").
+        enable : bool
+            True to enable, False to disable.
+        force : bool
+            If True, send the command even if the selector is known to already be in this state.
+        """
+        # only supported from XID 2 (as in pyxid2)
+        if not self.device._isXid2:
+            return
+        # skip if it wouldn't change anything
+        if not force and self._isSet("usbOutputs", selector, bool(enable)):
+            return
+        self.updates[("usbOutputs", selector)] = bool(enable)
+        self.add("iu%s%s" % (selector, "1" if enable else "0"))
+
+    def send(self):
+        """
+        Send all queued commands in one write, then read all of their replies.
+
+        Returns
+        -------
+        list[bytes]
+            Reply to each command (empty for commands with no reply).
+
+        Raises
+        ------
+        ConnectionError
+            If the device didn't send all the replies expected, or a reply wasn't as expected.
+        """
+        commands, self.commands = self.commands, []
+        updates, self.updates = self.updates, {}
+        settle, self.settle = self.settle, 0
+        if not commands:
+            return []
+        try:
+            replies = self._exchange(commands)
+        except Exception:
+            # if anything went wrong, the device may be in any state
+            self.device.settings.clear()
+            raise
+        # only now are the settings known to be applied
+        for (kind, selector), value in updates.items():
+            self.device.settings.update(kind, selector, value)
+        # give the device time to settle
+        if settle:
+            time.sleep(settle)
+
+        return replies
+
+    def _exchange(self, commands):
+        """
+        Write the given commands in one write and read back and check their replies.
+        """
+        xid = self.device.xid
+        with self.device.lock:
+            # connections which share a device between processes exchange commands themselves
+            exchange = getattr(xid.con, "exchangeCommands", None)
+            if exchange is not None:
+                return exchange(commands, timeout=self.timeout)
+            self._finishPacket()
+            writeRaw(xid.con, b"".join(command for command, replyLength, expect in commands))
+            return self._readReplies(commands)
+
+    def _finishPacket(self):
+        """
+        Wait for pyxid2 to finish reading any response packet it has only read the start of, as
+        the rest of it would otherwise be taken for (the start of) a reply.
+        """
+        xid = self.device.xid
+        # pyxid2 keeps bytes of unfinished packets in a private buffer
+        if not hasattr(xid.con, PYXID2_RESPONSE_BUFFER):
+            # connections which don't come from pyxid2 (e.g. simulated ones) have nothing to finish
+            if type(xid.con).__module__.startswith("pyxid2"):
+                raise AttributeError(
+                    f"pyxid2's XidConnection has no attribute {PYXID2_RESPONSE_BUFFER}, so "
+                    f"unfinished response packets can't be told apart from command replies. "
+                    f"This version of pyxid2 isn't supported."
+                )
+            return
+        deadline = time.perf_counter() + self.timeout
+        while getattr(xid.con, PYXID2_RESPONSE_BUFFER) and time.perf_counter() < deadline:
+            xid.poll_for_response()
+
+    def _readReplies(self, commands):
+        """
+        Read the reply to each of the given commands, passing on any response packets which
+        arrive in among them for pyxid2 to hand over as usual.
+        """
+        xid = self.device.xid
+        marker, packetSize = responsePacketFormat(xid)
+        deadline = time.perf_counter() + self.timeout
+        buffer = b""
+        # response packets found in among replies
+        responses = []
+
+        def _fill(n):
+            # read until there are at least n bytes, or time's up
+            nonlocal buffer
+            while len(buffer) < n:
+                data = readRaw(
+                    xid.con, n - len(buffer), timeout=max(deadline - time.perf_counter(), 0)
+                )
+                if not data:
+                    return False
+                buffer += data
+            return True
+
+        replies = []
+        try:
+            for command, replyLength, expect in commands:
+                if not replyLength:
+                    replies.append(b"")
+                    continue
+                # pass over any response packets sent before the reply
+                while _fill(1) and buffer[:1] == marker and not (
+                    expect is not None and buffer.startswith(expect[:1])
+                ):
+                    if not _fill(packetSize):
+                        break
+                    resp = decodeResponsePacket(xid, buffer[:packetSize])
+                    if resp is None:
+                        break
+                    responses.append(resp)
+                    buffer = buffer[packetSize:]
+                if not _fill(replyLength):
+                    raise ConnectionError(
+                        f"Expected {replyLength} bytes in reply to {command!r} to "
+                        f"{type(self.device).__name__}@{self.device.index}, got {len(buffer)}"
+                    )
+                reply, buffer = bytes(buffer[:replyLength]), buffer[replyLength:]
+                if expect is not None and not reply.startswith(expect):
+                    raise ConnectionError(
+                        f"Unexpected reply {reply!r} to command {command!r} to "
+                        f"{type(self.device).__name__}@{self.device.index}"
+                    )
+                replies.append(reply)
+        finally:
+            # responses are picked up from pyxid2's queue by the next poll, in the order they came
+            xid.response_queue.extend(responses)
+
+        return replies
@@ -0,0 +1,195 @@
+"""
+Helpers for finding connected Cedrus XID devices, including an on-disk cache of the last
+enumeration so that devices can be reopened without scanning every serial port.
+"""
+
+from pathlib import Path
+from psychopy import logging
+import json
+
+
+def defaultCacheFile():
+    """
+    Get the default location for the device cache file, in the PsychoPy user preferences folder.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the cache file.
+    """
+    from psychopy import prefs
+
+    return Path(prefs.paths['userPrefsDir']) / "psychopy-cedrus" / "devices.json"
+
+
+def scanDevices():
+    """
+    Scan all serial ports for XID devices (slow, as each port is tried at several baud rates).
+
+    Returns
+    -------
+    list[pyxid2.XidDevice]
+        All XID devices found.
+    """
+    import pyxid2
+
+    return pyxid2.get_xid_devices()
+
+
+def getSerial(device):
+    """
+    Get the USB serial number of an open XID device, without sending it any commands.
+
+    Parameters
+    ----------
+    device : pyxid2.XidDevice
+        Device to get the serial number of.
+
+    Returns
+    -------
+    str or None
+        Serial number, or None if it couldn't be read.
+    """
+    # simulated devices know their own serial number
+    if isinstance(getattr(device, "serial", None), str):
+        return device.serial
+    try:
+        import ftd2xx
+        detail = ftd2xx.getDeviceInfoDetail(device.con.ftd2xx_index, update=False)
+        return detail['serial'].decode("latin1")
+    except Exception as err:
+        logging.debug(f"Could not get serial number of {device}: {err}")
+        return None
+
+
+def describeDevice(device):
+    """
+    Get a JSON-safe description of an open XID device, from which it can be reopened.
+
+    Parameters
+    ----------
+    device : pyxid2.XidDevice
+        Device to describe.
+
+    Returns
+    -------
+    dict
+        Dict with the device's FTDI `index`, `baudrate`, USB `serial`, `productId` and `name`.
+    """
+    return {
+        'index': device.con.ftd2xx_index,
+        'baudrate': device.con.baudrate,
+        'serial': getSerial(device),
+        'productId': device.product_id.decode("latin1"),
+        'name': device.device_name,
+    }
+
+
+def saveDeviceCache(file, devices):
+    """
+    Write a description of the given devices to a cache file.
+
+    Parameters
+    ----------
+    file : str or pathlib.Path
+        File to write to.
+    devices : list[pyxid2.XidDevice]
+        Devices to describe.
+    """
+    file = Path(file)
+    try:
+        profiles = [describeDevice(device) for device in devices]
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(json.dumps(profiles, indent=2))
+    except Exception as err:
+        # a failed cache write shouldn't stop the experiment, it'll just mean a rescan next time
+        logging.warning(f"Could not write Cedrus device cache to {file}: {err}")
+
+
+def loadDeviceCache(file):
+    """
+    Reopen the devices described in a cache file, checking that each is still the same device.
+
+    Parameters
+    ----------
+    file : str or pathlib.Path
+        File to read from.
+
+    Returns
+    -------
+    list[pyxid2.XidDevice] or None
+        Reopened devices, or None if the cache is missing or out of date (in which case a full
+        scan is needed).
+    """
+    file = Path(file)
+    if not file.is_file():
+        return None
+    try:
+        profiles = json.loads(file.read_text())
+    except (OSError, ValueError) as err:
+        logging.debug(f"Could not read Cedrus device cache from {file}: {err}")
+        return None
+    # a cache of no devices isn't worth trusting, as something may have been plugged in since
+    if not profiles:
+        return None
+
+    import ftd2xx
+    # number of FTDI devices can be counted without opening any ports
+    try:
+        nConnected = ftd2xx.createDeviceInfoList()
+    except Exception as err:
+        logging.debug(f"Could not list FTDI devices: {err}")
+        return None
+    if nConnected < len(profiles):
+        return None
+    # reopen each device
+    devices = []
+    for profile in profiles:
+        try:
+            device = _openProfile(profile)
+        except Exception as err:
+            logging.debug(f"Could not reopen cached Cedrus device {profile}: {err}")
+            device = None
+        if device is None:
+            # close any already opened before rescanning
+            for opened in devices:
+                opened.con.close()
+            return None
+        devices.append(device)
+
+    return devices
+
+
+def _openProfile(profile):
+    """
+    Open the device described by a single cache entry, or return None if the device at that port
+    is not the one described.
+    """
+    import ftd2xx
+    import pyxid2
+    # check the USB serial at this index before opening anything
+    detail = ftd2xx.getDeviceInfoDetail(profile['index'], update=False)
+    if detail['serial'].decode("latin1") != profile['serial']:
+        return None
+    # open connection at the known baud rate
+    con = pyxid2.XidConnection(profile['index'], profile['baudrate'])
+    if not con.open():
+        return None
+    con.flush()
+    # make sure it's (still) an XID device
+    reply = con.send_xid_command("_c1", 5).decode("latin1")
+    if not reply.startswith("_xid"):
+        con.close()
+        return None
+    # set it to XID mode if needed, as a full scan would
+    if reply != "_xid0":
+        con.send_xid_command("c10")
+        con.flush()
+    # initialise device
+    device = pyxid2.XidDevice(con)
+    if device.product_id.decode("latin1") != profile['productId']:
+        con.close()
+        return None
+    device.reset_timer()
+
+    return device
@@ -0,0 +1,139 @@
+import numpy as np
+
+
+class MessageHistory:
+    """
+    Fixed-capacity record of responses received from a Cedrus XID device, stored in a NumPy
+    structured array so that memory use stays flat however long a session runs.
+
+    Each record has the following fields:
+        time : int64
+            Device timestamp (ms) as reported by the XID device.
+        port : uint8
+            Port the response came from. On devices which report a selector (e.g. StimTracker 2),
+            this is the ASCII code of the selector (so b"K" is stored as 75).
+        key : uint8
+            Key the response came from.
+        pressed : bool
+            True for a press/onset, False for a release/offset.
+        hostTime : float64
+            Time (s, on psychopy.core's clock) at which the response was received by the host.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of records to keep. Once full, each new record replaces the oldest one and
+        increments `overflow`.
+    """
+    dtype = np.dtype([
+        ('time', np.int64),
+        ('port', np.uint8),
+        ('key', np.uint8),
+        ('pressed', np.bool_),
+        ('hostTime', np.float64),
+    ])
+
+    def __init__(self, capacity=100000):
+        self.capacity = int(capacity)
+        # every record is written twice, `capacity` apart, so that the most recent `capacity`
+        # records are always one contiguous slice of this array
+        self._data = np.zeros(self.capacity * 2, dtype=self.dtype)
+        # total number of records ever appended
+        self._total = 0
+        # number of records discarded to make room for new ones
+        self.overflow = 0
+
+    def __len__(self):
+        return min(self._total, self.capacity)
+
+    def append(self, time, port, key, pressed, hostTime=np.nan):
+        """
+        Add a record to the history.
+
+        Parameters
+        ----------
+        time : int
+            Device timestamp (ms).
+        port : int or bytes
+            Port the response came from, either as an int or as a selector byte.
+        key : int
+            Key the response came from.
+        pressed : bool
+            True for a press/onset, False for a release/offset.
+        hostTime : float
+            Host receive time (s).
+        """
+        # store selectors by their character code
+        if isinstance(port, bytes):
+            port = port[0]
+        # count overwritten records
+        if self._total >= self.capacity:
+            self.overflow += 1
+        # write to both halves
+        i = self._total % self.capacity
+        record = (time, port, key, pressed, hostTime)
+        self._data[i] = record
+        self._data[i + self.capacity] = record
+        self._total += 1
+
+    def clear(self):
+        """
+        Remove all records (the overflow counter is kept).
+        """
+        self._total = 0
+
+    @property
+    def records(self):
+        """
+        All retained records, oldest first, as a read-only view (no copy is made, so the view
+        should not be held on to while more responses are being appended).
+        """
+        n = len(self)
+        start = (self._total - n) % self.capacity
+        view = self._data[start:start + n]
+        view.flags.writeable = False
+
+        return view
+
+    def query(self, start=None, stop=None, port=None, key=None):
+        """
+        Get the records within a time window, optionally filtered by port and key.
+
+        The window is found by bisecting the (sorted) time column, so when no port or key is given
+        the result is a view onto the history rather than a copy. Filtering by port or key
+        requires a copy.
+
+        Parameters
+        ----------
+        start : int or None
+            Earliest device time (ms) to include, or None to start from the oldest record.
+        stop : int or None
+            Device time (ms) to stop before, or None to go up to the newest record.
+        port : int, bytes, str or None
+            Only include records from this port (or selector), or None to include all ports.
+        key : int or None
+            Only include records from this key, or None to include all keys.
+
+        Returns
+        -------
+        numpy.ndarray
+            Structured array of matching records, with fields `time`, `port`, `key`, `pressed`
+            and `hostTime` (so e.g. `result['time']` gives the times as a column).
+        """
+        records = self.records
+        # bisect time column to find window
+        times = records['time']
+        i0 = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        i1 = len(records) if stop is None else int(np.searchsorted(times, stop, side="left"))
+        records = records[i0:i1]
+        # filter by port and key
+        if port is not None:
+            if isinstance(port, str):
+                port = port.encode()
+            if isinstance(port, bytes):
+                port = port[0]
+            records = records[records['port'] == port]
+        if key is not None:
+            records = records[records['key'] == key]
+
+        return records
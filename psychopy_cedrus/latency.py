@@ -0,0 +1,148 @@
+import numpy as np
+import time
+
+
+class RollingSamples:
+    """
+    The most recent `window` values of some measurement, kept in a preallocated ring.
+
+    Parameters
+    ----------
+    window : int
+        Number of values to keep.
+    """
+    def __init__(self, window=10000):
+        self.window = int(window)
+        self._data = np.zeros(self.window, dtype=np.float64)
+        # total number of values ever added
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def add(self, value):
+        self._data[self.count % self.window] = value
+        self.count += 1
+
+    @property
+    def values(self):
+        """
+        Values currently in the window (not in order of arrival).
+        """
+        return self._data[:len(self)]
+
+    def getStats(self, bins=20):
+        """
+        Summarise the values currently in the window.
+
+        Parameters
+        ----------
+        bins : int or list[float]
+            Number of histogram bins, or the bin edges (s), as taken by `numpy.histogram`.
+
+        Returns
+        -------
+        dict
+            Number of values (`n`), `mean`, `min`, `p50`, `p99` and `max` (s), along with
+            `histogram` counts and bin `edges`.
+        """
+        values = self.values
+        if not len(values):
+            return {'n': 0}
+        counts, edges = np.histogram(values, bins=bins)
+
+        return {
+            'n': len(values),
+            'mean': float(values.mean()),
+            'min': float(values.min()),
+            'p50': float(np.percentile(values, 50)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max()),
+            'histogram': counts.tolist(),
+            'edges': edges.tolist(),
+        }
+
+
+class LatencyMonitor:
+    """
+    Rolling record of the latencies of responses from a Cedrus XID device:
+
+        deviceToHost
+            Time from a response happening (its device timestamp, mapped into host time by clock
+            sync) to it being read by the host - i.e. USB/serial buffering plus time waiting to
+            be polled.
+        dispatchDelay
+            Time from a response being read by the host to a node's `receiveMessage` being
+            called with it - i.e. time waiting in the reader's buffer plus the plugin's own
+            decoding and dispatch.
+
+    Parameters
+    ----------
+    window : int
+        Number of recent responses to keep latencies for.
+    """
+    def __init__(self, window=10000):
+        self.deviceToHost = RollingSamples(window)
+        self.dispatchDelay = RollingSamples(window)
+
+    def getStats(self, bins=20):
+        """
+        Summarise recent latencies, see `RollingSamples.getStats`.
+        """
+        return {
+            'deviceToHost': self.deviceToHost.getStats(bins=bins),
+            'dispatchDelay': self.dispatchDelay.getStats(bins=bins),
+        }
+
+
+def profileRoundTrips(roundTrip, n=100, timeout=1.0, file=None):
+    """
+    Time repeated round trips to a device and summarise them, e.g. to qualify a machine or USB
+    hub before using it for an experiment.
+
+    Parameters
+    ----------
+    roundTrip : callable
+        Function which does a single round trip to the device, taking the maximum time (s) to
+        wait for a reply and returning False if no reply came.
+    n : int
+        Number of round trips to do.
+    timeout : float
+        Maximum time (s) each round trip may take before it's counted as timed out.
+    file : str or pathlib.Path or None
+        File to write the time (s) of each completed round trip to, one per line, or None to
+        not write them anywhere.
+
+    Returns
+    -------
+    dict
+        Number of completed round trips (`n`) and `timeouts`, along with the `min`, `median`,
+        `p99`, `max` and `mean` round trip time and its `jitter` (standard deviation), in s.
+    """
+    samples = []
+    timeouts = 0
+    for i in range(n):
+        t0 = time.perf_counter()
+        replied = roundTrip(timeout)
+        t1 = time.perf_counter()
+        if not replied or t1 - t0 > timeout:
+            timeouts += 1
+            continue
+        samples.append(t1 - t0)
+    samples = np.asarray(samples, dtype=np.float64)
+    # save samples if requested
+    if file is not None:
+        np.savetxt(file, samples, fmt="%.9f", header="round trip time (s)")
+    if not len(samples):
+        return {'n': 0, 'timeouts': timeouts}
+
+    return {
+        'n': len(samples),
+        'timeouts': timeouts,
+        'min': float(samples.min()),
+        'median': float(np.median(samples)),
+        'p99': float(np.percentile(samples, 99)),
+        'max': float(samples.max()),
+        'mean': float(samples.mean()),
+        'jitter': float(samples.std()),
+    }
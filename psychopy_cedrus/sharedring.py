@@ -0,0 +1,223 @@
+"""
+Ring of fixed-size response records in shared memory, which a Cedrus XID device writes to (see
+`BaseXidDevice.shareResponses`) and any number of other processes read from, each with its own
+cursor, without copying or deserialising anything. For example, to compute frame timing from a
+light sensor live in an analysis process::
+
+    # experiment process
+    ring = device.shareResponses(name="cedrus-responses")
+
+    # analysis process
+    from psychopy_cedrus.sharedring import SharedResponseReader
+    reader = SharedResponseReader("cedrus-responses")
+    while True:
+        records = reader.read()
+        onsets = records['syncedTime'][(records['port'] == ord("A")) & records['pressed']]
+        ...
+
+There is a single writer, which fills a record and only then moves the ring's head past it, so
+readers need no locking. Readers which fall more than the ring's capacity behind lose the oldest
+records (counted in `dropped`).
+"""
+
+from multiprocessing import shared_memory
+from psychopy_cedrus.history import MessageHistory
+import numpy as np
+
+
+# identifies memory laid out as a response ring
+_magic = 0x43445852494e4731
+# header fields (int64 each): magic, capacity, total records written, record size
+_headerFields = 4
+# records start on their own cache line, away from the head which the writer keeps moving
+_headerSize = 64
+
+# names of rings created by this process (see _attach)
+_created = set()
+
+
+def _attach(name):
+    """
+    Attach to existing shared memory without this process taking ownership of it.
+    """
+    try:
+        # Python 3.13+
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    # otherwise this process's resource tracker would unlink the memory when it exits, unless it
+    # created it in the first place
+    if name not in _created:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    return shm
+
+
+class SharedResponseRing:
+    """
+    Writer side of a ring of response records in shared memory.
+
+    Each record has the fields of `psychopy_cedrus.history.MessageHistory`, with host times on
+    the `time.perf_counter` timeline (which, unlike psychopy.core.getTime, has the same zero in
+    every process), plus:
+        syncedTime : float64
+            Device time mapped onto the same timeline by clock sync, or NaN if the device wasn't
+            synchronised when the response was received.
+
+    Parameters
+    ----------
+    name : str or None
+        Name of the shared memory, for readers to attach to, or None to make one up.
+    capacity : int
+        Number of records the ring holds.
+    """
+    dtype = np.dtype(MessageHistory.dtype.descr + [('syncedTime', np.float64)], align=True)
+
+    def __init__(self, name=None, capacity=65536):
+        self.capacity = int(capacity)
+        # every record is written twice, `capacity` apart, so that any run of up to `capacity`
+        # records is one contiguous slice and can be read without copying
+        size = _headerSize + self.capacity * 2 * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self.shm.name
+        _created.add(self.name)
+        self._header = np.ndarray((_headerFields,), dtype=np.int64, buffer=self.shm.buf)
+        self._records = np.ndarray(
+            (self.capacity * 2,), dtype=self.dtype, buffer=self.shm.buf, offset=_headerSize
+        )
+        self._header[:] = (_magic, self.capacity, 0, self.dtype.itemsize)
+
+    def __repr__(self):
+        return f"<SharedResponseRing {self.name!r} ({self.total} records written)>"
+
+    @property
+    def total(self):
+        """
+        Total number of records ever written.
+        """
+        return int(self._header[2])
+
+    def write(self, time, port, key, pressed, hostTime=np.nan, syncedTime=np.nan):
+        """
+        Add a record to the ring.
+
+        Parameters
+        ----------
+        time : int
+            Device timestamp (ms).
+        port : int or bytes
+            Port the response came from, either as an int or as a selector byte.
+        key : int
+            Key the response came from.
+        pressed : bool
+            True for a press/onset, False for a release/offset.
+        hostTime : float
+            Host receive time (s, on the `time.perf_counter` timeline).
+        syncedTime : float
+            Device time mapped onto the `time.perf_counter` timeline (s).
+        """
+        # store selectors by their character code
+        if isinstance(port, bytes):
+            port = port[0]
+        total = int(self._header[2])
+        i = total % self.capacity
+        record = (time, port, key, pressed, hostTime, syncedTime)
+        self._records[i] = record
+        self._records[i + self.capacity] = record
+        # only publish the record once it's fully written
+        self._header[2] = total + 1
+
+    def close(self, unlink=True):
+        """
+        Detach from the shared memory and (by default) free it. Readers which are still attached
+        keep their view of it until they close too.
+        """
+        self._header = self._records = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        _created.discard(self.name)
+
+
+class SharedResponseReader:
+    """
+    Reader side of a ring of response records in shared memory, see `SharedResponseRing`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the ring's shared memory.
+    fromStart : bool
+        If True, start from the oldest record still in the ring, rather than only reading records
+        written from now on.
+    """
+    def __init__(self, name, fromStart=False):
+        self.name = name
+        self.shm = _attach(name)
+        self._header = np.ndarray((_headerFields,), dtype=np.int64, buffer=self.shm.buf)
+        magic, capacity, total, itemsize = (int(value) for value in self._header)
+        if magic != _magic or itemsize != SharedResponseRing.dtype.itemsize:
+            self.shm.close()
+            raise ValueError(f"Shared memory {name!r} is not a Cedrus response ring")
+        self.capacity = capacity
+        self._records = np.ndarray(
+            (capacity * 2,), dtype=SharedResponseRing.dtype, buffer=self.shm.buf,
+            offset=_headerSize
+        )
+        # number of records this reader has read (or skipped)
+        self.cursor = max(total - capacity, 0) if fromStart else total
+        # number of records lost by falling too far behind
+        self.dropped = 0
+
+    def __repr__(self):
+        return f"<SharedResponseReader {self.name!r} ({self.available} records waiting)>"
+
+    @property
+    def available(self):
+        """
+        Number of records written since this reader last read (including any lost to overrun).
+        """
+        return int(self._header[2]) - self.cursor
+
+    def read(self, maxRecords=None):
+        """
+        Get the records written since the last read.
+
+        The result is a read-only view onto the shared memory rather than a copy, so it's only
+        valid until the writer has written another `capacity` records and should be copied if it
+        needs keeping any longer.
+
+        Parameters
+        ----------
+        maxRecords : int or None
+            Maximum number of records to get, or None to get all of them.
+
+        Returns
+        -------
+        numpy.ndarray
+            Structured array of records, oldest first, with the fields of
+            `SharedResponseRing.dtype`.
+        """
+        total = int(self._header[2])
+        # skip past any records which have been overwritten
+        if total - self.cursor > self.capacity:
+            self.dropped += total - self.cursor - self.capacity
+            self.cursor = total - self.capacity
+        n = total - self.cursor
+        if maxRecords is not None:
+            n = min(n, maxRecords)
+        start = self.cursor % self.capacity
+        view = self._records[start:start + n]
+        view.flags.writeable = False
+        self.cursor += n
+
+        return view
+
+    def close(self):
+        """
+        Detach from the shared memory (any views got from `read` become invalid).
+        """
+        self._header = self._records = None
+        self.shm.close()
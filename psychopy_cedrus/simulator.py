@@ -0,0 +1,490 @@
+"""
+Simulated Cedrus XID devices, implementing the same interface as `pyxid2.XidDevice` so that
+the device classes in this package can be used (and tested, and benchmarked) without any
+hardware connected.
+
+Simulated devices can be given to a device class directly::
+
+    from psychopy_cedrus.rb import RBDevice
+    from psychopy_cedrus.simulator import SimulatedXidDevice
+
+    pad = RBDevice(xid=SimulatedXidDevice(productId=b"2"))
+
+or installed in place of the connected devices, so that they're found by `getAvailableDevices`,
+DeviceManager and Builder::
+
+    from psychopy_cedrus import simulator
+    simulator.installSimulatedDevices([simulator.SimulatedXidDevice(productId=b"S")])
+"""
+
+from psychopy_cedrus.commands import responsePacketFormat, decodeResponsePacket
+from struct import pack, unpack
+import bisect
+import itertools
+import random
+import time
+
+
+# used to give each simulated device a unique serial number
+_serialNumbers = itertools.count()
+
+# names pyxid2 gives to each product ID
+productNames = {
+    b"0": "Cedrus Lumina 3G",
+    b"1": "Cedrus SV-1 Voice Key",
+    b"2": "Cedrus RB-740",
+    b"4": "Cedrus C-POD",
+    b"5": "Riponda Model L",
+    b"S": "Cedrus StimTracker Quad",
+}
+
+
+class SimulatedXidConnection:
+    """
+    Stands in for `pyxid2.XidConnection`, answering commands on behalf of a SimulatedXidDevice.
+
+    Parameters
+    ----------
+    device : SimulatedXidDevice
+        Device this connection belongs to.
+    index : int
+        Index to report as the FTDI index of this connection.
+    """
+    def __init__(self, device, index=0):
+        self.device = device
+        self.ftd2xx_index = index
+        self.baudrate = 115200
+        # record of all commands sent, as bytes
+        self.sent = []
+
+    def open(self):
+        return True
+
+    def close(self):
+        return True
+
+    def flush(self, mask=0):
+        pass
+
+    def write(self, command):
+        return self.write_bytes(command.encode("latin1"))
+
+    def write_bytes(self, command):
+        self.device._wait()
+        self.sent.append(bytes(command))
+        self.device._handleCommand(bytes(command))
+
+        return len(command)
+
+    def read(self, bytes_to_read):
+        return self.device._read(bytes_to_read)
+
+    def send_xid_command(self, command, bytes_expected=0):
+        self.write(command)
+
+        return self.read(bytes_expected)
+
+    def send_xid_byte_command(self, command, bytes_expected=0):
+        self.write_bytes(command)
+
+        return self.read(bytes_expected)
+
+
+class SimulatedXidDevice:
+    """
+    Pure-Python simulation of a Cedrus XID device, with the same interface as
+    `pyxid2.XidDevice`.
+
+    Responses can be added by hand (`addResponse`, `addBurst`) or generated at random
+    (`setEventRate`). Each response is sent as a packet once the device time it's stamped with has
+    passed, plus `latency`. As on a real device, packets share the wire with replies to
+    commands, in the order they were sent. As with pyxid2, each call to `poll_for_response`
+    takes at most one packet off the wire, and unparseable bytes (such as an unread reply) make
+    it flush the wire.
+
+    Parameters
+    ----------
+    productId : bytes
+        Product ID to report (b"0" Lumina, b"2" RB, b"5" Riponda, b"S" StimTracker).
+    modelId : bytes
+        Model ID to report.
+    majorFirmware : int
+        Major firmware version to report. On version 2 StimTrackers, responses come with their
+        selector (e.g. b"K") as their port, as they do from real devices.
+    name : str or None
+        Device name, or None to use a default name for the product ID.
+    serial : str or None
+        USB serial number to report, or None to make one up.
+    latency : float
+        Time (s) each command to the device takes, and the delay between a response happening
+        and becoming available to read, to simulate USB/serial latency.
+    clockRate : float
+        Rate at which the device timer runs relative to the host clock, to simulate drift (e.g.
+        1.0001 for a timer running 100ppm fast).
+    seed : int or None
+        Seed for randomly generated responses.
+    index : int
+        Index to report as the FTDI index of this device.
+    """
+    def __init__(
+        self, productId=b"2", modelId=b"2", majorFirmware=2, name=None, serial=None,
+        latency=0.0, clockRate=1.0, seed=None, index=0
+    ):
+        self.product_id = productId
+        self.model_id = modelId
+        self.major_fw_version = majorFirmware
+        self.device_name = name or productNames.get(productId, "Simulated XID device")
+        self.serial = serial or f"SIM{next(_serialNumbers):05d}"
+        self.keymap = None
+        self.latency = latency
+        self.clockRate = clockRate
+        self.con = SimulatedXidConnection(self, index=index)
+        # responses which have been decoded, ready to be got
+        self.response_queue = []
+        # responses which are yet to arrive, as (device time ms, order added, response), sorted
+        self._pending = []
+        self._order = itertools.count()
+        # bytes sent by the device (replies to commands and response packets) yet to be read
+        self._wire = b""
+        # number of times poll_for_response found unparseable bytes and flushed the wire
+        self.flushes = 0
+        # settings applied by commands
+        self.signalFilters = {}
+        self.usbOutputs = {}
+        self.thresholds = {}
+        # random response generation
+        self._random = random.Random(seed)
+        self._generators = []
+        # start timer
+        self._zero = time.perf_counter()
+
+    def __repr__(self):
+        return f'<SimulatedXidDevice "{self.device_name}">'
+
+    @property
+    def usesSelectors(self):
+        """
+        True if this device reports responses with a selector (e.g. b"K") as their port.
+        """
+        return self.product_id == b"S" and self.major_fw_version == 2
+
+    # --- simulation controls ---
+
+    @property
+    def hasUnread(self):
+        """
+        True if the device has anything (responses, or replies to commands) still to be read.
+        """
+        return bool(self._pending or self._wire)
+
+    def getDeviceTime(self):
+        """
+        Current value (ms, as a float) of the device timer.
+        """
+        return (time.perf_counter() - self._zero) * 1000 * self.clockRate
+
+    def addResponse(self, port=0, key=0, pressed=True, deviceTime=None):
+        """
+        Make the device send a response.
+
+        Parameters
+        ----------
+        port : int or bytes
+            Port to report the response from (e.g. 0 for keys or 2 for a light sensor/voice key,
+            or a selector such as b"K" on StimTracker 2 devices).
+        key : int
+            Key to report the response from.
+        pressed : bool
+            True for a press/onset, False for a release/offset.
+        deviceTime : float or None
+            Device time (ms) at which the response happens, or None for now.
+        """
+        if deviceTime is None:
+            deviceTime = self.getDeviceTime()
+        # selectors don't send anything over USB until enabled
+        if isinstance(port, bytes) and not self.usbOutputs.get(port.decode(), False):
+            return
+        bisect.insort(self._pending, (deviceTime, next(self._order), {
+            'port': port,
+            'key': key,
+            'pressed': pressed,
+            'time': int(deviceTime),
+        }))
+
+    def addBurst(self, count, port=0, key=0, interval=1.0, deviceTime=None):
+        """
+        Make the device send a burst of responses, alternating press and release.
+
+        Parameters
+        ----------
+        count : int
+            Number of responses in the burst.
+        port : int or bytes
+            Port to report the responses from.
+        key : int
+            Key to report the responses from.
+        interval : float
+            Device time (ms) between responses.
+        deviceTime : float or None
+            Device time (ms) of the first response, or None for now.
+        """
+        if deviceTime is None:
+            deviceTime = self.getDeviceTime()
+        for i in range(count):
+            self.addResponse(
+                port=port, key=key, pressed=i % 2 == 0, deviceTime=deviceTime + i * interval
+            )
+
+    def replay(self, records, deviceTime=None):
+        """
+        Make the device send a recorded sequence of responses again, keeping their relative timing.
+
+        Parameters
+        ----------
+        records : numpy.ndarray or list[dict]
+            Responses to replay, either as records from `BaseXidDevice.getMessages` or as response
+            dicts from pyxid2 (with `port`, `key`, `pressed` and `time` in ms).
+        deviceTime : float or None
+            Device time (ms) at which to replay the first response, or None for now.
+        """
+        if not len(records):
+            return
+        if deviceTime is None:
+            deviceTime = self.getDeviceTime()
+        start = int(records[0]['time'])
+        for record in records:
+            port = record['port']
+            # selectors are stored in history by their character code
+            if not isinstance(port, bytes) and int(port) >= ord("A"):
+                port = bytes([int(port)])
+            elif not isinstance(port, bytes):
+                port = int(port)
+            self.addResponse(
+                port=port,
+                key=int(record['key']),
+                pressed=bool(record['pressed']),
+                deviceTime=deviceTime + int(record['time']) - start,
+            )
+
+    def setEventRate(self, rate, port=0, keys=(0,), burst=1, burstInterval=1.0):
+        """
+        Generate random responses, as bursts arriving at an average rate (a Poisson process).
+
+        Parameters
+        ----------
+        rate : float
+            Average number of bursts per second, or 0 to stop generating responses.
+        port : int or bytes
+            Port to report the responses from.
+        keys : list[int]
+            Keys to pick from at random for each burst.
+        burst : int
+            Number of responses in each burst.
+        burstInterval : float
+            Device time (ms) between responses within a burst.
+        """
+        if not rate:
+            self._generators = []
+            return
+        self._generators.append({
+            'rate': rate,
+            'port': port,
+            'keys': list(keys),
+            'burst': burst,
+            'burstInterval': burstInterval,
+            'next': self.getDeviceTime() + self._random.expovariate(rate) * 1000,
+        })
+
+    def _generate(self, now):
+        """
+        Create any randomly generated responses due by device time `now` (ms).
+        """
+        for gen in self._generators:
+            while gen['next'] <= now:
+                self.addBurst(
+                    gen['burst'],
+                    port=gen['port'],
+                    key=self._random.choice(gen['keys']),
+                    interval=gen['burstInterval'],
+                    deviceTime=gen['next'],
+                )
+                gen['next'] += self._random.expovariate(gen['rate']) * 1000
+
+    def _wait(self):
+        """
+        Simulate the latency of talking to the device.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _send(self):
+        """
+        Put each response which is due (given `latency`) onto the wire as a packet.
+        """
+        now = self.getDeviceTime()
+        # generate any random responses
+        self._generate(now)
+        while self._pending and self._pending[0][0] + self.latency * 1000 * self.clockRate <= now:
+            self._wire += self._encodeResponse(self._pending.pop(0)[2])
+
+    def _encodeResponse(self, resp):
+        """
+        Encode a response dict as the packet a real device would send.
+        """
+        deviceTime = int(resp['time']) & 0xFFFFFFFF
+        if self.usesSelectors:
+            return pack(
+                "<ccBcIB", b"o", resp['port'], resp['key'] % 8,
+                b"1" if resp['pressed'] else b"0", deviceTime, 0
+            )
+        # keys on port 0 are 1-based on the wire
+        key = resp['key'] + 1 if resp['port'] == 0 else resp['key']
+        params = resp['port'] | (key % 8) << 5 | (0x10 if resp['pressed'] else 0)
+
+        return pack("<cBI", b"k", params, deviceTime)
+
+    def _read(self, n):
+        """
+        Read `n` bytes off the wire.
+        """
+        self._send()
+        data, self._wire = self._wire[:n], self._wire[n:]
+
+        return data
+
+    def _handleCommand(self, command):
+        """
+        Respond to raw XID commands, which may be several commands written together.
+        """
+        # anything sent before the command arrived goes ahead of its reply
+        self._send()
+        while command:
+            if command.startswith(b"_c1"):
+                self._wire += b"_xid0"
+                n = 3
+            elif command.startswith(b"_e5"):
+                self._wire += b"_e5" + pack("<I", int(self.getDeviceTime()))
+                n = 3
+            elif command.startswith(b"_it") and len(command) >= 4:
+                # threshold query
+                self._wire += command[:4] + bytes([self.thresholds.get(chr(command[3]), 0)])
+                n = 4
+            elif command.startswith(b"_if") and len(command) >= 4:
+                # signal filter query
+                holdOnOff = self.signalFilters.get(chr(command[3]), (0, 0))
+                self._wire += command[:4] + pack("<II", *holdOnOff)
+                n = 4
+            elif command.startswith(b"_iu") and len(command) >= 4:
+                # usb output query
+                enabled = self.usbOutputs.get(chr(command[3]), False)
+                self._wire += command[:4] + (b"1" if enabled else b"0")
+                n = 4
+            elif command.startswith(b"e5"):
+                self.reset_timer()
+                n = 2
+            elif command.startswith(b"it") and len(command) >= 4:
+                # threshold (light sensor/voice key)
+                self.thresholds[chr(command[2])] = command[3]
+                n = 4
+            elif command.startswith(b"if") and len(command) >= 11:
+                # signal filter
+                self.signalFilters[chr(command[2])] = unpack("<II", command[3:11])
+                n = 11
+            elif command.startswith(b"iu") and len(command) >= 4:
+                # usb output
+                self.usbOutputs[chr(command[2])] = command[3:4] == b"1"
+                n = 4
+            else:
+                # unknown command, ignore the rest
+                return
+            command = command[n:]
+
+    # --- pyxid2.XidDevice interface ---
+
+    def reset_timer(self):
+        self._zero = time.perf_counter()
+
+    def query_timer(self):
+        if self.major_fw_version < 2:
+            return 0
+        # as pyxid2, take the next 7 bytes as the reply, whatever they are
+        return unpack("<cccI", self.con.send_xid_command("_e5", 7))[3]
+
+    def poll_for_response(self):
+        marker, packetSize = responsePacketFormat(self)
+        self._send()
+        if len(self._wire) < packetSize:
+            return
+        # take one packet off the wire
+        packet, self._wire = self._wire[:packetSize], self._wire[packetSize:]
+        resp = decodeResponsePacket(self, packet)
+        if resp is None:
+            # as pyxid2, flush everything if the bytes don't make sense
+            self._wire = b""
+            self.flushes += 1
+            return
+        self.response_queue.append(resp)
+
+    def response_queue_size(self):
+        return len(self.response_queue)
+
+    def has_response(self):
+        return len(self.response_queue) > 0
+
+    def get_next_response(self):
+        if self.response_queue:
+            return self.response_queue.pop(0)
+
+    def clear_response_queue(self):
+        self.response_queue = []
+
+    def flush_serial_buffer(self, mask=0):
+        self._pending = []
+        self._wire = b""
+
+    def set_signal_filter(self, selector, holdOn, holdOff):
+        self.con.send_xid_byte_command(
+            pack('<cccII', b'i', b'f', selector.encode('latin1'), holdOn, holdOff)
+        )
+
+    def get_signal_filter(self, selector):
+        self._wait()
+
+        return self.signalFilters.get(selector, (0, 0))
+
+    def set_enable_usb_output(self, selector, enable):
+        self.con.send_xid_command('iu%s%s' % (selector, '1' if enable else '0'))
+
+    def get_enable_usb_output(self, selector):
+        self._wait()
+
+        return self.usbOutputs.get(selector, False)
+
+
+def installSimulatedDevices(devices):
+    """
+    Use the given simulated devices in place of any connected devices, so that they're found by
+    `getAvailableDevices` (and so by DeviceManager and Builder) and used by device classes.
+
+    Parameters
+    ----------
+    devices : list[SimulatedXidDevice]
+        Simulated devices to install.
+    """
+    from psychopy_cedrus.base import BaseXidDevice
+    # number devices as they would be by pyxid2
+    for i, device in enumerate(devices):
+        device.con.ftd2xx_index = i
+    BaseXidDevice._deviceCache = list(devices)
+    BaseXidDevice._indexDevices()
+
+
+def uninstallSimulatedDevices():
+    """
+    Stop using simulated devices, so the next call to `getAvailableDevices` scans for connected
+    devices.
+    """
+    from psychopy_cedrus.base import BaseXidDevice
+    BaseXidDevice._deviceCache = None
+    BaseXidDevice._profilesByProduct = None
+    BaseXidDevice._indicesBySerial = None
@@ -0,0 +1,103 @@
+from pathlib import Path
+import json
+
+
+class DeviceState:
+    """
+    Shadow of the settings which have been applied to a Cedrus XID device, so that writes which
+    wouldn't change anything can be skipped and getters can be answered without asking the
+    device.
+
+    Settings are stored by kind, then by selector:
+        signalFilters : dict[str, tuple[int, int]]
+            Hold on and hold off times (ms) of each selector's signal filter.
+        thresholds : dict[str, int]
+            Threshold level (as sent to the device) of each light or sound sensor.
+        usbOutputs : dict[str, bool]
+            Whether USB output is enabled for each selector.
+    """
+    kinds = ("signalFilters", "thresholds", "usbOutputs")
+
+    def __init__(self):
+        self.signalFilters = {}
+        self.thresholds = {}
+        self.usbOutputs = {}
+
+    def __repr__(self):
+        return f"<DeviceState {self.toDict()}>"
+
+    def get(self, kind, selector, default=None):
+        """
+        Get a setting, or `default` if it isn't known.
+        """
+        return getattr(self, kind).get(selector, default)
+
+    def isSet(self, kind, selector, value):
+        """
+        True if the given setting is known to already have the given value.
+        """
+        values = getattr(self, kind)
+
+        return selector in values and values[selector] == value
+
+    def update(self, kind, selector, value):
+        """
+        Record that a setting has been applied.
+        """
+        getattr(self, kind)[selector] = value
+
+    def clear(self):
+        """
+        Forget all settings (e.g. if the device may have been changed by something else).
+        """
+        for kind in self.kinds:
+            getattr(self, kind).clear()
+
+    def toDict(self):
+        """
+        Get all known settings as a JSON-safe dict.
+        """
+        return {
+            'signalFilters': {
+                selector: list(value) for selector, value in self.signalFilters.items()
+            },
+            'thresholds': dict(self.thresholds),
+            'usbOutputs': dict(self.usbOutputs),
+        }
+
+    def save(self, file):
+        """
+        Write all known settings to a JSON file.
+
+        Parameters
+        ----------
+        file : str or pathlib.Path
+            File to write to.
+        """
+        file = Path(file)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(json.dumps(self.toDict(), indent=2))
+
+    @staticmethod
+    def load(file):
+        """
+        Read settings from a JSON file written by `save`.
+
+        Parameters
+        ----------
+        file : str or pathlib.Path
+            File to read from.
+
+        Returns
+        -------
+        DeviceState
+            Settings from the file.
+        """
+        data = json.loads(Path(file).read_text())
+        state = DeviceState()
+        for selector, value in data.get('signalFilters', {}).items():
+            state.signalFilters[selector] = tuple(value)
+        state.thresholds.update(data.get('thresholds', {}))
+        state.usbOutputs.update(data.get('usbOutputs', {}))
+
+        return state
@@ -4,17 +4,18 @@ from .base import BaseXidDevice, BaseXidButtonGroup, BaseXidLightSensorGroup, Ba
 class StimTrackerDevice(BaseXidDevice):
     productId = b"S"
 
-    def __init__(
-        self, index=0, enableResponses=True
-    ):
+    def __init__(self, index=0, enableResponses=True, **kwargs):
         # initialise
-        BaseXidDevice.__init__(
-            self, index=index
-        )
+        BaseXidDevice.__init__(self, index=index, **kwargs)
         # allow USB input (it's disabled by default)
-        if enableResponses:
-            for selector in self.selectors:
-                self.xid.set_enable_usb_output(selector, True)
+        if enableResponses == "auto":
+            # only from selectors used by nodes, as they're added and removed
+            self.manageUsbOutputs = True
+        elif enableResponses:
+            # from every selector, now
+            with self.batchCommands() as batch:
+                for selector in self.selectors:
+                    batch.setEnableUsbOutput(selector, True)
 
 
 class StimTrackerButtonGroup(BaseXidButtonGroup):
@@ -23,6 +24,8 @@ class StimTrackerButtonGroup(BaseXidButtonGroup):
     def __init__(
         self, pad=0, channels=8, bounce=0.005, enableResponses=True
     ):
+        # enable USB output from this node's selectors when it's added to the device
+        self.enableResponses = enableResponses
         # initialise
         BaseXidButtonGroup.__init__(
             self, pad=pad, channels=channels, bounce=bounce
@@ -35,6 +38,8 @@ class StimTrackerLightSensorGroup(BaseXidLightSensorGroup):
     def __init__(
         self, pad=0, channels=3, enableResponses=True
     ):
+        # enable USB output from this node's selectors when it's added to the device
+        self.enableResponses = enableResponses
         # initialise
         BaseXidLightSensorGroup.__init__(
             self, pad=pad, channels=channels
@@ -47,6 +52,8 @@ class StimTrackerSoundSensorGroup(BaseXidSoundSensorGroup):
     def __init__(
         self, pad=0, channels=3, threshold=None, enableResponses=True
     ):
+        # enable USB output from this node's selectors when it's added to the device
+        self.enableResponses = enableResponses
         # initialise
         BaseXidSoundSensorGroup.__init__(
             self, pad=pad, channels=channels, threshold=threshold
@@ -0,0 +1,24 @@
+from psychopy import logging
+from psychopy_cedrus import benchmark
+
+
+def test_benchmark_runs():
+    """
+    The dispatch benchmark should run against simulated devices and produce comparable results,
+    leaving the console logging level as it was.
+    """
+    level = logging.console.level
+    logging.console.setLevel(logging.DEBUG)
+    try:
+        results = benchmark.runBenchmarks(
+            families=("rb", "stimtracker"), nodeCounts=(1, 3), burstSizes=(5,), reps=3
+        )
+        assert logging.console.level == logging.DEBUG
+    finally:
+        logging.console.setLevel(level)
+    assert len(results['results']) == 4
+    for result in results['results']:
+        assert result['messages'] == 15
+        assert result['latencyP50'] <= result['latencyP99']
+    # results compared against themselves shouldn't show any regressions
+    assert benchmark.compareResults(results, results) == []
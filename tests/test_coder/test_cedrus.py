@@ -0,0 +1,61 @@
+import struct
+
+from psychopy_cedrus.cedrus import RB730, _parseKeyFrames
+
+
+class _FakePort:
+    """
+    Stands in for a serial port, giving back whatever has been "received".
+    """
+    def __init__(self):
+        self.received = bytearray()
+
+    def inWaiting(self):
+        return len(self.received)
+
+    def read(self, n):
+        data = bytes(self.received[:n])
+        del self.received[:n]
+        return data
+
+
+def test_get_key_events():
+    """
+    Key frames should be decoded in order, including ones whose info or rt bytes contain "k",
+    with a partial frame kept until the rest of it arrives.
+    """
+    def _frame(key, down, rt):
+        return b"k" + bytes([key << 5 | down << 4]) + struct.pack("<i", rt)
+
+    # make a box without opening a serial port
+    box = RB730.__new__(RB730)
+    box.port = _FakePort()
+    box._buffer = bytearray()
+    stream = _frame(3, True, 107) + b"?" + _frame(1, False, 0x6B6B) + _frame(2, True, 5)
+    # split the stream partway through the last frame
+    box.port.received += stream[:-3]
+    keys = box.getKeyEvents(downOnly=False)
+    assert [(k.key, k.direction, k.rt) for k in keys] == [(3, 'down', 107), (1, 'up', 0x6B6B)]
+    assert box._buffer == stream[-6:-3]
+    # rest of the frame arrives
+    box.port.received += stream[-3:]
+    keys = box.getKeyArray(allowedKeys=(2,))
+    assert [(k['key'], k['down'], k['rt']) for k in keys] == [(2, True, 5)]
+    assert box._buffer == b""
+
+
+def test_parse_key_frames():
+    """
+    A long run of back-to-back frames, with a stray byte in the middle, should decode as a batch.
+    """
+    frames = [
+        b"k" + bytes([(i % 8) << 5 | (i % 2) << 4]) + struct.pack("<i", i * 10) for i in range(500)
+    ]
+    buffer = bytearray(b"".join(frames[:200]) + b"\x00" + b"".join(frames[200:]) + b"k\x30")
+    keys = _parseKeyFrames(buffer)
+
+    assert len(keys) == 500
+    assert (keys['key'] == [i % 8 for i in range(500)]).all()
+    assert (keys['down'] == [bool(i % 2) for i in range(500)]).all()
+    assert (keys['rt'] == [i * 10 for i in range(500)]).all()
+    assert buffer == b"k\x30"
@@ -0,0 +1,888 @@
+import socket
+import sys
+import time
+import types
+
+import pytest
+
+from psychopy_cedrus import simulator
+from psychopy_cedrus.rb import RBDevice, RBButtonGroup, RBLightSensorGroup, RBSoundSensorGroup
+from psychopy_cedrus.stimtracker import (
+    StimTrackerDevice, StimTrackerButtonGroup, StimTrackerLightSensorGroup,
+    StimTrackerSoundSensorGroup
+)
+
+
+def drain(device, timeout=1):
+    """
+    Dispatch messages until the simulated device behind `device` has nothing left to send.
+    """
+    start = time.perf_counter()
+    while device.xid.hasUnread and time.perf_counter() - start < timeout:
+        device.dispatchMessages()
+    # pick up anything still in pyxid2's queue
+    device.dispatchMessages()
+
+
+class TestXidDevice:
+    def setup_method(self):
+        self.sim = simulator.SimulatedXidDevice(productId=b"S")
+        self.device = StimTrackerDevice(xid=self.sim)
+        self.buttons = StimTrackerButtonGroup(pad=self.device)
+        self.lightsensors = StimTrackerLightSensorGroup(pad=self.device)
+        self.soundsensors = StimTrackerSoundSensorGroup(pad=self.device)
+
+    def teardown_method(self):
+        self.device.stopReader()
+        self.device.stopClockSync()
+
+    def test_routing(self):
+        """
+        Responses should only be sent to the nodes whose selectors they come from.
+        """
+        self.sim.addResponse(port=b"K", key=1)
+        self.sim.addResponse(port=b"A", key=3)
+        self.sim.addResponse(port=b"M", key=2)
+        drain(self.device)
+
+        assert [resp.channel for resp in self.buttons.responses] == [1]
+        assert len(self.lightsensors.responses) == 1
+        assert len(self.soundsensors.responses) == 1
+
+    def test_remove_node(self):
+        """
+        Removed nodes should stop receiving responses, without affecting sibling nodes (which
+        compare equal to them via ==).
+        """
+        self.device.removeNode(self.lightsensors)
+        assert self.buttons in self.device.nodes
+        self.sim.addResponse(port=b"A", key=3)
+        drain(self.device)
+
+        assert self.lightsensors.responses == []
+
+    def test_usb_outputs(self):
+        """
+        With enableResponses="auto", USB output should only be enabled from selectors used by
+        registered nodes, while enableResponses=True enables it from all of them.
+        """
+        from psychopy.hardware.manager import DeviceManager
+        sim = simulator.SimulatedXidDevice(productId=b"S")
+        StimTrackerDevice(xid=sim)
+        assert all(sim.usbOutputs.values()) and len(sim.usbOutputs) == 9
+        sim = simulator.SimulatedXidDevice(productId=b"S")
+        device = StimTrackerDevice(xid=sim, enableResponses="auto")
+        assert not any(sim.usbOutputs.values())
+        lightsensors = StimTrackerLightSensorGroup(pad=device, channels=2)
+        soundsensors = StimTrackerSoundSensorGroup(pad=device)
+        enabled = {selector for selector, value in sim.usbOutputs.items() if value}
+        assert enabled == {"A", "B", "M", "L", "R"}
+        # responses from unused selectors shouldn't be sent
+        sim.addResponse(port=b"K", key=1)
+        sim.addResponse(port=b"C", key=3)
+        assert sim._pending == []
+        # removing a node should disable its selectors
+        device.removeNode(soundsensors)
+        enabled = {selector for selector, value in sim.usbOutputs.items() if value}
+        assert enabled == {"A", "B"}
+        # as should removing it from DeviceManager
+        DeviceManager.devices["lightsensors"] = lightsensors
+        DeviceManager.removeDevice("lightsensors")
+        assert not any(sim.usbOutputs.values())
+
+    def test_history(self):
+        """
+        Responses in the same millisecond should all be kept, and the history should stay within
+        its capacity.
+        """
+        device = StimTrackerDevice(
+            xid=simulator.SimulatedXidDevice(productId=b"S"), historySize=8
+        )
+        now = device.xid.getDeviceTime()
+        for i in range(10):
+            device.xid.addResponse(port=b"K", key=i % 4 + 1, deviceTime=now)
+        drain(device)
+
+        assert len(device.messages) == 8
+        assert device.messages.overflow == 2
+        assert list(device.messages.records['key']) == [3, 4, 1, 2, 3, 4, 1, 2]
+
+    def test_get_messages(self):
+        """
+        getMessages should window by device time and filter by port/key.
+        """
+        for i in range(10):
+            self.sim.addResponse(port=b"K" if i % 2 else b"A", key=i % 3 + 1, deviceTime=i * 10)
+        drain(self.device)
+
+        window = self.device.getMessages(start=0.02, stop=0.05)
+        assert list(window['time']) == [20, 30, 40]
+        assert list(self.device.getMessages(port="K")['time']) == [10, 30, 50, 70, 90]
+        assert list(self.device.getMessages(key=1)['time']) == [0, 30, 60, 90]
+
+    def test_threaded(self):
+        """
+        With a background reader, responses should be buffered without dispatchMessages polling
+        the device.
+        """
+        self.device.startReader()
+        self.sim.addBurst(6, port=b"K", key=2, interval=0)
+        time.sleep(0.1)
+        assert len(self.device._responseBuffer) == 6
+        self.device.dispatchMessages()
+
+        assert len(self.buttons.responses) == 6
+        assert (self.device.messages.records['hostTime'] > 0).all()
+
+    def test_reader_error(self):
+        """
+        If the background reader dies, dispatchMessages should raise what stopped it once and then
+        go back to polling the device.
+        """
+        poll = self.sim.poll_for_response
+
+        def _fail():
+            raise OSError("device unplugged")
+
+        self.sim.poll_for_response = _fail
+        self.device.startReader()
+        self.device._reader.join(1)
+        with pytest.raises(ConnectionError):
+            self.device.dispatchMessages()
+        self.sim.poll_for_response = poll
+        self.sim.addResponse(port=b"K", key=1)
+        drain(self.device)
+
+        assert not self.device.isReading
+        assert len(self.buttons.responses) == 1
+
+    def test_batch_commands(self):
+        """
+        Commands sent within a batch should go in a single write, with replies read together.
+        """
+        self.sim.con.sent.clear()
+        with self.device.batchCommands() as batch:
+            self.lightsensors.setThreshold(0.25, channel=[0, 1, 2])
+            batch.setEnableUsbOutput("B", True)
+            batch.add("_c1", replyLength=5, expect=b"_xid")
+            assert self.sim.con.sent == []
+
+        assert len(self.sim.con.sent) == 1
+        assert self.sim.thresholds == {"A": 75, "B": 75, "C": 75}
+        assert self.sim.usbOutputs["B"]
+        # a reply which isn't as expected should raise an error
+        with pytest.raises(ConnectionError):
+            self.device.sendCommand("_c1", replyLength=5, expect=b"_xid1")
+
+    def test_discarded_batch(self):
+        """
+        Settings queued in a batch which is discarded shouldn't be recorded as applied, so
+        setting them again afterwards should send them.
+        """
+        with pytest.raises(RuntimeError):
+            with self.device.batchCommands() as batch:
+                batch.setThreshold("D", 20)
+                batch.setEnableUsbOutput("D", False)
+                raise RuntimeError("changed my mind")
+
+        assert self.device.settings.get("thresholds", "D") is None
+        assert self.device.settings.get("usbOutputs", "D") is True
+        with self.device.batchCommands() as batch:
+            batch.setThreshold("D", 20)
+            # setting back what's queued within the same batch should still be sent
+            batch.setThreshold("D", 30)
+            batch.setThreshold("D", 20)
+        assert self.sim.thresholds["D"] == 20
+        assert self.device.settings.get("thresholds", "D") == 20
+
+    def test_replies_among_responses(self):
+        """
+        Responses which arrive just before a command's reply should be passed on as responses,
+        rather than being taken for the reply or making pyxid2 flush the wire.
+        """
+        self.sim.addBurst(3, port=b"K", key=1, interval=0)
+        reply = self.device.sendCommand("_itA", replyLength=5, expect=b"_itA")
+        drain(self.device)
+
+        assert reply == b"_itA" + bytes([self.sim.thresholds.get("A", 0)])
+        assert len(self.buttons.responses) == 3
+        assert self.sim.flushes == 0
+
+    def test_sync_among_responses(self):
+        """
+        Responses which arrive during a clock sync should neither be lost nor be taken for timer
+        readings.
+        """
+        self.sim.addBurst(3, port=b"K", key=1, interval=0)
+        self.device.syncClock(samples=3)
+        drain(self.device)
+
+        assert len(self.buttons.responses) == 3
+        assert self.sim.flushes == 0
+        # the sample should be a genuine timer reading
+        deviceTime, hostTime, roundTrip = self.device.clockSync.samples[-1]
+        assert abs(deviceTime - self.sim.getDeviceTime()) < 1000
+
+    def test_set_thresholds(self):
+        """
+        Thresholds should be confirmed by reading them back, rather than by waiting.
+        """
+        start = time.perf_counter()
+        states = self.lightsensors.setThresholds({0: 0.2, 2: 0.6})
+
+        assert time.perf_counter() - start < 0.03
+        assert states == {0: False, 2: False}
+        assert self.sim.thresholds["A"] == 80 and self.sim.thresholds["C"] == 40
+        assert b"_itC" in self.sim.con.sent[-1]
+
+    def test_threshold_state(self, monkeypatch):
+        """
+        Setting a threshold should wait for the sensor to report its state, and fall back to
+        waiting if the device can't confirm the threshold (including when called as
+        findThreshold does).
+        """
+        handleCommand = self.sim._handleCommand
+
+        def _handleCommand(command):
+            # sensor goes over the new threshold just after it's set
+            handleCommand(command)
+            if command.startswith(b"itA"):
+                self.sim.addResponse(
+                    port=b"A", key=3, deviceTime=self.sim.getDeviceTime() + 2
+                )
+
+        monkeypatch.setattr(self.sim, "_handleCommand", _handleCommand)
+        assert self.lightsensors._setThreshold(0.3, channel=0) is True
+        # drop threshold readbacks, so they can't be confirmed
+        monkeypatch.setattr(
+            self.sim, "_handleCommand",
+            lambda command: None if command.startswith(b"_it") else handleCommand(command)
+        )
+        self.lightsensors._setThreshold(0.6, channel=0)
+        assert self.sim.thresholds["A"] == 40
+
+    def test_sound_threshold_state(self, monkeypatch):
+        """
+        Setting a sound sensor's threshold should wait for it to report its state too.
+        """
+        handleCommand = self.sim._handleCommand
+
+        def _handleCommand(command):
+            # sensor goes over the new threshold just after it's set
+            handleCommand(command)
+            if command.startswith(b"itM"):
+                self.sim.addResponse(
+                    port=b"M", key=2, deviceTime=self.sim.getDeviceTime() + 2
+                )
+
+        monkeypatch.setattr(self.sim, "_handleCommand", _handleCommand)
+        assert self.soundsensors._setThreshold(0.3, channel=0) is True
+        assert self.soundsensors.state[0] is True
+        assert self.sim.thresholds["M"] == 30
+
+    def test_calibrate_threshold(self):
+        """
+        Calibration should find a threshold between the levels of the bright and dark patches on
+        every channel at once, bisecting rather than sweeping.
+        """
+        # brightness of the bright patch on each sensor (the dark patch is 0.2 on all)
+        bright = {"A": 0.7, "B": 0.5, "C": 0.9}
+        presented = []
+
+        def _present(levels):
+            # report whether each sensor is over its current threshold
+            presented.append(levels)
+            for selector, level in levels.items():
+                threshold = (100 - self.sim.thresholds[selector]) / 100
+                self.sim.addResponse(port=selector.encode(), key=3, pressed=level > threshold)
+            drain(self.device)
+
+        results = self.lightsensors.calibrateThreshold(
+            onStim=lambda: _present(bright),
+            offStim=lambda: _present({"A": 0.2, "B": 0.2, "C": 0.2}),
+            settle=0,
+        )
+
+        assert len(presented) == 14
+        for channel, selector in enumerate("ABC"):
+            threshold, margin = results[channel]
+            assert abs(threshold - (bright[selector] + 0.2) / 2) <= 0.01
+            assert abs(margin - (bright[selector] - 0.2) / 2) <= 0.01
+            assert self.lightsensors.getThreshold(channel) == threshold
+
+    def test_settings_cache(self, tmp_path):
+        """
+        Settings which are already applied shouldn't be written again, and saved settings should
+        be restored by sending only what differs.
+        """
+        self.sim.con.sent.clear()
+        StimTrackerLightSensorGroup(pad=self.device)
+        self.buttons.setBounce(0.005)
+        assert self.buttons.getBounce() == (0.005, 0.005)
+        assert self.sim.con.sent == []
+        # save settings, then change some of them behind the device's back
+        self.device.saveSettings(tmp_path / "settings.json")
+        self.sim.thresholds["B"] = 10
+        self.sim.usbOutputs["K"] = False
+        sim = self.sim
+        device = StimTrackerDevice(xid=sim, settingsFile=tmp_path / "settings.json")
+        # only the changed settings (and queries for them) should be sent
+        written = sim.con.sent[-1]
+        assert b"itB" in written and b"iuK1" in written and b"itA" not in written
+        assert sim.thresholds["B"] == 50 and sim.usbOutputs["K"]
+        assert device.settings.toDict() == self.device.settings.toDict()
+
+    def test_stream_responses(self):
+        """
+        Async streams should yield responses as they arrive, filtered by port and by node.
+        """
+        import asyncio
+
+        async def _collect(stream, n):
+            items = []
+            async for item in stream:
+                items.append(item)
+                if len(items) == n:
+                    return items
+
+        async def _run():
+            deviceTask = asyncio.ensure_future(
+                asyncio.wait_for(_collect(self.device.streamResponses(ports=["A"]), 2), 2)
+            )
+            buttonTask = asyncio.ensure_future(
+                asyncio.wait_for(_collect(self.buttons.streamResponses(), 2), 2)
+            )
+            await asyncio.sleep(0.01)
+            for key in range(1, 3):
+                self.sim.addResponse(port=b"K", key=key)
+                self.sim.addResponse(port=b"A", key=3)
+
+            return await deviceTask, await buttonTask
+
+        fromDevice, fromButtons = asyncio.run(_run())
+
+        assert [resp['port'] for resp in fromDevice] == [b"A", b"A"]
+        assert [resp.channel for resp in fromButtons] == [1, 2]
+        # closing the streams should stop the reader they started
+        assert not self.device.isReading
+
+    def test_wait_for_response(self):
+        """
+        Waiting should return the first matching response as soon as it arrives, or None on
+        timeout.
+        """
+        import threading
+        timer = threading.Timer(0.05, self.sim.addBurst, args=(4,), kwargs={'port': b"K", 'key': 2})
+        timer.start()
+        start = time.perf_counter()
+        resp = self.buttons.waitForResponse(timeout=2, channels=[2], value=False)
+        timer.join()
+
+        assert resp.channel == 2 and resp.value is False
+        assert time.perf_counter() - start < 1
+        assert self.lightsensors.waitForResponse(timeout=0.05) is None
+        # the reader should only be left running if it was running already
+        assert not self.device.isReading
+        self.device.startReader()
+        assert self.lightsensors.waitForResponse(timeout=0.01) is None
+        assert self.device.isReading
+
+    def test_clock_sync(self):
+        """
+        A drifting device timer should be mapped onto the host clock.
+        """
+        from psychopy import core
+        sim = simulator.SimulatedXidDevice(productId=b"2", clockRate=1.01)
+        device = RBDevice(xid=sim)
+        for i in range(5):
+            device.syncClock()
+            time.sleep(0.3)
+
+        assert abs(device.clockSync.drift - 0.01) < 0.002
+        assert abs(device.getTime() - core.getTime()) < 0.005
+
+    def test_extrapolate_time(self, monkeypatch):
+        """
+        A stale clock sync model should be refreshed in the background rather than by getTime.
+        """
+        from psychopy import core
+        sim = simulator.SimulatedXidDevice(productId=b"2")
+        device = RBDevice(xid=sim, extrapolateTime=True, maxSyncAge=0.1)
+        device.syncClock()
+        time.sleep(0.2)
+        # make syncing slow, so it'd show if getTime waited for it
+        syncClock = device.syncClock
+        monkeypatch.setattr(device, "syncClock", lambda: time.sleep(0.5) or syncClock())
+        start = time.perf_counter()
+        assert abs(device.getTime() - core.getTime()) < 0.005
+        assert time.perf_counter() - start < 0.1
+        device.stopClockSync()
+        assert not device.clockSync.isStale(0.1)
+
+    def test_sync_after_reset(self):
+        """
+        Syncing clocks for the first time after a node's timer has been reset shouldn't move the
+        node's response times.
+        """
+        from psychopy import core
+        sim = simulator.SimulatedXidDevice(productId=b"2", latency=0.002)
+        device = RBDevice(xid=sim)
+        buttons = RBButtonGroup(pad=device)
+        clock = core.Clock()
+        buttons.resetTimer(clock)
+        time.sleep(0.2)
+        device.syncClock()
+        sim.addResponse(port=0, key=1)
+        drain(device)
+
+        assert abs(buttons.responses[-1].t - clock.getTime()) < 0.05
+
+    def test_extrapolate_time_unfitted(self):
+        """
+        When extrapolating time without a fitted model, getTime should fit one first, so that
+        timers reset against it stay on the same timeline as responses.
+        """
+        from psychopy import core
+        sim = simulator.SimulatedXidDevice(productId=b"2", latency=0.002)
+        device = RBDevice(xid=sim, extrapolateTime=True)
+        buttons = RBButtonGroup(pad=device)
+        clock = core.Clock()
+        buttons.resetTimer(clock)
+        assert device.clockSync.isFitted
+        time.sleep(0.3)
+        sim.addResponse(port=0, key=1)
+        drain(device)
+
+        assert abs(buttons.responses[-1].t - clock.getTime()) < 0.05
+
+    def test_extrapolate_time_xid1(self, monkeypatch):
+        """
+        Asking to extrapolate time on an XID 1 device should warn once and query the device.
+        """
+        from psychopy_cedrus import base
+        warnings = []
+        monkeypatch.setattr(base.logging, "warning", warnings.append)
+        sim = simulator.SimulatedXidDevice(productId=b"2", majorFirmware=1)
+        device = RBDevice(xid=sim, extrapolateTime=True)
+        for i in range(3):
+            device.getTime()
+
+        assert not device.extrapolateTime
+        assert len(warnings) == 1
+
+
+def test_xid1_ports():
+    """
+    On devices which don't report selectors, port 0 should go to buttons and port 2 to light or
+    sound sensors by key.
+    """
+    sim = simulator.SimulatedXidDevice(productId=b"2")
+    device = RBDevice(xid=sim)
+    buttons = RBButtonGroup(pad=device)
+    lightsensors = RBLightSensorGroup(pad=device)
+    soundsensors = RBSoundSensorGroup(pad=device)
+    sim.addResponse(port=0, key=4)
+    sim.addResponse(port=2, key=3)
+    sim.addResponse(port=2, key=2)
+    drain(device)
+
+    assert [resp.channel for resp in buttons.responses] == [4]
+    assert len(lightsensors.responses) == 1
+    assert len(soundsensors.responses) == 1
+    # XID 2 configuration commands shouldn't be sent to XID 1 devices
+    sim = simulator.SimulatedXidDevice(productId=b"2", majorFirmware=1)
+    RBButtonGroup(pad=RBDevice(xid=sim))
+    assert sim.con.sent == []
+
+
+def test_pyxid2_connection(monkeypatch):
+    """
+    Commands should work with pyxid2's own connection class, finishing packets it has only read
+    the start of and leaving its timeouts as they were after reading.
+    """
+    import importlib
+    from struct import pack
+    from psychopy_cedrus import commands
+
+    class FakeFtdi:
+        # stands in for an open ftd2xx device, with bytes waiting to be read
+        def __init__(self, data):
+            self.data = data
+            self.timeouts = []
+
+        def setTimeouts(self, read, write):
+            self.timeouts.append((read, write))
+
+        def read(self, n):
+            data, self.data = self.data[:n], self.data[n:]
+            return data
+
+    # pyxid2 needs the FTDI driver to import, so give it a stand-in
+    monkeypatch.setitem(sys.modules, "ftd2xx", types.ModuleType("ftd2xx"))
+    for name in [name for name in sys.modules if name.split(".")[0] == "pyxid2"]:
+        monkeypatch.delitem(sys.modules, name)
+    try:
+        internal = importlib.import_module("pyxid2.internal")
+        con = internal.XidConnection(0, 115200)
+        # pyxid2 has read half of a packet, and the rest is still to come
+        packet = pack("<cBI", b"k", 0x30, 1234)
+        setattr(con, commands.PYXID2_RESPONSE_BUFFER, packet[:3])
+        con.ftd2xx_con = FakeFtdi(packet[3:])
+        device = types.SimpleNamespace(
+            xid=types.SimpleNamespace(con=con, poll_for_response=con.check_for_keypress)
+        )
+        commands.CommandBatch(device, timeout=0.05)._finishPacket()
+
+        assert getattr(con, commands.PYXID2_RESPONSE_BUFFER) == b""
+        # then a reply arrives
+        con.ftd2xx_con.data = b"_xid1"
+        assert commands.readRaw(con, 5, timeout=0.05) == b"_xid1"
+        assert con.ftd2xx_con.timeouts[-1] == commands.PYXID2_TIMEOUTS
+        # if pyxid2 stops keeping the buffer where it's expected, there should be an error
+        delattr(con, commands.PYXID2_RESPONSE_BUFFER)
+        with pytest.raises(AttributeError):
+            commands.CommandBatch(device, timeout=0.05)._finishPacket()
+    finally:
+        # don't leave pyxid2 imported against the fake driver
+        for name in [name for name in sys.modules if name.split(".")[0] == "pyxid2"]:
+            del sys.modules[name]
+
+
+def test_installed_devices():
+    """
+    Installed simulated devices should be found by getAvailableDevices and opened by serial.
+    """
+    from psychopy.hardware.manager import ManagedDeviceError
+    sims = [
+        simulator.SimulatedXidDevice(productId=b"S"),
+        simulator.SimulatedXidDevice(productId=b"2"),
+    ]
+    simulator.installSimulatedDevices(sims)
+    try:
+        profiles = RBDevice.getAvailableDevices()
+        assert [profile['serial'] for profile in profiles] == [sims[1].serial]
+        device = RBDevice(serial=sims[1].serial)
+        assert device.xid is sims[1]
+        assert device.index == 1
+        # a serial number should only find devices of the right product
+        assert StimTrackerDevice.getIndexFromSerial(sims[1].serial) is None
+        with pytest.raises(ManagedDeviceError, match="is not a StimTrackerDevice"):
+            StimTrackerButtonGroup(pad=sims[1].serial)
+    finally:
+        simulator.uninstallSimulatedDevices()
+
+
+def test_open_devices():
+    """
+    openDevices should open several devices (by index or serial) into DeviceManager, where nodes
+    given a serial number as their pad should find them rather than opening them again.
+    """
+    from psychopy.hardware.manager import DeviceManager, ManagedDeviceError
+    from psychopy_cedrus.base import openDevices
+    sims = [
+        simulator.SimulatedXidDevice(productId=b"2", latency=0.001),
+        simulator.SimulatedXidDevice(productId=b"2", latency=0.001),
+        simulator.SimulatedXidDevice(productId=b"S", latency=0.001),
+    ]
+    simulator.installSimulatedDevices(sims)
+    names = ["rb0", "rb1", "stimtracker"]
+    try:
+        opened, timings = openDevices([
+            {'deviceClass': "psychopy_cedrus.rb.RBDevice", 'deviceName': "rb0", 'index': 0},
+            {
+                'deviceClass': "psychopy_cedrus.rb.RBDevice", 'deviceName': "rb1",
+                'serial': sims[1].serial
+            },
+            {
+                'deviceClass': "psychopy_cedrus.stimtracker.StimTrackerDevice",
+                'deviceName': "stimtracker", 'index': 2
+            },
+        ])
+        assert sorted(opened) == sorted(timings) == sorted(names)
+        assert [opened[name].xid for name in names] == sims
+        assert all(DeviceManager.getDevice(name) is opened[name] for name in names)
+        # nodes should find open devices by serial number
+        buttons = RBButtonGroup(pad=sims[1].serial)
+        assert buttons.parent is opened["rb1"]
+        assert buttons.isSameDevice({'pad': sims[1].serial})
+        assert not buttons.isSameDevice({'pad': sims[0].serial})
+        # one failure shouldn't stop the rest from opening, but should be raised
+        with pytest.raises(ManagedDeviceError):
+            openDevices([
+                {'deviceClass': "psychopy_cedrus.rb.RBDevice", 'deviceName': "rb2", 'index': 0},
+                {
+                    'deviceClass': "psychopy_cedrus.rb.RBDevice", 'deviceName': "missing",
+                    'serial': "NOTASERIAL"
+                },
+            ])
+        names.append("rb2")
+        assert DeviceManager.getDevice("rb2") is not None
+    finally:
+        for name in names:
+            DeviceManager.removeDevice(name)
+        simulator.uninstallSimulatedDevices()
+
+
+class TestDeviceCache:
+    """
+    Tests of the on-disk device cache, with the FTDI driver and pyxid2 standing in for a bus of
+    simulated devices.
+    """
+    def setup_method(self):
+        self.sims = [
+            simulator.SimulatedXidDevice(productId=b"S", index=0),
+            simulator.SimulatedXidDevice(productId=b"2", index=1),
+        ]
+        # number of full scans done
+        self.scans = 0
+
+    def fakeModules(self, monkeypatch):
+        """
+        Put fake ftd2xx and pyxid2 modules in place, answering from `self.sims` by FTDI index.
+        """
+        def getXidDevices():
+            self.scans += 1
+            for i, sim in enumerate(self.sims):
+                sim.con.ftd2xx_index = i
+            return list(self.sims)
+
+        monkeypatch.setitem(sys.modules, "ftd2xx", types.SimpleNamespace(
+            createDeviceInfoList=lambda: len(self.sims),
+            getDeviceInfoDetail=lambda i, update=True: {
+                'serial': self.sims[i].serial.encode("latin1")
+            },
+        ))
+        monkeypatch.setitem(sys.modules, "pyxid2", types.SimpleNamespace(
+            get_xid_devices=getXidDevices,
+            XidConnection=lambda index, baudrate: self.sims[index].con,
+            XidDevice=lambda con: con.device,
+        ))
+
+    def test_round_trip(self, tmp_path, monkeypatch):
+        """
+        Devices saved to a cache file should be reopened from it without a scan.
+        """
+        from psychopy_cedrus import enumeration
+        self.fakeModules(monkeypatch)
+        file = tmp_path / "devices.json"
+        enumeration.saveDeviceCache(file, enumeration.scanDevices())
+        devices = enumeration.loadDeviceCache(file)
+
+        assert devices == self.sims
+        assert self.scans == 1
+
+    def test_stale(self, tmp_path, monkeypatch):
+        """
+        A cache entry whose FTDI index now has a different device on it, or a cache listing more
+        devices than are connected, should mean a rescan.
+        """
+        from psychopy_cedrus import enumeration
+        self.fakeModules(monkeypatch)
+        file = tmp_path / "devices.json"
+        enumeration.saveDeviceCache(file, enumeration.scanDevices())
+        # swap the devices over, so each cached index has the other device's serial
+        self.sims.reverse()
+        assert enumeration.loadDeviceCache(file) is None
+        # unplug one
+        self.sims.pop()
+        assert enumeration.loadDeviceCache(file) is None
+
+    def test_corrupt(self, tmp_path, monkeypatch):
+        """
+        A missing, unreadable or empty cache file should mean a rescan, which rewrites it.
+        """
+        from psychopy_cedrus import enumeration
+        from psychopy_cedrus.base import BaseXidDevice
+        self.fakeModules(monkeypatch)
+        file = tmp_path / "devices.json"
+        assert enumeration.loadDeviceCache(file) is None
+        file.write_text("[{not json")
+        assert enumeration.loadDeviceCache(file) is None
+        file.write_text("[]")
+        assert enumeration.loadDeviceCache(file) is None
+        # enumerating should fall back to a scan and fix the file
+        file.write_text("[{not json")
+        monkeypatch.setattr(BaseXidDevice, "deviceCacheFile", file)
+        assert BaseXidDevice._enumerateDevices() == self.sims
+        assert self.scans == 1
+        assert BaseXidDevice._enumerateDevices() == self.sims
+        assert self.scans == 1
+
+    def test_serial_from_index(self, monkeypatch):
+        """
+        Devices which don't know their own serial number should have it looked up by their FTDI
+        index.
+        """
+        from psychopy_cedrus import enumeration
+        self.fakeModules(monkeypatch)
+        xid = types.SimpleNamespace(con=self.sims[1].con)
+
+        assert enumeration.getSerial(xid) == self.sims[1].serial
+
+
+def test_profile_round_trip(tmp_path):
+    """
+    Round trip profiling should time every trip, count slow ones as timed out and save samples.
+    """
+    device = RBDevice(xid=simulator.SimulatedXidDevice(productId=b"2", latency=0.002))
+    stats = device.profileRoundTrip(n=20, file=tmp_path / "trips.txt")
+    assert stats['n'] == 20 and stats['timeouts'] == 0
+    assert 0.002 <= stats['min'] <= stats['median'] <= stats['p99'] <= stats['max']
+    assert len((tmp_path / "trips.txt").read_text().splitlines()) == 21
+    # trips slower than the timeout shouldn't count
+    stats = device.profileRoundTrip(n=5, timeout=0.001)
+    assert stats == {'n': 0, 'timeouts': 5}
+    # trips which get no reply should give up (by the timeout) rather than hang
+    device.xid._handleCommand = lambda command: None
+    start = time.perf_counter()
+    stats = device.profileRoundTrip(n=3, timeout=0.05)
+    assert stats == {'n': 0, 'timeouts': 3}
+    assert time.perf_counter() - start < 0.5
+    # XID 1 devices have no timer to query
+    device = RBDevice(xid=simulator.SimulatedXidDevice(productId=b"2", majorFirmware=1))
+    assert device.profileRoundTrip(n=5) is None
+
+
+def test_latency_stats():
+    """
+    Latency stats should only be recorded once enabled, and should count each response.
+    """
+    sim = simulator.SimulatedXidDevice(productId=b"2")
+    device = RBDevice(xid=sim)
+    RBButtonGroup(pad=device)
+    assert device.getLatencyStats() is None
+    device.syncClock()
+    device.setLatencyMonitoring()
+    for i in range(5):
+        sim.addResponse(port=0, key=1)
+    drain(device)
+    stats = device.getLatencyStats()
+
+    assert stats['deviceToHost']['n'] == 5
+    assert stats['dispatchDelay']['n'] == 5
+    assert 0 <= stats['dispatchDelay']['p50'] <= stats['dispatchDelay']['p99']
+
+
+def test_split_frames():
+    """
+    Splitting frames should take every complete frame from a buffer and leave a partial one.
+    """
+    from psychopy_cedrus.broker import _frame, _splitFrames
+    frames = [_frame(1, bytes([i % 256]) * (i % 7)) for i in range(1000)]
+    buffer = bytearray(b"".join(frames) + _frame(2, b"partial")[:5])
+    split = _splitFrames(buffer)
+
+    assert [body for kind, body in split] == [bytes([i % 256]) * (i % 7) for i in range(1000)]
+    assert buffer == _frame(2, b"partial")[:5]
+    # the rest of the partial frame completes it
+    buffer += _frame(2, b"partial")[5:]
+    assert _splitFrames(buffer) == [(2, b"partial")] and buffer == b""
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix domain sockets")
+def test_broker(tmp_path):
+    """
+    Responses should reach every client of a broker, and commands from clients should reach the
+    device.
+    """
+    from psychopy_cedrus.broker import DeviceBroker, connectBroker
+    sim = simulator.SimulatedXidDevice(productId=b"S")
+    device = StimTrackerDevice(xid=sim, enableResponses=True)
+    device.syncClock()
+    with DeviceBroker(device, path=tmp_path / "cedrus.sock") as broker:
+        clients = [
+            connectBroker(broker.path, StimTrackerDevice, enableResponses=False)
+            for i in range(2)
+        ]
+        groups = [
+            StimTrackerLightSensorGroup(pad=client, channels=2, enableResponses=False)
+            for client in clients
+        ]
+        assert broker.clients == 2
+        assert all(client.clockSync.isFitted for client in clients)
+        # responses should be published to both clients
+        sim.addResponse(port=b"B", key=3)
+        for group in groups:
+            resp = group.waitForResponse(timeout=2)
+            assert resp is not None and resp.channel == 1
+        # ...while staying buffered for the owning process to dispatch on its own thread, with
+        # none lost to commands or clock syncs in the meantime
+        ownSensors = StimTrackerLightSensorGroup(pad=device, channels=2)
+        sim.addBurst(20, port=b"A", key=3, interval=1)
+        for i in range(5):
+            device.syncClock(samples=2)
+            ownSensors.setThreshold(0.5, channel=0)
+        start = time.perf_counter()
+        while len(groups[0].responses) < 21 and time.perf_counter() - start < 2:
+            groups[0].dispatchMessages()
+            time.sleep(0.01)
+        assert len(groups[0].responses) == 21
+        assert len(ownSensors.responses) + len(device._responseBuffer) == 21
+        device.dispatchMessages()
+        assert len(ownSensors.responses) == 21
+        # commands should be passed through
+        groups[0].setThreshold(0.25, channel=0)
+        assert sim.thresholds["A"] == 75
+    assert not broker.path.exists()
+
+
+def test_shared_responses():
+    """
+    Responses should be written to shared memory for readers with their own cursors, with
+    readers which fall too far behind skipping what they missed.
+    """
+    from psychopy_cedrus.sharedring import SharedResponseReader
+    sim = simulator.SimulatedXidDevice(productId=b"S")
+    device = StimTrackerDevice(xid=sim, enableResponses=True)
+    ring = device.shareResponses(capacity=8)
+    readers = [SharedResponseReader(ring.name) for i in range(2)]
+    for i in range(5):
+        sim.addResponse(port=b"A", key=3, pressed=i % 2 == 0, deviceTime=i * 10)
+    drain(device)
+    records = readers[0].read()
+    assert list(records['time']) == [0, 10, 20, 30, 40]
+    assert list(records['pressed']) == [True, False, True, False, True]
+    assert (records['port'] == ord("A")).all() and (records['hostTime'] > 0).all()
+    assert len(readers[0].read()) == 0
+    # second reader falls behind
+    for i in range(5, 12):
+        sim.addResponse(port=b"A", key=3, deviceTime=i * 10)
+    drain(device)
+    records = readers[1].read()
+    assert list(records['time']) == list(range(40, 120, 10))
+    assert readers[1].dropped == 4
+    assert list(readers[0].read(maxRecords=3)['time']) == [50, 60, 70]
+    del records
+    for reader in readers:
+        reader.close()
+    device.stopSharingResponses()
+
+
+def test_child_process():
+    """
+    A device opened in a child process should deliver responses through dispatchMessages and pass
+    commands through to the device.
+    """
+    from psychopy import core
+    sim = simulator.SimulatedXidDevice(productId=b"S", seed=0)
+    sim.setEventRate(200, port=b"A", keys=(3,))
+    device = StimTrackerDevice.openInChildProcess(xid=sim, syncInterval=None)
+    try:
+        lightsensors = StimTrackerLightSensorGroup(pad=device, channels=1)
+        assert device.childProcess.is_alive()
+        # responses decoded in the child should reach the node
+        assert lightsensors.waitForResponse(timeout=5) is not None
+        # a confirmed threshold write shows commands and replies both pass through
+        lightsensors.setThreshold(0.25, channel=0)
+        # responses should keep the time the child received them, however late they're read here
+        device.stopReader()
+        device.dispatchMessages()
+        nBefore = len(device.messages)
+        time.sleep(0.3)
+        device.dispatchMessages()
+        hostTimes = device.messages.records['hostTime'][nBefore:]
+        assert len(hostTimes) and hostTimes.min() < core.getTime() - 0.2
+    finally:
+        device.xid.close()
+    device.childProcess.join(5)
+    assert not device.childProcess.is_alive()